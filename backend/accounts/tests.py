@@ -1,3 +1,81 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from .throttling import get_client_ident, login_ip_limiter, login_username_limiter
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('alice', password='correct-password')
+
+    def setUp(self):
+        cache.clear()
+        for limiter in (login_ip_limiter, login_username_limiter):
+            limiter._entries.clear()
+
+    def login(self, password, username='alice'):
+        return self.client.post('/api/auth/login/', {'username': username, 'password': password}, content_type='application/json')
+
+    def test_failed_attempts_lock_the_username_with_retry_after(self):
+        for _ in range(login_username_limiter.limit):
+            self.assertEqual(self.login('wrong').status_code, 401)
+        response = self.login('correct-password')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_successful_login_resets_the_username(self):
+        for _ in range(login_username_limiter.limit - 1):
+            self.login('wrong')
+        self.assertEqual(self.login('correct-password').status_code, 200)
+        for _ in range(login_username_limiter.limit - 1):
+            self.assertEqual(self.login('wrong').status_code, 401)
+
+    def test_ip_limit_applies_across_usernames(self):
+        for i in range(login_ip_limiter.limit):
+            self.login('wrong', username=f'user{i}')
+        self.assertEqual(self.login('correct-password').status_code, 429)
+
+    def test_attempt_is_counted_before_the_password_is_checked(self):
+        # A parallel guess arriving while this one hashes already sees it counted
+        counted = []
+
+        def authenticate(request, username, password):
+            counted.append(login_username_limiter._local_counts('alice', int(time.time() // login_username_limiter.window))[0])
+
+        with mock.patch('accounts.views.authenticate', side_effect=authenticate):
+            self.login('wrong')
+        self.assertEqual(counted, [1])
+
+    def test_username_lock_does_not_use_up_the_ip_limit(self):
+        for _ in range(login_username_limiter.limit):
+            self.login('wrong')
+        for _ in range(login_ip_limiter.limit - login_username_limiter.limit):
+            self.assertEqual(self.login('wrong').status_code, 429)
+        self.assertEqual(self.login('wrong', username='bob').status_code, 401)
+
+    def test_forwarded_for_header_is_ignored_without_proxies(self):
+        for i in range(login_ip_limiter.limit):
+            self.client.post(
+                '/api/auth/login/', {'username': f'user{i}', 'password': 'x'},
+                content_type='application/json', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}',
+            )
+        self.assertEqual(self.login('correct-password').status_code, 429)
+
+
+class ClientIdentTests(SimpleTestCase):
+    def request(self):
+        return RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4, 192.168.0.9')
+
+    def test_remote_addr_by_default(self):
+        self.assertEqual(get_client_ident(self.request()), '10.0.0.1')
+
+    def test_forwarded_address_written_by_a_trusted_proxy(self):
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            self.assertEqual(get_client_ident(self.request()), '192.168.0.9')
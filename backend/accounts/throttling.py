@@ -0,0 +1,35 @@
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from core.ratelimit import SlidingWindowCounter
+
+# All login attempts from one client address
+login_ip_limiter = SlidingWindowCounter(
+    'login-ip',
+    limit=settings.LOGIN_THROTTLE_IP_LIMIT,
+    window=settings.LOGIN_THROTTLE_WINDOW,
+)
+
+# Login attempts against one username, counted before the password is
+# checked (reset on success)
+login_username_limiter = SlidingWindowCounter(
+    'login-username',
+    limit=settings.LOGIN_THROTTLE_USERNAME_LIMIT,
+    window=settings.LOGIN_THROTTLE_WINDOW,
+)
+
+
+def get_client_ident(request):
+    """
+    Client address for the login limits. REMOTE_ADDR unless NUM_PROXIES is
+    configured: X-Forwarded-For is only trusted as far as that many proxies
+    wrote it (DRF's throttle logic), never as the client sent it.
+    """
+    if not api_settings.NUM_PROXIES:
+        return request.META.get('REMOTE_ADDR')
+    return BaseThrottle().get_ident(request)
+
+
+def normalize_username(username):
+    return str(username).strip().lower()
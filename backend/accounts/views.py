@@ -6,11 +6,25 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
+from .throttling import (
+    login_ip_limiter,
+    login_username_limiter,
+    get_client_ident,
+    normalize_username
+)
 
 class LoginView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
+        # Throttle before any password hashing so a flood stays cheap. Attempts
+        # are counted before they are checked, so parallel guesses cannot all
+        # slip in while the hashes run.
+        client_ident = get_client_ident(request)
+        retry_after = login_ip_limiter.consume(client_ident)
+        if retry_after:
+            return self.throttled_response(retry_after)
+
         username = request.data.get('username')
         password = request.data.get('password')
 
@@ -20,8 +34,15 @@ class LoginView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        username_key = normalize_username(username)
+        retry_after = login_username_limiter.consume(username_key)
+        if retry_after:
+            login_ip_limiter.release(client_ident)
+            return self.throttled_response(retry_after)
+
         user = authenticate(request, username=username, password=password)
         if user is not None:
+            login_username_limiter.reset(username_key)
             login(request, user)
             return Response({
                 'id': user.id,
@@ -36,6 +57,13 @@ class LoginView(APIView):
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
+    def throttled_response(self, retry_after):
+        return Response(
+            {'error': 'Too many login attempts. Please try again later.'},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={'Retry-After': str(retry_after)}
+        )
+
 
 class LogoutView(APIView):
     def post(self, request):
@@ -43,6 +71,16 @@ class LogoutView(APIView):
         return Response({'message': 'Logged out successfully'}, status=status.HTTP_200_OK)
 
 
+def user_context(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+    }
+
+
 @method_decorator(ensure_csrf_cookie, name='dispatch')
 class UserDetailView(APIView):
     """
@@ -51,12 +89,6 @@ class UserDetailView(APIView):
     """
     def get(self, request):
         if request.user.is_authenticated:
-            return Response({
-                'id': request.user.id,
-                'username': request.user.username,
-                'first_name': request.user.first_name,
-                'is_staff': request.user.is_staff,
-                'is_superuser': request.user.is_superuser,
-            })
+            return Response(user_context(request.user))
         else:
             return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
@@ -12,5 +12,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+os.environ.setdefault('DJANGO_SERVER_INTERFACE', 'asgi')
 
 application = get_asgi_application()
+
+# Fill the connection pools before the first request (DB_POOL_WARM_UP)
+from core.db_pool import install_warm_up  # noqa: E402
+install_warm_up()
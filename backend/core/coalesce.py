@@ -0,0 +1,99 @@
+"""
+Request coalescing ("single flight") for slow outbound calls.
+
+Concurrent callers asking for the same key share one call: threads in
+this process wait on the leader's result, and other processes see a lock
+in the Django cache and wait for the leader to publish the result there.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_missing = object()
+
+
+def coalesce(key, compute, result_ttl, lock_ttl=30, wait_timeout=30, poll_interval=0.1, cacheable=None):
+    """
+    Returns the cached result for `key`, or calls `compute()` once for all
+    concurrent callers. Results are cached for `result_ttl` seconds when
+    `cacheable(result)` is true (default: always). If the leader in another
+    process has not published a result within `wait_timeout`, or fails, the
+    waiter computes the result itself.
+    """
+    result_key = f'coalesce:{key}:result'
+    found, result = _cache_get(result_key)
+    if found:
+        return result
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _in_flight[key] = future
+    if not leader:
+        return future.result()
+
+    try:
+        result = _compute_once(key, result_key, compute, result_ttl, lock_ttl, wait_timeout, poll_interval, cacheable)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+
+def _compute_once(key, result_key, compute, result_ttl, lock_ttl, wait_timeout, poll_interval, cacheable):
+    lock_key = f'coalesce:{key}:lock'
+    try:
+        acquired = cache.add(lock_key, 1, timeout=lock_ttl)
+    except Exception as e:
+        logger.warning("Coalescing lock unavailable for %s: %s", key, e)
+        return compute()
+
+    if not acquired:
+        # Another process is calling: wait for it to publish the result
+        deadline = time.monotonic() + wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            found, result = _cache_get(result_key)
+            if found:
+                return result
+            if cache.get(lock_key) is None:
+                break  # the leader gave up without a cacheable result
+        return compute()
+
+    try:
+        result = compute()
+        if cacheable is None or cacheable(result):
+            try:
+                cache.set(result_key, result, timeout=result_ttl)
+            except Exception as e:
+                logger.warning("Coalescing cache unavailable for %s: %s", key, e)
+        return result
+    finally:
+        try:
+            cache.delete(lock_key)
+        except Exception as e:
+            logger.warning("Coalescing lock unavailable for %s: %s", key, e)
+
+
+def _cache_get(key):
+    try:
+        value = cache.get(key, _missing)
+    except Exception as e:
+        logger.warning("Coalescing cache unavailable for %s: %s", key, e)
+        return False, None
+    if value is _missing:
+        return False, None
+    return True, value
@@ -0,0 +1,60 @@
+"""
+Database connection warm-up and pool metrics (see DB_POOL_MODE in settings).
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def install_warm_up():
+    """
+    Arranges for warm_up_connections() to run once per worker process as
+    DB_POOL_WARM_UP says: now ('import', the application is being loaded
+    in the worker itself) or in each child right after a fork ('fork', the
+    application was preloaded in a master that must not own pool threads
+    or connections).
+    """
+    if settings.DB_POOL_WARM_UP == 'import':
+        warm_up_connections()
+    elif settings.DB_POOL_WARM_UP == 'fork':
+        os.register_at_fork(after_in_child=warm_up_connections)
+
+
+def warm_up_connections(timeout=10):
+    """
+    Fills the connection pools when a worker starts instead of on its
+    first request, waiting until every pool holds min_size connections.
+    Call it after the worker process has forked. Persistent connections
+    are per thread, so opening one here would not help the request
+    threads; only pools are warmed.
+    """
+    for alias in connections:
+        connection = connections[alias]
+        try:
+            pool = getattr(connection, 'pool', None)
+            if pool is not None:
+                pool.open(wait=True, timeout=timeout)
+        except Exception as e:
+            # The first request will retry; a slow database must not stop the worker booting
+            logger.warning("Database warm-up failed for %s: %s", alias, e)
+
+
+def pool_stats():
+    """Per-alias connection statistics for monitoring."""
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            stats[alias] = {'mode': 'pool', **pool.get_stats()}
+        else:
+            stats[alias] = {
+                'mode': settings.DB_POOL_MODE,
+                'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE', 0),
+                'connected': connection.connection is not None,
+            }
+    return stats
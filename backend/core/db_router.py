@@ -0,0 +1,62 @@
+"""
+Primary/replica database routing.
+
+Reads only go to a replica inside requests that ReplicaRoutingMiddleware
+marked as replica-safe (safe methods on views with replica_reads = True). Everything else (writes, webhooks, management
+commands, background jobs) uses the primary, and once a request has
+written anything its remaining reads go to the primary as well.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_use_replica = ContextVar('use_replica', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+
+def start_request(use_replica, pinned=False):
+    """Sets the routing mode for the current request; returns tokens for end_request()."""
+    return _use_replica.set(use_replica), _wrote.set(False), _pinned.set(pinned)
+
+
+def end_request(tokens):
+    use_replica_token, wrote_token, pinned_token = tokens
+    _use_replica.reset(use_replica_token)
+    _wrote.reset(wrote_token)
+    _pinned.reset(pinned_token)
+
+
+def read_from_replica():
+    """Sends the rest of this request's reads to a replica, until it writes."""
+    _use_replica.set(True)
+
+
+def wrote_to_primary():
+    return _wrote.get()
+
+
+def reads_pinned():
+    """True once this request, or recently this client, wrote: it must see its own writes."""
+    return _pinned.get() or _wrote.get()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        # Read-your-writes: the rest of this request reads from the primary
+        _use_replica.set(False)
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,172 @@
+"""
+Structured, non-blocking logging.
+
+log_event() checks the level before doing anything, and passes the event
+fields along unformatted. They are rendered (with a size limit per value)
+by StructuredFormatter on the QueuedStreamHandler listener thread, so a
+request only pays for putting a record on a queue.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+
+def log_event(logger, level, event, **fields):
+    """
+    Logs `event` with structured `fields` (e.g. payload=dict) if `level`
+    is enabled. Nothing is formatted on the calling thread.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields}, stacklevel=2)
+
+
+def render_bounded(value, limit):
+    """
+    Compact JSON-like rendering of `value` that stops after about `limit`
+    characters, without serializing the rest of a large payload.
+    """
+    parts = []
+    budget = [limit]
+
+    def emit(text):
+        if budget[0] <= 0:
+            return False
+        if len(text) > budget[0]:
+            text = text[:budget[0]]
+        parts.append(text)
+        budget[0] -= len(text)
+        return budget[0] > 0
+
+    def walk(item):
+        if isinstance(item, dict):
+            if not emit('{'):
+                return False
+            for i, (key, child) in enumerate(item.items()):
+                if (i and not emit(',')) or not emit(json.dumps(str(key)) + ':') or not walk(child):
+                    return False
+            return emit('}')
+        if isinstance(item, (list, tuple)):
+            if not emit('['):
+                return False
+            for i, child in enumerate(item):
+                if (i and not emit(',')) or not walk(child):
+                    return False
+            return emit(']')
+        if isinstance(item, (str, int, float, bool)) or item is None:
+            return emit(json.dumps(item))
+        return emit(json.dumps(str(item)))
+
+    if isinstance(value, str):
+        text = value if len(value) <= limit else value[:limit]
+        return text + ('...' if len(value) > limit else '')
+    if not walk(value):
+        parts.append('...')
+    return ''.join(parts)
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Appends `key=value` pairs for the fields passed to log_event(). Each
+    value is rendered to at most LOG_MAX_VALUE_LENGTH characters.
+    """
+
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if not fields:
+            return message
+        limit = settings.LOG_MAX_VALUE_LENGTH
+        return message + ' ' + ' '.join(
+            f'{key}={render_bounded(value, limit)}' for key, value in fields.items()
+        )
+
+
+class QueuedStreamHandler(QueueHandler):
+    """
+    Hands records to a background thread that formats and writes them to
+    a StreamHandler (stderr). The queue is bounded; when it is full new
+    records are dropped rather than blocking the request, and the number
+    dropped is logged as a warning once the queue has room again (or when
+    the handler stops).
+
+    The listener thread is started by the first record each process logs,
+    so a pre-fork server master that configured logging does not leave its
+    workers with a queue nobody reads.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self.reported_drops = 0
+        self.listener = None
+        self.pid = None
+        atexit.register(self.stop)
+
+    def _ensure_listener(self):
+        # Called with the handler lock held (Handler.handle), which logging
+        # re-creates in a forked child
+        if self.pid == os.getpid():
+            return
+        # First record in this process: a forked child gets a fresh queue
+        # (the parent's pending records are the parent's to write)
+        if self.pid is not None:
+            self.queue = queue.Queue(self.maxsize)
+            self.dropped = self.reported_drops = 0
+        self.pid = os.getpid()
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+        self.listener.start()
+
+    def stop(self):
+        """Flushes queued records, reports drops and stops the listener thread (idempotent)."""
+        if self.listener is not None and self.pid == os.getpid() and self.listener._thread is not None:
+            self.listener.stop()
+        pending = self.dropped - self.reported_drops
+        if pending:
+            self.target.handle(self._drops_record(pending))
+            self.reported_drops += pending
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Keep msg/args/fields as they are so the listener formats them.
+        # Tracebacks are rendered now, while the frames still exist.
+        if record.exc_info:
+            record = copy.copy(record)
+            formatter = self.target.formatter or logging.Formatter()
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        pending = self.dropped - self.reported_drops
+        if pending:
+            try:
+                self.queue.put_nowait(self._drops_record(pending))
+            except queue.Full:
+                return  # reported with a later record that fits
+            self.reported_drops += pending
+
+    def _drops_record(self, count):
+        return logging.makeLogRecord({
+            'name': __name__,
+            'levelno': logging.WARNING,
+            'levelname': 'WARNING',
+            'msg': '%s log records dropped: the logging queue was full',
+            'args': (count,),
+        })
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import db_router
+from .profiling import profile_request
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets safe requests to views that opt in (replica_reads = True on the view
+    class or function) read from a replica. Everything else, including the
+    admin and GET views that write, reads from the primary. After a request
+    writes to the primary, the client gets a short-lived cookie that pins
+    its reads to the primary for REPLICA_PIN_SECONDS, so it never sees its
+    own write missing from a lagging replica.
+    """
+    cookie_name = 'db_primary_pin'
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tokens = db_router.start_request(False, self.cookie_name in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if db_router.wrote_to_primary():
+                response.set_cookie(
+                    self.cookie_name, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    domain=settings.SESSION_COOKIE_DOMAIN,
+                    secure=settings.SESSION_COOKIE_SECURE,
+                    httponly=True,
+                    samesite=settings.SESSION_COOKIE_SAMESITE,
+                )
+        finally:
+            db_router.end_request(tokens)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if request.method in SAFE_METHODS and getattr(view, 'replica_reads', False) and not db_router.reads_pinned():
+            db_router.read_from_replica()
+
+
+class RequestProfilingMiddleware:
+    """
+    Profiles a single request on demand, for staff users only.
+
+    Triggered by an `X-Profile` header or a `__profile` query parameter
+    whose value is a comma-separated list of options:
+        cprofile  deterministic profile (default)
+        sample    sampling profiler producing collapsed stacks
+        inline    return the profile as JSON instead of the normal response
+    Without `inline` the profile is written to REQUEST_PROFILING_DIR and its
+    id is returned in the X-Profile-Id response header. Executed SQL (without
+    parameters) and timings are always included.
+
+    Requests without the trigger only pay for one header and one query
+    string lookup; with REQUEST_PROFILING_ENABLED off the middleware is removed.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        meta = request.META
+        if 'HTTP_X_PROFILE' not in meta and '__profile' not in meta.get('QUERY_STRING', ''):
+            return self.get_response(request)
+
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_staff:
+            return self.get_response(request)
+
+        options = meta.get('HTTP_X_PROFILE') or request.GET.get('__profile', '')
+        options = {option.strip().lower() for option in options.split(',') if option.strip()}
+        return profile_request(request, self.get_response, options)
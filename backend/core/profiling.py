@@ -0,0 +1,143 @@
+"""
+Per-request profiling used by RequestProfilingMiddleware.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.utils import timezone
+
+
+class SQLRecorder:
+    """execute_wrapper that records statements and timings (parameters are left out)."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': self.alias,
+                'sql': sql,
+                'many': many,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of one thread every `interval` seconds and counts
+    identical stacks, giving flame-graph ready collapsed output.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.counts.most_common())
+
+
+def profile_request(request, get_response, options):
+    sample = 'sample' in options
+    recorders = [SQLRecorder(alias) for alias in connections]
+
+    with ExitStack() as stack:
+        for recorder in recorders:
+            stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+
+        if sample:
+            profiler = StackSampler(threading.get_ident(), settings.REQUEST_PROFILING_INTERVAL)
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            response = get_response(request)
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            if sample:
+                profiler.stop()
+            else:
+                profiler.disable()
+
+    queries = [query for recorder in recorders for query in recorder.queries]
+    result = {
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status_code': response.status_code,
+        'duration_ms': duration_ms,
+        'sql_count': len(queries),
+        'sql_duration_ms': round(sum(query['duration_ms'] for query in queries), 3),
+        'sql': queries,
+    }
+    if sample:
+        result['collapsed'] = profiler.collapsed()
+    else:
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(60)
+        result['stats'] = output.getvalue()
+
+    if 'inline' in options:
+        return JsonResponse(result)
+
+    profile_id = write_profile(request, result, None if sample else profiler)
+    response['X-Profile-Id'] = profile_id
+    return response
+
+
+def write_profile(request, result, profiler=None):
+    """
+    Writes <id>.json (summary and SQL), plus <id>.collapsed or <id>.prof
+    (load with pstats/snakeviz) to REQUEST_PROFILING_DIR. Returns the id.
+    """
+    directory = settings.REQUEST_PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-')[:60] or 'root'
+    profile_id = f"{timezone.now():%Y%m%dT%H%M%S%f}-{request.method.lower()}-{slug}"
+    base = os.path.join(directory, profile_id)
+
+    with open(f'{base}.json', 'w') as f:
+        json.dump(result, f, indent=2)
+    if 'collapsed' in result:
+        with open(f'{base}.collapsed', 'w') as f:
+            f.write(result['collapsed'])
+    if profiler is not None:
+        profiler.dump_stats(f'{base}.prof')
+    return profile_id
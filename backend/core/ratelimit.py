@@ -0,0 +1,387 @@
+"""
+Compact in-memory rate limiting primitives.
+
+Counters live in process memory and are mirrored to the Django cache so
+every worker sharing that cache sees the same totals (and the same
+resets). If the cache is unreachable the local counts are used on their
+own.
+
+TokenBucket limits outbound calls instead: callers wait for their turn
+rather than being refused, and the bucket is shared through Redis when
+it is configured.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindowCounter:
+    """
+    Approximate sliding-window counter.
+
+    Each key only stores the counts of the current and previous fixed
+    windows; the sliding estimate weights the previous window by how much
+    of it still overlaps the last `window` seconds. Memory is bounded by
+    `max_keys` (least recently used keys are evicted first).
+    """
+
+    def __init__(self, name, limit, window, max_keys=10000, shared=True):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.shared = shared
+        self._entries = OrderedDict()  # key -> [window_index, current, previous]
+        self._lock = threading.Lock()
+
+    def check(self, key, now=None):
+        """
+        Returns 0 if another event for `key` is allowed, otherwise the
+        number of seconds to wait before retrying. Does not count the event.
+        """
+        if self.limit <= 0:
+            return 0
+
+        now = time.time() if now is None else now
+        window_index, elapsed = divmod(now, self.window)
+        window_index = int(window_index)
+
+        current, previous = self._local_counts(key, window_index)
+        if not self.shared:
+            return self._retry_after(current, previous, elapsed)
+
+        # The shared counts include every worker's events and are cleared by
+        # reset() in any worker, so they win whenever the store answers.
+        counts = self._shared_counts(key, window_index)
+        if counts is None:
+            return self._retry_after(current, previous, elapsed)
+        if counts != (current, previous):
+            self._store_local_counts(key, window_index, *counts)
+        return self._retry_after(counts[0], counts[1], elapsed)
+
+    def consume(self, key, now=None):
+        """
+        Counts one event for `key` and returns 0 if it is allowed; otherwise
+        returns the number of seconds to wait and leaves the count as it
+        was. The shared count is incremented first (atomically) and then
+        compared with the limit, so parallel requests cannot all pass a
+        check made before any of them was counted.
+        """
+        if self.limit <= 0:
+            return 0
+
+        now = time.time() if now is None else now
+        window_index, elapsed = divmod(now, self.window)
+        window_index = int(window_index)
+
+        if self.shared:
+            cache_key = self._cache_key(key, window_index)
+            try:
+                cache.add(cache_key, 0, timeout=self.window * 2)
+                current = cache.incr(cache_key)
+                previous = cache.get(self._cache_key(key, window_index - 1), 0)
+            except Exception as e:
+                logger.warning("Rate limit store unavailable for %s: %s", self.name, e)
+            else:
+                # Allowed if the count before this event was still under the limit
+                retry_after = self._retry_after(current - 1, previous, elapsed)
+                if retry_after:
+                    current = self._decrement_shared(cache_key, current)
+                self._store_local_counts(key, window_index, current, previous)
+                return retry_after
+
+        with self._lock:
+            entry = self._entry(key, window_index)
+            retry_after = self._retry_after(entry[1], entry[2], elapsed)
+            if not retry_after:
+                entry[1] += 1
+        return retry_after
+
+    def release(self, key, now=None):
+        """Takes back one event counted by consume() (e.g. when another limit refused the request)."""
+        if self.limit <= 0:
+            return
+
+        now = time.time() if now is None else now
+        window_index = int(now // self.window)
+
+        with self._lock:
+            entry = self._entry(key, window_index)
+            entry[1] = max(0, entry[1] - 1)
+
+        if self.shared:
+            self._decrement_shared(self._cache_key(key, window_index), None)
+
+    def hit(self, key, now=None):
+        """Counts one event for `key`."""
+        now = time.time() if now is None else now
+        window_index = int(now // self.window)
+
+        with self._lock:
+            entry = self._entry(key, window_index)
+            entry[1] += 1
+
+        if self.shared:
+            cache_key = self._cache_key(key, window_index)
+            try:
+                cache.add(cache_key, 0, timeout=self.window * 2)
+                cache.incr(cache_key)
+            except Exception as e:
+                logger.warning("Rate limit store unavailable for %s: %s", self.name, e)
+
+    def reset(self, key):
+        """Forgets all events recorded for `key`."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+        if self.shared:
+            window_index = int(time.time() // self.window)
+            try:
+                cache.delete_many([
+                    self._cache_key(key, window_index),
+                    self._cache_key(key, window_index - 1),
+                ])
+            except Exception as e:
+                logger.warning("Rate limit store unavailable for %s: %s", self.name, e)
+
+    def _entry(self, key, window_index):
+        # Caller must hold self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = [window_index, 0, 0]
+            self._entries[key] = entry
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+            if entry[0] != window_index:
+                entry[2] = entry[1] if entry[0] == window_index - 1 else 0
+                entry[1] = 0
+                entry[0] = window_index
+        return entry
+
+    def _local_counts(self, key, window_index):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return 0, 0
+            entry = self._entry(key, window_index)
+            return entry[1], entry[2]
+
+    def _store_local_counts(self, key, window_index, current, previous):
+        with self._lock:
+            entry = self._entry(key, window_index)
+            entry[1], entry[2] = current, previous
+
+    def _decrement_shared(self, cache_key, current):
+        try:
+            return cache.decr(cache_key)
+        except ValueError:
+            return 0  # expired in the meantime
+        except Exception as e:
+            logger.warning("Rate limit store unavailable for %s: %s", self.name, e)
+            return current
+
+    def _shared_counts(self, key, window_index):
+        current_key = self._cache_key(key, window_index)
+        previous_key = self._cache_key(key, window_index - 1)
+        try:
+            values = cache.get_many([current_key, previous_key])
+        except Exception as e:
+            logger.warning("Rate limit store unavailable for %s: %s", self.name, e)
+            return None
+        return values.get(current_key, 0), values.get(previous_key, 0)
+
+    def _retry_after(self, current, previous, elapsed):
+        weight = (self.window - elapsed) / self.window
+        if previous * weight + current < self.limit:
+            return 0
+
+        if current >= self.limit:
+            # Only the next window can bring the count back under the limit.
+            wait = self.window - elapsed
+        else:
+            # Wait until enough of the previous window has slid out.
+            wait = self.window * (1 - (self.limit - current) / previous) - elapsed
+        return max(1, math.ceil(wait))
+
+    def _cache_key(self, key, window_index):
+        digest = hashlib.sha1(str(key).encode()).hexdigest()
+        return f'ratelimit:{self.name}:{digest}:{window_index}'
+
+
+class RateLimitExceeded(Exception):
+    """Raised by TokenBucket.acquire() when the wait would exceed max_wait."""
+
+
+class LocalBucketStore:
+    """
+    Per-process bucket state. Stand-in for RedisBucketStore when no shared
+    cache is configured (each process then gets the full rate to itself).
+    """
+
+    def __init__(self):
+        self._tats = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, name, interval, tolerance, max_wait):
+        now = time.time()
+        with self._lock:
+            tat = max(self._tats.get(name, now), now)
+            wait = tat - tolerance - now
+            if wait > max_wait:
+                return None
+            self._tats[name] = tat + interval
+        return max(0.0, wait)
+
+    def theoretical_arrival(self, name):
+        return self._tats.get(name)
+
+
+class RedisBucketStore:
+    """
+    Bucket state kept in Redis and updated by a Lua script, so the
+    reservation is atomic across every process and uses the Redis clock.
+    """
+
+    # GCRA: the bucket is a single "theoretical arrival time" (microseconds).
+    SCRIPT = """
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) * 1000000 + tonumber(t[2])
+        local interval = tonumber(ARGV[1])
+        local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+        if tat < now then tat = now end
+        local wait = tat - tonumber(ARGV[2]) - now
+        if wait > tonumber(ARGV[3]) then return -1 end
+        local new_tat = tat + interval
+        redis.call('SET', KEYS[1], string.format('%d', new_tat), 'PX', math.ceil((new_tat - now) / 1000) + 1000)
+        if wait < 0 then return 0 end
+        return wait
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._script = client.register_script(self.SCRIPT)
+
+    def reserve(self, name, interval, tolerance, max_wait):
+        wait = self._script(
+            keys=[self._key(name)],
+            args=[int(interval * 1e6), int(tolerance * 1e6), int(max_wait * 1e6)],
+        )
+        return None if wait < 0 else wait / 1e6
+
+    def theoretical_arrival(self, name):
+        value = self.client.get(self._key(name))
+        return int(value) / 1e6 if value is not None else None
+
+    def _key(self, name):
+        return cache.make_key(f'tokenbucket:{name}')
+
+
+_local_store = LocalBucketStore()
+_redis_store = None
+
+
+def get_bucket_store():
+    """Redis when the default cache is Redis, otherwise the local stand-in."""
+    global _redis_store
+    if not settings.REDIS_URL:
+        return _local_store
+    if _redis_store is None:
+        _redis_store = RedisBucketStore(cache._cache.get_client(write=True))
+    return _redis_store
+
+
+# name -> TokenBucket, for reporting
+token_buckets = {}
+
+
+class TokenBucket:
+    """
+    Token bucket for outbound calls: `rate` calls per second on average,
+    with bursts of up to `capacity`. acquire() waits for a free slot instead
+    of failing, so concurrent callers are spaced out in arrival order; it
+    only raises RateLimitExceeded when the queue is longer than `max_wait`
+    seconds. If the shared store is unreachable the local store is used.
+    """
+
+    def __init__(self, name, rate, capacity=1, max_wait=10):
+        self.name = name
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.max_wait = max_wait
+        self._stats_lock = threading.Lock()
+        self._granted = 0
+        self._rejected = 0
+        self._waited = 0.0
+        token_buckets[name] = self
+
+    @property
+    def interval(self):
+        return 1 / self.rate
+
+    def acquire(self, max_wait=None):
+        """
+        Blocks until a token is available. Returns the seconds waited.
+        A rate of 0 or less disables the bucket.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        max_wait = self.max_wait if max_wait is None else max_wait
+        tolerance = (self.capacity - 1) * self.interval
+        try:
+            wait = get_bucket_store().reserve(self.name, self.interval, tolerance, max_wait)
+        except Exception as e:
+            logger.warning("Token bucket store unavailable for %s: %s", self.name, e)
+            wait = _local_store.reserve(self.name, self.interval, tolerance, max_wait)
+
+        with self._stats_lock:
+            if wait is None:
+                self._rejected += 1
+            else:
+                self._granted += 1
+                self._waited += wait
+        if wait is None:
+            raise RateLimitExceeded(f"{self.name}: rate limit queue is longer than {max_wait}s")
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def usage(self):
+        """
+        Current state of the (shared) bucket plus this process's counters.
+        `utilisation` is the share of the burst capacity currently in use;
+        `backlog_seconds` is how long a new caller would have to wait.
+        """
+        try:
+            tat = get_bucket_store().theoretical_arrival(self.name)
+        except Exception as e:
+            logger.warning("Token bucket store unavailable for %s: %s", self.name, e)
+            tat = _local_store.theoretical_arrival(self.name)
+
+        now = time.time()
+        ahead = max(0.0, (tat or now) - now)  # seconds of reserved calls not yet "refilled"
+        tolerance = (self.capacity - 1) * self.interval
+        in_use = min(self.capacity, ahead / self.interval) if self.rate > 0 else 0
+        with self._stats_lock:
+            granted, rejected, waited = self._granted, self._rejected, self._waited
+        return {
+            'rate': self.rate,
+            'capacity': self.capacity,
+            'available': max(0, self.capacity - math.ceil(in_use)),
+            'utilisation': round(in_use / self.capacity, 3),
+            'backlog_seconds': round(max(0.0, ahead - tolerance), 3),
+            'granted': granted,
+            'rejected': rejected,
+            'average_wait': round(waited / granted, 3) if granted else 0.0,
+        }
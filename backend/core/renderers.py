@@ -0,0 +1,66 @@
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+# orjson and the stdlib format some floats differently (0.00001 vs 1e-05),
+# and the stdlib rejects NaN/Infinity in strict mode; DRF's encoder turns
+# Decimal into float
+_FLOAT_TYPES = (float, Decimal)
+
+
+class _NeedsStdlib(Exception):
+    pass
+
+
+def _contains_float(value):
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, _FLOAT_TYPES):
+            return True
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer that encodes with orjson when it is installed.
+
+    Output is byte-identical to DRF's compact renderer: anything orjson
+    cannot encode natively (Decimal, datetime, lazy strings, ...) goes
+    through DRF's own encoder, and payloads the two libraries would format
+    differently (indented output, any float or Decimal value, non-string
+    keys) are rendered by the stdlib path instead, which also rejects
+    non-finite floats as DRF does.
+    """
+    _drf_default = JSONRenderer.encoder_class().default
+
+    def _default(self, obj):
+        value = self._drf_default(obj)
+        if _contains_float(value):
+            raise _NeedsStdlib  # orjson re-raises it as a TypeError
+        return value
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if _contains_float(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self._default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same JavaScript-safe escaping as JSONRenderer
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
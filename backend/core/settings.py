@@ -6,6 +6,7 @@ Generated by 'django-admin startproject' using Django 5.x.
 from pathlib import Path
 import os
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -26,6 +27,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Third-party
     'rest_framework',
@@ -34,16 +36,19 @@ INSTALLED_APPS = [
     # Local apps
     'accounts',
     'transactions',
+    'jobs',
 ]
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.RequestProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,6 +85,60 @@ DATABASES = {
     }
 }
 
+# Connection handling:
+#   none        new connection per request (Django default)
+#   persistent  reuse each thread's connection for DB_CONN_MAX_AGE seconds (WSGI)
+#   pool        psycopg 3 connection pool shared by all threads (WSGI and ASGI)
+# Persistent connections are not reused across ASGI requests, so core.asgi
+# switches 'persistent' to 'pool'.
+DB_POOL_MODE = config('DB_POOL_MODE', default='none')
+if DB_POOL_MODE == 'persistent' and os.environ.get('DJANGO_SERVER_INTERFACE') == 'asgi':
+    DB_POOL_MODE = 'pool'
+
+if DB_POOL_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=600, cast=int)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_POOL_MODE == 'pool':
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True  # checked when taken from the pool
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),  # seconds to wait for a free connection
+            'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=float),
+            'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=1800, cast=float),
+        }
+    }
+elif DB_POOL_MODE != 'none':
+    raise ValueError(f"Unknown DB_POOL_MODE {DB_POOL_MODE!r}; use none, persistent or pool")
+
+# Filling the pools before the first request (pool mode only), see core.db_pool:
+#   none    on the first request (default)
+#   import  when core.wsgi/core.asgi is imported: servers that import the
+#           application in each worker (gunicorn without --preload, uvicorn)
+#   fork    in each worker right after a preloading master forks it
+#           (gunicorn --preload, uWSGI); the master opens nothing itself
+DB_POOL_WARM_UP = config('DB_POOL_WARM_UP', default='none')
+if DB_POOL_WARM_UP not in ('none', 'import', 'fork'):
+    raise ValueError(f"Unknown DB_POOL_WARM_UP {DB_POOL_WARM_UP!r}; use none, import or fork")
+
+# Read replicas: comma-separated host[:port] list, same credentials as the primary.
+# Each becomes an alias replica_1, replica_2, ... used for replica-safe reads.
+DB_REPLICA_HOSTS = [h.strip() for h in config('DB_REPLICA_HOSTS', default='').split(',') if h.strip()]
+for index, replica_host in enumerate(DB_REPLICA_HOSTS, start=1):
+    host, _, port = replica_host.partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+# How long a client that just wrote keeps reading from the primary
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -109,8 +168,101 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Reverse proxies in front of Django that append the client address to
+    # X-Forwarded-For. 0 (default) trusts only REMOTE_ADDR, since the header
+    # itself is set by the client; set it to the proxy count when deployed
+    # behind a load balancer so the login limits see the real client.
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
 }
 
+# Cache (shared store for rate limit counters and gateway tokens).
+# Falls back to per-process memory when REDIS_URL is not set.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    try:
+        import redis  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured('REDIS_URL is set but the redis package is not installed (see requirements.txt)')
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+# Login throttling (checked before any password hashing)
+LOGIN_THROTTLE_WINDOW = config('LOGIN_THROTTLE_WINDOW', default=300, cast=int)  # seconds
+LOGIN_THROTTLE_IP_LIMIT = config('LOGIN_THROTTLE_IP_LIMIT', default=20, cast=int)
+LOGIN_THROTTLE_USERNAME_LIMIT = config('LOGIN_THROTTLE_USERNAME_LIMIT', default=5, cast=int)
+
+# Payment initiation velocity (checked before any row is created or gateway called; 0 disables a limit)
+PAYMENT_VELOCITY_WINDOW = config('PAYMENT_VELOCITY_WINDOW', default=600, cast=int)  # seconds
+PAYMENT_VELOCITY_CUSTOMER_LIMIT = config('PAYMENT_VELOCITY_CUSTOMER_LIMIT', default=5, cast=int)
+PAYMENT_VELOCITY_INITIATOR_LIMIT = config('PAYMENT_VELOCITY_INITIATOR_LIMIT', default=60, cast=int)
+
+# Admin changelists switch to planner estimates above this many rows
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=50000, cast=int)
+
+# Background jobs (python manage.py process_jobs)
+# When enabled, InitiatePaymentView commits the row, queues the gateway call and answers 202.
+PAYMENT_INITIATION_ASYNC = config('PAYMENT_INITIATION_ASYNC', default=False, cast=bool)
+JOB_WORKER_CONCURRENCY = config('JOB_WORKER_CONCURRENCY', default=4, cast=int)
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', default=1.0, cast=float)  # seconds
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=5, cast=int)
+JOB_RETRY_BASE_DELAY = config('JOB_RETRY_BASE_DELAY', default=5, cast=int)  # seconds
+JOB_RETRY_MAX_DELAY = config('JOB_RETRY_MAX_DELAY', default=600, cast=int)  # seconds
+JOB_LOCK_TIMEOUT = config('JOB_LOCK_TIMEOUT', default=300, cast=int)  # seconds before a RUNNING job is reclaimed
+
+# Backfills (python manage.py backfill): rows per chunk, pause between chunks, share of
+# wall time spent writing (1 = no extra pause), and how long a chunk may wait for a row lock
+BACKFILL_BATCH_SIZE = config('BACKFILL_BATCH_SIZE', default=1000, cast=int)
+BACKFILL_PAUSE = config('BACKFILL_PAUSE', default=0.1, cast=float)  # seconds
+BACKFILL_DUTY_CYCLE = config('BACKFILL_DUTY_CYCLE', default=0.5, cast=float)
+BACKFILL_LOCK_TIMEOUT = config('BACKFILL_LOCK_TIMEOUT', default=2, cast=float)  # seconds
+
+# Dashboard caching (seconds, 0 disables: stats then reflect a payment immediately)
+# and the startup bootstrap endpoint
+DASHBOARD_STATS_CACHE_SECONDS = config('DASHBOARD_STATS_CACHE_SECONDS', default=0, cast=int)
+RECENT_TRANSACTIONS_CACHE_SECONDS = config('RECENT_TRANSACTIONS_CACHE_SECONDS', default=0, cast=int)
+BOOTSTRAP_TRANSACTION_LIMIT = config('BOOTSTRAP_TRANSACTION_LIMIT', default=20, cast=int)
+
+# Poll-again hint returned by the batch status endpoint (seconds)
+STATUS_POLL_MIN_SECONDS = config('STATUS_POLL_MIN_SECONDS', default=3, cast=int)
+STATUS_POLL_MAX_SECONDS = config('STATUS_POLL_MAX_SECONDS', default=30, cast=int)
+
+# Successful Paystack verify responses are reused for this long (seconds)
+PAYSTACK_VERIFY_CACHE_SECONDS = config('PAYSTACK_VERIFY_CACHE_SECONDS', default=10, cast=int)
+
+# Outbound Daraja quotas (calls per second), shared across processes via REDIS_URL.
+# Calls wait up to DARAJA_RATE_MAX_WAIT seconds for a slot before giving up.
+DARAJA_OAUTH_RATE = config('DARAJA_OAUTH_RATE', default=1, cast=float)
+DARAJA_STK_PUSH_RATE = config('DARAJA_STK_PUSH_RATE', default=5, cast=float)
+DARAJA_STK_QUERY_RATE = config('DARAJA_STK_QUERY_RATE', default=5, cast=float)
+DARAJA_REGISTER_URL_RATE = config('DARAJA_REGISTER_URL_RATE', default=1, cast=float)
+DARAJA_RATE_BURST = config('DARAJA_RATE_BURST', default=5, cast=int)
+DARAJA_RATE_MAX_WAIT = config('DARAJA_RATE_MAX_WAIT', default=10, cast=float)  # seconds
+
+# STK Push traffic across the DARAJA_ACCOUNTS credential sets: 'weighted' or 'least_loaded'.
+# An account is skipped for DARAJA_ACCOUNT_COOLDOWN seconds after that many consecutive failures.
+DARAJA_BALANCING = config('DARAJA_BALANCING', default='weighted')
+DARAJA_ACCOUNT_FAILURE_THRESHOLD = config('DARAJA_ACCOUNT_FAILURE_THRESHOLD', default=3, cast=int)
+DARAJA_ACCOUNT_COOLDOWN = config('DARAJA_ACCOUNT_COOLDOWN', default=60, cast=int)
+
+# Change feed holds back changes younger than this so in-flight commits are not skipped (seconds)
+CHANGE_FEED_LAG_SECONDS = config('CHANGE_FEED_LAG_SECONDS', default=5, cast=int)
+
+# Parquet snapshots for analytics (python manage.py export_snapshot)
+ANALYTICS_SNAPSHOT_DIR = config('ANALYTICS_SNAPSHOT_DIR', default=str(BASE_DIR / 'snapshots'))
+
+# On-demand request profiling for staff (X-Profile header or ?__profile=)
+REQUEST_PROFILING_ENABLED = config('REQUEST_PROFILING_ENABLED', default=False, cast=bool)
+REQUEST_PROFILING_DIR = config('REQUEST_PROFILING_DIR', default=str(BASE_DIR / 'profiles'))
+REQUEST_PROFILING_INTERVAL = config('REQUEST_PROFILING_INTERVAL', default=0.005, cast=float)  # sampling period, seconds
+
 # CORS Settings (for React frontend)
 CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='http://localhost:3000').split(',')
 CORS_ALLOW_CREDENTIALS = True
@@ -119,16 +271,28 @@ CSRF_TRUSTED_ORIGINS = config('CSRF_TRUSTED_ORIGINS', default='http://localhost:
 # Custom user model? → Not needed; we use Django's built-in User
 
 # Logging (optional but helpful for webhooks)
+# Records are formatted and written by a background thread (core.logs)
+LOG_LEVEL = config('LOG_LEVEL', default='WARNING')
+LOG_MAX_VALUE_LENGTH = config('LOG_MAX_VALUE_LENGTH', default=512, cast=int)  # chars per structured field
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            '()': 'core.logs.StructuredFormatter',
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'core.logs.QueuedStreamHandler',
+            'formatter': 'structured',
         },
     },
     'root': {
         'handlers': ['console'],
+        'level': LOG_LEVEL,
     },
 }
 
@@ -0,0 +1,622 @@
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from uuid import uuid4
+from unittest import mock
+
+import redis
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from transactions.models import Transaction
+
+from .coalesce import coalesce
+from .db_pool import install_warm_up, warm_up_connections
+from .db_router import PrimaryReplicaRouter
+from .logs import QueuedStreamHandler, render_bounded
+from .middleware import ReplicaRoutingMiddleware
+from .ratelimit import (
+    LocalBucketStore, RateLimitExceeded, RedisBucketStore, SlidingWindowCounter, TokenBucket, token_buckets,
+)
+from .renderers import FastJSONRenderer
+
+
+class SlidingWindowCounterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_allows_up_to_limit_then_reports_retry_after(self):
+        limiter = SlidingWindowCounter('test', limit=3, window=60)
+        for _ in range(3):
+            self.assertEqual(limiter.check('k', now=6000.0), 0)
+            limiter.hit('k', now=6000.0)
+        self.assertEqual(limiter.check('k', now=6000.0), 60)
+        self.assertEqual(limiter.check('other', now=6000.0), 0)
+
+    def test_previous_window_is_weighted_by_overlap(self):
+        limiter = SlidingWindowCounter('test', limit=3, window=60, shared=False)
+        for _ in range(4):
+            limiter.hit('k', now=6030.0)
+        # 15s into the next window three quarters of the old events still count
+        self.assertGreater(limiter.check('k', now=6075.0), 0)
+        # 45s in only a quarter does
+        self.assertEqual(limiter.check('k', now=6105.0), 0)
+        self.assertEqual(limiter.check('k', now=6200.0), 0)
+
+    def test_retry_after_is_when_enough_of_the_previous_window_slid_out(self):
+        limiter = SlidingWindowCounter('test', limit=2, window=60, shared=False)
+        limiter.hit('k', now=6010.0)
+        limiter.hit('k', now=6010.0)
+        retry_after = limiter.check('k', now=6060.0)
+        self.assertEqual(retry_after, 1)
+        self.assertEqual(limiter.check('k', now=6060.0 + retry_after), 0)
+
+    def test_counts_are_shared_between_workers(self):
+        worker_a = SlidingWindowCounter('test', limit=2, window=60)
+        worker_b = SlidingWindowCounter('test', limit=2, window=60)
+        worker_a.hit('k', now=6000.0)
+        worker_b.hit('k', now=6000.0)
+        self.assertGreater(worker_a.check('k', now=6001.0), 0)
+        self.assertGreater(worker_b.check('k', now=6001.0), 0)
+
+    def test_reset_in_one_worker_clears_the_others(self):
+        worker_a = SlidingWindowCounter('test', limit=2, window=60)
+        worker_b = SlidingWindowCounter('test', limit=2, window=60)
+        worker_b.hit('k', now=6000.0)
+        worker_b.hit('k', now=6000.0)
+        self.assertGreater(worker_b.check('k', now=6000.0), 0)
+
+        with mock.patch('core.ratelimit.time.time', return_value=6000.0):
+            worker_a.reset('k')
+        self.assertEqual(worker_b.check('k', now=6000.0), 0)
+        # ...and worker B's own copy follows, should the cache go away
+        with mock.patch('core.ratelimit.cache.get_many', side_effect=ConnectionError):
+            self.assertEqual(worker_b.check('k', now=6000.0), 0)
+
+    def test_local_counts_are_used_when_the_cache_is_down(self):
+        limiter = SlidingWindowCounter('test', limit=1, window=60)
+        limiter.hit('k', now=6000.0)
+        with mock.patch('core.ratelimit.cache.get_many', side_effect=ConnectionError):
+            self.assertGreater(limiter.check('k', now=6001.0), 0)
+
+    def test_consume_counts_only_allowed_events(self):
+        limiter = SlidingWindowCounter('test', limit=2, window=60)
+        self.assertEqual(limiter.consume('k', now=6000.0), 0)
+        self.assertEqual(limiter.consume('k', now=6000.0), 0)
+        self.assertEqual(limiter.consume('k', now=6000.0), 60)
+        self.assertEqual(limiter.consume('k', now=6000.0), 60)
+        # Refused events were not counted: one release makes room for one more
+        limiter.release('k', now=6000.0)
+        self.assertEqual(limiter.consume('k', now=6000.0), 0)
+        self.assertEqual(limiter.consume('k', now=6000.0), 60)
+
+    def test_parallel_consumers_cannot_all_pass(self):
+        limiter = SlidingWindowCounter('test', limit=5, window=60)
+        barrier = threading.Barrier(20)
+        results = []
+
+        def consume():
+            worker = SlidingWindowCounter('test', limit=5, window=60)
+            barrier.wait()
+            results.append(worker.consume('k', now=6000.0))
+
+        threads = [threading.Thread(target=consume) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(0), 5)
+        self.assertGreater(limiter.check('k', now=6000.0), 0)
+
+    def test_consume_uses_local_counts_when_the_cache_is_down(self):
+        limiter = SlidingWindowCounter('test', limit=1, window=60)
+        with mock.patch('core.ratelimit.cache.add', side_effect=ConnectionError):
+            self.assertEqual(limiter.consume('k', now=6000.0), 0)
+            self.assertEqual(limiter.consume('k', now=6001.0), 59)
+
+    def test_memory_is_bounded(self):
+        limiter = SlidingWindowCounter('test', limit=5, window=60, max_keys=3, shared=False)
+        for key in 'abcd':
+            limiter.hit(key, now=6000.0)
+        self.assertEqual(list(limiter._entries), ['b', 'c', 'd'])
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        # A fixed clock: sleeps are recorded instead of taken
+        self.sleeps = []
+        clock = mock.patch('core.ratelimit.time', time=mock.Mock(return_value=1000.0), sleep=self.sleeps.append)
+        store = mock.patch('core.ratelimit._local_store', LocalBucketStore())
+        clock.start()
+        store.start()
+        self.addCleanup(clock.stop)
+        self.addCleanup(store.stop)
+
+    def bucket(self, rate, capacity=1, max_wait=10):
+        bucket = TokenBucket('test-bucket', rate, capacity=capacity, max_wait=max_wait)
+        self.addCleanup(token_buckets.pop, 'test-bucket', None)
+        return bucket
+
+    def test_calls_are_spaced_by_the_rate(self):
+        bucket = self.bucket(rate=4)
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0.0, 0.25, 0.5])
+        self.assertEqual(self.sleeps, [0.25, 0.5])
+
+    def test_bursts_up_to_capacity_go_straight_through(self):
+        bucket = self.bucket(rate=4, capacity=3)
+        self.assertEqual([bucket.acquire() for _ in range(4)], [0.0, 0.0, 0.0, 0.25])
+
+    def test_rejects_callers_that_would_wait_past_max_wait(self):
+        bucket = self.bucket(rate=1, max_wait=2)
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0.0, 1.0, 2.0])
+        with self.assertRaises(RateLimitExceeded):
+            bucket.acquire()
+        # The rejected call reserved nothing
+        self.assertEqual(bucket.acquire(max_wait=3), 3.0)
+        self.assertEqual((bucket.usage()['granted'], bucket.usage()['rejected']), (4, 1))
+
+    def test_zero_rate_disables_the_bucket(self):
+        bucket = self.bucket(rate=0)
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0.0, 0.0, 0.0])
+
+    def test_falls_back_to_the_local_store_when_redis_fails(self):
+        client = mock.Mock()
+        client.register_script.return_value.side_effect = redis.ConnectionError('down')
+        client.get.side_effect = redis.ConnectionError('down')
+        bucket = self.bucket(rate=4)
+        with mock.patch('core.ratelimit.get_bucket_store', return_value=RedisBucketStore(client)), \
+                self.assertLogs('core.ratelimit', 'WARNING'):
+            self.assertEqual([bucket.acquire() for _ in range(2)], [0.0, 0.25])
+            self.assertEqual(bucket.usage()['backlog_seconds'], 0.5)
+
+    def test_usage_reports_the_bucket_state(self):
+        bucket = self.bucket(rate=2, capacity=4)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(bucket.usage(), {
+            'rate': 2, 'capacity': 4, 'available': 1, 'utilisation': 0.75, 'backlog_seconds': 0.0,
+            'granted': 3, 'rejected': 0, 'average_wait': 0.0,
+        })
+        bucket.acquire()
+        bucket.acquire()  # waits 0.5s
+        self.assertEqual(bucket.usage(), {
+            'rate': 2, 'capacity': 4, 'available': 0, 'utilisation': 1.0, 'backlog_seconds': 1.0,
+            'granted': 5, 'rejected': 0, 'average_wait': 0.1,
+        })
+
+
+class RedisBucketStoreTests(SimpleTestCase):
+    def test_converts_to_microseconds_and_back(self):
+        client = mock.Mock()
+        script = client.register_script.return_value
+        store = RedisBucketStore(client)
+
+        script.return_value = 250000
+        self.assertEqual(store.reserve('b', interval=0.5, tolerance=1.5, max_wait=10), 0.25)
+        self.assertEqual(script.call_args.kwargs['args'], [500000, 1500000, 10000000])
+        self.assertEqual(script.call_args.kwargs['keys'], [store._key('b')])
+
+        script.return_value = -1
+        self.assertIsNone(store.reserve('b', interval=0.5, tolerance=1.5, max_wait=10))
+
+        client.get.return_value = b'1500000'
+        self.assertEqual(store.theoretical_arrival('b'), 1.5)
+        client.get.return_value = None
+        self.assertIsNone(store.theoretical_arrival('b'))
+
+
+class CoalesceTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_callers_share_one_call(self):
+        calls = []
+        started = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(coalesce('k', compute, result_ttl=60)))
+        leader.start()
+        started.wait()
+        followers = [
+            threading.Thread(target=lambda: results.append(coalesce('k', compute, result_ttl=60)))
+            for _ in range(5)
+        ]
+        for thread in followers:
+            thread.start()
+        for thread in [leader, *followers]:
+            thread.join()
+        self.assertEqual(results, ['result'] * 6)
+        self.assertEqual(len(calls), 1)
+
+    def test_only_cacheable_results_are_reused(self):
+        results = iter([{'success': False}, {'success': True}, {'success': False}])
+
+        def call():
+            return coalesce('k', lambda: next(results), result_ttl=60, cacheable=lambda r: r['success'])
+
+        self.assertEqual(call(), {'success': False})
+        self.assertEqual(call(), {'success': True})
+        self.assertEqual(call(), {'success': True})  # from the cache
+
+    def test_waits_for_the_result_published_by_another_process(self):
+        cache.add('coalesce:k:lock', 1)
+
+        def publish():
+            time.sleep(0.1)
+            cache.set('coalesce:k:result', 'theirs')
+
+        threading.Thread(target=publish).start()
+        compute = mock.Mock(return_value='ours')
+        self.assertEqual(coalesce('k', compute, result_ttl=60, poll_interval=0.02), 'theirs')
+        compute.assert_not_called()
+
+    def test_computes_itself_when_the_other_leader_gives_up(self):
+        cache.add('coalesce:k:lock', 1)
+        threading.Timer(0.1, cache.delete, ['coalesce:k:lock']).start()
+        self.assertEqual(coalesce('k', lambda: 'ours', result_ttl=60, poll_interval=0.02), 'ours')
+
+    def test_leader_failure_reaches_every_waiter_and_is_not_cached(self):
+        started = threading.Event()
+
+        def compute():
+            started.set()
+            time.sleep(0.1)
+            raise ConnectionError('gateway down')
+
+        errors = []
+
+        def call():
+            try:
+                coalesce('k', compute, result_ttl=60)
+            except ConnectionError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(coalesce('k', lambda: 'recovered', result_ttl=60), 'recovered')
+
+
+class FastJSONRendererTests(TestCase):
+    def render(self, data):
+        return FastJSONRenderer().render(data), JSONRenderer().render(data)
+
+    def test_floats_and_decimals_match_the_stdlib(self):
+        for value in (1e-05, 1e16, 0.1, 123.456, Decimal('12.50'), {'nested': [Decimal('1E+2')]}):
+            fast, stdlib = self.render({'x': value})
+            self.assertEqual(fast, stdlib, value)
+
+    def test_non_finite_floats_are_rejected(self):
+        for value in (float('nan'), float('inf')):
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render({'x': value})
+
+    def test_payload_without_floats_is_encoded_once(self):
+        data = {'paystack_reference': '1e5a7c2e-0e1b-4c3d-9e8f-123e4567e89b', 'at': timezone.now(), 'n': 3}
+        with mock.patch.object(JSONRenderer, 'render', autospec=True, side_effect=JSONRenderer.render) as stdlib:
+            fast = FastJSONRenderer().render(data)
+        stdlib.assert_not_called()
+        self.assertEqual(fast, JSONRenderer().render(data))
+
+    def test_list_and_detail_endpoints_match_drf(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        for n in range(50):
+            Transaction.objects.create(
+                initiated_by=user, amount=Decimal('100.25'), payment_method='PAYSTACK',
+                customer_identifier=f'user{n}@example.com', paystack_reference=str(uuid4()),
+                response_data={'data': {'fees': 1.5e-05}},
+            )
+        self.client.force_login(user)
+        pk = Transaction.objects.first().pk
+        for url in ('/api/transactions/', f'/api/transactions/{pk}/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, JSONRenderer().render(response.data), url)
+
+
+class DatabasePoolTests(SimpleTestCase):
+    def settings_for(self, **env):
+        """Settings as a fresh process would compute them from `env`."""
+        code = (
+            'import json; from core import settings as s; '
+            'print(json.dumps({"mode": s.DB_POOL_MODE, "default": s.DATABASES["default"]}))'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], env={**os.environ, **env}, cwd=settings.BASE_DIR,
+            capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise AssertionError(result.stderr.strip().splitlines()[-1])
+        return json.loads(result.stdout)
+
+    def test_pool_mode_configures_the_psycopg_pool(self):
+        config = self.settings_for(DB_POOL_MODE='pool', DB_POOL_MIN_SIZE='3', DB_POOL_MAX_SIZE='7')
+        self.assertEqual(config['default']['OPTIONS']['pool']['min_size'], 3)
+        self.assertEqual(config['default']['OPTIONS']['pool']['max_size'], 7)
+        self.assertTrue(config['default']['CONN_HEALTH_CHECKS'])
+
+    def test_persistent_mode_becomes_a_pool_under_asgi(self):
+        config = self.settings_for(DB_POOL_MODE='persistent', DB_CONN_MAX_AGE='60')
+        self.assertEqual((config['mode'], config['default']['CONN_MAX_AGE']), ('persistent', 60))
+        config = self.settings_for(DB_POOL_MODE='persistent', DJANGO_SERVER_INTERFACE='asgi')
+        self.assertEqual(config['mode'], 'pool')
+        self.assertIn('pool', config['default']['OPTIONS'])
+
+    def test_unknown_modes_are_rejected(self):
+        with self.assertRaisesMessage(AssertionError, 'DB_POOL_MODE'):
+            self.settings_for(DB_POOL_MODE='pgbouncer')
+        with self.assertRaisesMessage(AssertionError, 'DB_POOL_WARM_UP'):
+            self.settings_for(DB_POOL_WARM_UP='always')
+
+    def test_warm_up_opens_pools_only(self):
+        pooled, plain = mock.Mock(), mock.Mock(spec=['ensure_connection'])
+        with mock.patch('core.db_pool.connections', {'default': pooled, 'replica_1': plain}):
+            warm_up_connections(timeout=5)
+        pooled.pool.open.assert_called_once_with(wait=True, timeout=5)
+        plain.ensure_connection.assert_not_called()
+
+    def test_warm_up_failure_does_not_stop_the_worker(self):
+        pooled = mock.Mock()
+        pooled.pool.open.side_effect = TimeoutError('database is slow')
+        with mock.patch('core.db_pool.connections', {'default': pooled}):
+            with self.assertLogs('core.db_pool', 'WARNING'):
+                warm_up_connections()
+
+    def test_install_warm_up_follows_the_setting(self):
+        for mode, warmed, registered in (('none', False, False), ('import', True, False), ('fork', False, True)):
+            with override_settings(DB_POOL_WARM_UP=mode), \
+                    mock.patch('core.db_pool.warm_up_connections') as warm_up, \
+                    mock.patch('core.db_pool.os.register_at_fork') as register_at_fork:
+                install_warm_up()
+            self.assertEqual(warm_up.called, warmed, mode)
+            self.assertEqual(register_at_fork.called, registered, mode)
+            if registered:
+                register_at_fork.assert_called_once_with(after_in_child=warm_up)
+
+
+class RenderBoundedTests(SimpleTestCase):
+    def test_small_values_render_whole(self):
+        value = {'Body': {'stkCallback': {'ResultCode': 0, 'Items': [1.5, None, True]}}, 'id': uuid4()}
+        self.assertEqual(
+            render_bounded(value, 1000),
+            f'{{"Body":{{"stkCallback":{{"ResultCode":0,"Items":[1.5,null,true]}}}},"id":"{value["id"]}"}}',
+        )
+
+    def test_large_payloads_stop_at_the_limit(self):
+        value = {'items': [{'n': n, 'text': 'x' * 50} for n in range(10000)]}
+        rendered = render_bounded(value, 100)
+        self.assertEqual(len(rendered), 103)
+        self.assertTrue(rendered.startswith('{"items":[{"n":0,'))
+        self.assertTrue(rendered.endswith('...'))
+
+    def test_strings_are_truncated_not_quoted(self):
+        self.assertEqual(render_bounded('abc', 10), 'abc')
+        self.assertEqual(render_bounded('abcdef', 3), 'abc...')
+
+
+class QueuedStreamHandlerTests(SimpleTestCase):
+    def make_handler(self, maxsize=10000):
+        stream = io.StringIO()
+        handler = QueuedStreamHandler(stream, maxsize=maxsize)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.addCleanup(handler.stop)
+        return handler, stream
+
+    def record(self, message, exc_info=None):
+        return logging.makeLogRecord({'levelno': logging.INFO, 'levelname': 'INFO', 'msg': message, 'exc_info': exc_info})
+
+    def test_listener_starts_with_the_first_record_of_each_process(self):
+        handler, stream = self.make_handler()
+        self.assertIsNone(handler.listener)
+
+        handler.handle(self.record('first'))
+        listener = handler.listener
+        self.assertIsNotNone(listener._thread)
+
+        # In a forked child the inherited listener thread does not exist
+        with mock.patch('core.logs.os.getpid', return_value=os.getpid() + 1):
+            handler.handle(self.record('in the child'))
+            self.assertIsNot(handler.listener, listener)
+            handler.stop()
+        listener.stop()
+        self.assertIn('in the child', stream.getvalue())
+
+    def test_dropped_records_are_reported(self):
+        handler, stream = self.make_handler(maxsize=2)
+        handler.pid = os.getpid()  # no listener: nothing drains the queue
+        for n in range(3):
+            handler.handle(self.record(f'record {n}'))
+        self.assertEqual(handler.dropped, 1)
+
+        handler.queue.get_nowait()
+        handler.queue.get_nowait()
+        handler.handle(self.record('after'))
+        queued = [handler.queue.get_nowait() for _ in range(2)]
+        self.assertEqual(queued[0].getMessage(), 'after')
+        self.assertEqual(queued[1].getMessage(), '1 log records dropped: the logging queue was full')
+        self.assertEqual(queued[1].levelno, logging.WARNING)
+
+        # Drops not yet reported when the handler stops are written directly
+        handler.handle(self.record('fills'))
+        handler.handle(self.record('fills'))
+        handler.handle(self.record('dropped'))
+        handler.stop()
+        self.assertIn('WARNING 1 log records dropped', stream.getvalue())
+
+    def test_tracebacks_are_rendered_on_the_logging_thread(self):
+        handler, stream = self.make_handler()
+        try:
+            raise ValueError('bad callback')
+        except ValueError:
+            record = self.record('failed', exc_info=sys.exc_info())
+        prepared = handler.prepare(record)
+        self.assertIsNone(prepared.exc_info)
+        self.assertIn('ValueError: bad callback', prepared.exc_text)
+        self.assertIsNotNone(record.exc_info)  # the caller's record is left alone
+
+        handler.handle(record)
+        handler.stop()
+        self.assertIn('Traceback', stream.getvalue())
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def route(self, path, method='GET', cookies=None, write=False):
+        """Runs a request through the middleware; returns (read alias before, after a write, response)."""
+        request = getattr(RequestFactory(), method.lower())(path)
+        request.COOKIES.update(cookies or {})
+        view = resolve(path).func
+        reads = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            reads.append(self.router.db_for_read(Transaction))
+            if write:
+                self.router.db_for_write(Transaction)
+                reads.append(self.router.db_for_read(Transaction))
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        return reads, response
+
+    def test_opted_in_views_read_from_a_replica(self):
+        self.assertEqual(self.route('/api/transactions/')[0], ['replica_1'])
+        self.assertEqual(self.route('/api/bootstrap/')[0], ['replica_1'])
+
+    def test_admin_writing_and_unsafe_requests_read_from_the_primary(self):
+        self.assertEqual(self.route('/admin/transactions/transaction/1/change/')[0], ['default'])
+        # Completes payments despite being a GET
+        self.assertEqual(self.route('/api/transactions/paystack/verify/ref-1/')[0], ['default'])
+        self.assertEqual(self.route('/api/transactions/', method='POST')[0], ['default'])
+
+    def test_reads_after_a_write_go_to_the_primary_and_pin_the_client(self):
+        reads, response = self.route('/api/transactions/', write=True)
+        self.assertEqual(reads, ['replica_1', 'default'])
+        cookie = response.cookies[ReplicaRoutingMiddleware.cookie_name]
+        self.assertEqual(cookie['max-age'], 10)
+        self.assertTrue(cookie['httponly'])
+
+        self.assertNotIn(ReplicaRoutingMiddleware.cookie_name, self.route('/api/transactions/')[1].cookies)
+
+    def test_pinned_clients_read_from_the_primary(self):
+        reads, _ = self.route('/api/transactions/', cookies={ReplicaRoutingMiddleware.cookie_name: '1'})
+        self.assertEqual(reads, ['default'])
+
+    def test_reads_outside_requests_go_to_the_primary(self):
+        self.route('/api/transactions/')
+        self.assertEqual(self.router.db_for_read(Transaction), 'default')
+
+
+class BootstrapViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def pay(self, amount):
+        Transaction.objects.create(
+            initiated_by=self.user, amount=Decimal(amount), payment_method='STK_PUSH',
+            customer_identifier='0712345678', status='COMPLETED',
+        )
+
+    def test_returns_user_stats_and_transactions(self):
+        self.pay('150')
+        data = self.client.get('/api/bootstrap/').json()
+        self.assertEqual(data['user']['username'], 'alice')
+        self.assertEqual(data['stats']['total_collected'], '150.00')
+        self.assertEqual(len(data['transactions']), 1)
+
+    @override_settings(DASHBOARD_STATS_CACHE_SECONDS=60, DATABASE_REPLICAS=['default'])
+    def test_cached_stats_are_not_served_to_clients_pinned_to_the_primary(self):
+        self.pay('150')
+        self.client.get('/api/bootstrap/')
+        self.pay('50')
+        self.assertEqual(self.client.get('/api/bootstrap/').json()['stats']['total_collected'], '150.00')
+
+        self.client.cookies['db_primary_pin'] = '1'
+        data = self.client.get('/api/bootstrap/').json()
+        self.assertEqual(data['stats']['total_collected'], '200.00')
+
+
+class RequestProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        cls.user = User.objects.create_user('alice')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        profiling = override_settings(REQUEST_PROFILING_ENABLED=True, REQUEST_PROFILING_DIR=self.directory)
+        profiling.enable()
+        self.addCleanup(profiling.disable)
+
+    def get(self, user, profile, **headers):
+        self.client.force_login(user)
+        return self.client.get('/api/bootstrap/', {'__profile': profile} if profile else {}, headers=headers)
+
+    def test_ignored_for_users_who_are_not_staff(self):
+        response = self.get(self.user, 'inline')
+        self.assertIn('stats', response.json())
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_inline_returns_the_profile_instead_of_the_response(self):
+        profile = self.get(self.staff, 'inline').json()
+        self.assertEqual((profile['method'], profile['status_code']), ('GET', 200))
+        self.assertTrue(profile['path'].startswith('/api/bootstrap/'))
+        self.assertGreater(profile['sql_count'], 0)
+        self.assertEqual(profile['sql_count'], len(profile['sql']))
+        self.assertIn('cumulative', profile['stats'])
+
+    def test_sampling_is_selected_by_the_header(self):
+        with override_settings(REQUEST_PROFILING_INTERVAL=0.001):
+            profile = self.get(self.staff, None, X_PROFILE='Sample, inline').json()
+        self.assertIn('collapsed', profile)
+        self.assertNotIn('stats', profile)
+
+    def test_profile_is_written_to_disk_without_inline(self):
+        response = self.get(self.staff, 'cprofile')
+        self.assertIn('stats', response.json())
+        profile_id = response['X-Profile-Id']
+        self.assertEqual(sorted(os.listdir(self.directory)), [f'{profile_id}.json', f'{profile_id}.prof'])
+        with open(os.path.join(self.directory, f'{profile_id}.json')) as f:
+            self.assertEqual(json.load(f)['status_code'], 200)
+
+    def test_removed_when_disabled(self):
+        with override_settings(REQUEST_PROFILING_ENABLED=False):
+            self.client.force_login(self.staff)
+            response = self.client.get('/api/bootstrap/', {'__profile': 'inline'})
+        self.assertIn('stats', response.json())
+        self.assertNotIn('X-Profile-Id', response)
@@ -1,8 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
+from .views import BootstrapView, DarajaAccountStatsView, DatabasePoolStatsView, RateLimitStatsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('accounts.urls')),
     path('api/transactions/', include('transactions.urls')),
+    path('api/bootstrap/', BootstrapView.as_view(), name='bootstrap'),
+    path('api/health/db/', DatabasePoolStatsView.as_view(), name='db-pool-stats'),
+    path('api/health/ratelimits/', RateLimitStatsView.as_view(), name='rate-limit-stats'),
+    path('api/health/daraja/', DarajaAccountStatsView.as_view(), name='daraja-account-stats'),
 ]
\ No newline at end of file
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import ensure_csrf_cookie
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+
+from accounts.views import user_context
+from transactions.stats import dashboard_stats, default_stats_period, recent_transactions
+from transactions.utils import DARAJA_ACCOUNT_LIST
+from .db_pool import pool_stats
+from .ratelimit import token_buckets
+
+
+class DatabasePoolStatsView(APIView):
+    """
+    Connection pool metrics for this worker process (staff only).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(pool_stats())
+
+
+class RateLimitStatsView(APIView):
+    """
+    Utilisation of the outbound gateway token buckets (staff only).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({name: bucket.usage() for name, bucket in sorted(token_buckets.items())})
+
+
+class DarajaAccountStatsView(APIView):
+    """
+    Health and STK Push load of each Daraja credential set (staff only).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'balancing': settings.DARAJA_BALANCING,
+            'accounts': {account.name: account.status() for account in DARAJA_ACCOUNT_LIST},
+        })
+
+
+@method_decorator(ensure_csrf_cookie, name='dispatch')
+class BootstrapView(APIView):
+    """
+    Everything the frontend needs on startup in one round trip: user
+    context (and CSRF cookie), the default 30-day stats and the first page
+    of recent transactions, read on the request's own connection (see
+    transactions.stats for caching).
+    """
+    replica_reads = True
+
+    def get(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        start_date, end_date = default_stats_period()
+        return Response({
+            'user': user_context(user),
+            'stats': dashboard_stats(user, start_date, end_date),
+            'transactions': recent_transactions(user, settings.BOOTSTRAP_TRANSACTION_LIMIT),
+        })
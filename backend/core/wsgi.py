@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# Fill the connection pools before the first request (DB_POOL_WARM_UP)
+from core.db_pool import install_warm_up  # noqa: E402
+install_warm_up()
@@ -0,0 +1,15 @@
+from django.contrib import admin
+from .models import BackfillCheckpoint, Job
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'task', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'updated_at']
+    list_filter = ['status', 'task']
+    readonly_fields = ['created_at', 'updated_at', 'locked_at', 'locked_by']
+
+
+@admin.register(BackfillCheckpoint)
+class BackfillCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'last_pk', 'end_pk', 'rows_processed', 'rows_changed', 'updated_at']
+    list_filter = ['status']
+    readonly_fields = ['started_at', 'completed_at', 'updated_at']
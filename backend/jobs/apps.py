@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsConfig(AppConfig):
+    name = 'jobs'
+
+    def ready(self):
+        # Register task handlers and backfills declared in each app's tasks.py / backfills.py
+        autodiscover_modules('tasks', 'backfills')
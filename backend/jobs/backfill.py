@@ -0,0 +1,230 @@
+"""
+Batched, throttled and resumable backfills over large tables.
+
+A backfill is a function registered with @backfill(name, model) that
+updates the rows of one primary-key chunk. run_backfill() walks the table
+in ascending pk order up to the highest pk at the time it started (newer
+rows are written by code that already fills the column). Each chunk runs
+in its own short database transaction, committed together with the
+BackfillCheckpoint row, so an interrupted run resumes after the last
+committed chunk and no lock is held for longer than one chunk. Runs of
+the same backfill serialize on the checkpoint row, so starting a second
+one is harmless.
+
+Between chunks the runner pauses for a fixed time and/or in proportion to
+how long the chunk took (the duty cycle), and can wait while the database
+has more than a given number of active queries. Chunks give up on row
+locks after BACKFILL_LOCK_TIMEOUT seconds and are retried, so a backfill
+backs off from payment traffic rather than queueing it behind itself.
+"""
+
+import logging
+import threading
+import time
+
+from django.db import OperationalError, connection
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .models import BackfillCheckpoint
+
+logger = logging.getLogger(__name__)
+
+_backfills = {}
+
+LOCK_RETRIES = 10
+
+
+class Backfill:
+    def __init__(self, name, model, func):
+        self.name = name
+        self.model = model
+        self.func = func
+        self.description = ' '.join((func.__doc__ or '').strip().split('\n\n')[0].split())
+
+
+def backfill(name, model):
+    """
+    Registers `func(queryset)` as the backfill `name`. The queryset holds
+    the `model` rows of one chunk; the function updates them and returns
+    how many rows it changed (or None).
+    """
+    def decorator(func):
+        _backfills[name] = Backfill(name, model, func)
+        return func
+    return decorator
+
+
+def registered_backfills():
+    return dict(sorted(_backfills.items()))
+
+
+def get_backfill(name):
+    try:
+        return _backfills[name]
+    except KeyError:
+        raise LookupError(f"No backfill registered as {name}")
+
+
+class BackfillProgress:
+    """Totals for the whole backfill plus throughput of the current run."""
+
+    def __init__(self, checkpoint):
+        self.checkpoint = checkpoint
+        self.started = time.monotonic()
+        self.start_pk = checkpoint.last_pk
+        self.rows = 0  # processed by this run
+
+    @property
+    def done(self):
+        return self.checkpoint.status == 'DONE'
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Seconds left, from the row density and rate seen so far (None until known)."""
+        checkpoint = self.checkpoint
+        if self.done:
+            return 0.0
+        span = checkpoint.last_pk - self.start_pk
+        rate = self.rows_per_second
+        if not span or not rate:
+            return None
+        remaining_rows = (checkpoint.end_pk - checkpoint.last_pk) * self.rows / span
+        return remaining_rows / rate
+
+    @property
+    def percent(self):
+        checkpoint = self.checkpoint
+        if self.done or not checkpoint.end_pk:
+            return 100.0
+        return min(100.0, checkpoint.last_pk / checkpoint.end_pk * 100)
+
+
+def run_backfill(name, batch_size, pause=0.0, duty_cycle=1.0, max_active_queries=None,
+                 lock_timeout=None, restart=False, stop=None, report=None, report_interval=5.0):
+    """
+    Runs (or resumes) backfill `name` until it is done or `stop` (a
+    threading.Event) is set. `report(progress)` is called at most every
+    `report_interval` seconds and once at the end. Returns the final
+    BackfillProgress.
+    """
+    job = get_backfill(name)
+    stop = stop or threading.Event()
+    progress = BackfillProgress(_start(job, restart))
+    last_report = time.monotonic()
+
+    while not progress.done and not stop.is_set():
+        if max_active_queries:
+            _wait_for_quiet_database(max_active_queries, pause, stop)
+            if stop.is_set():
+                break
+
+        started = time.monotonic()
+        rows = _run_chunk_with_retries(job, progress, batch_size, lock_timeout, stop)
+        progress.rows += rows
+
+        if report and time.monotonic() - last_report >= report_interval:
+            report(progress)
+            last_report = time.monotonic()
+
+        if not progress.done:
+            elapsed = time.monotonic() - started
+            delay = pause + (elapsed * (1 - duty_cycle) / duty_cycle if 0 < duty_cycle < 1 else 0)
+            if delay:
+                stop.wait(delay)
+
+    if not progress.done:
+        checkpoint = progress.checkpoint
+        BackfillCheckpoint.objects.filter(pk=checkpoint.pk, status='RUNNING').update(
+            status='STOPPED', updated_at=timezone.now()
+        )
+        checkpoint.status = 'STOPPED'
+    if report:
+        report(progress)
+    return progress
+
+
+def _start(job, restart):
+    end_pk = job.model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    checkpoint, created = BackfillCheckpoint.objects.get_or_create(name=job.name, defaults={'end_pk': end_pk})
+    if restart and not created:
+        checkpoint.last_pk = checkpoint.rows_processed = checkpoint.rows_changed = 0
+        checkpoint.end_pk = end_pk
+        checkpoint.started_at = timezone.now()
+        checkpoint.completed_at = None
+        checkpoint.status = 'RUNNING'
+        checkpoint.save()
+    elif checkpoint.status == 'STOPPED':
+        checkpoint.status = 'RUNNING'
+        checkpoint.save(update_fields=['status', 'updated_at'])
+    return checkpoint
+
+
+def _run_chunk_with_retries(job, progress, batch_size, lock_timeout, stop):
+    for attempt in range(1, LOCK_RETRIES + 1):
+        try:
+            return _run_chunk(job, progress, batch_size, lock_timeout)
+        except OperationalError as e:
+            if getattr(e.__cause__, 'sqlstate', None) != '55P03' or attempt == LOCK_RETRIES:
+                raise
+            logger.warning("Backfill %s waited too long for a lock (attempt %s), backing off", job.name, attempt)
+            if stop.wait(min(2 ** attempt * 0.1, 10)):
+                return 0
+
+
+def _run_chunk(job, progress, batch_size, lock_timeout):
+    """Processes the next chunk after the checkpoint and advances it. Returns rows processed."""
+    with db_transaction.atomic():
+        if lock_timeout and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('lock_timeout', %s, true)", [f'{int(lock_timeout * 1000)}ms'])
+
+        # Locked for the whole chunk: concurrent runs of this backfill take turns
+        checkpoint = BackfillCheckpoint.objects.select_for_update().get(pk=progress.checkpoint.pk)
+        if checkpoint.status == 'DONE':
+            progress.checkpoint = checkpoint
+            return 0
+
+        remaining = job.model.objects.filter(pk__gt=checkpoint.last_pk, pk__lte=checkpoint.end_pk)
+        # pk of the batch_size-th remaining row (from the pk index), or the end of the table
+        upper = remaining.order_by('pk').values_list('pk', flat=True)[batch_size - 1:batch_size].first()
+        last_chunk = upper is None or upper >= checkpoint.end_pk
+        upper = checkpoint.end_pk if last_chunk else upper
+
+        chunk = job.model.objects.filter(pk__gt=checkpoint.last_pk, pk__lte=upper)
+        rows = chunk.count() if last_chunk else batch_size
+        changed = job.func(chunk) or 0
+
+        checkpoint.last_pk = upper
+        checkpoint.rows_processed += rows
+        checkpoint.rows_changed += changed
+        update_fields = ['last_pk', 'rows_processed', 'rows_changed', 'updated_at']
+        if last_chunk:
+            checkpoint.status = 'DONE'
+            checkpoint.completed_at = timezone.now()
+            update_fields += ['status', 'completed_at']
+        checkpoint.save(update_fields=update_fields)
+
+    progress.checkpoint = checkpoint
+    return rows
+
+
+def _wait_for_quiet_database(max_active_queries, pause, stop):
+    if connection.vendor != 'postgresql':
+        return
+    while not stop.is_set():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_stat_activity "
+                "WHERE state = 'active' AND datname = current_database() AND pid <> pg_backend_pid()"
+            )
+            active = cursor.fetchone()[0]
+        if active <= max_active_queries:
+            return
+        logger.info("Backfill paused: %s active queries (limit %s)", active, max_active_queries)
+        stop.wait(max(pause, 1.0))
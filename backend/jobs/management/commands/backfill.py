@@ -0,0 +1,89 @@
+import signal
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs.backfill import get_backfill, registered_backfills, run_backfill
+from jobs.models import BackfillCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Runs or resumes a registered backfill in small, throttled primary-key chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help='Backfill to run (omit with --list)')
+        parser.add_argument('--list', action='store_true', help='List registered backfills and their progress')
+        parser.add_argument('--batch-size', type=int, default=settings.BACKFILL_BATCH_SIZE)
+        parser.add_argument(
+            '--pause', type=float, default=settings.BACKFILL_PAUSE,
+            help='Seconds to sleep after every chunk'
+        )
+        parser.add_argument(
+            '--duty-cycle', type=float, default=settings.BACKFILL_DUTY_CYCLE,
+            help='Share of time spent running chunks, e.g. 0.25 sleeps 3x as long as each chunk took (1 disables)'
+        )
+        parser.add_argument(
+            '--max-active-queries', type=int, default=None,
+            help='Wait while the database has more active queries than this'
+        )
+        parser.add_argument(
+            '--lock-timeout', type=float, default=settings.BACKFILL_LOCK_TIMEOUT,
+            help='Seconds a chunk may wait for a row lock before backing off and retrying'
+        )
+        parser.add_argument('--restart', action='store_true', help='Discard the checkpoint and start from the first row')
+        parser.add_argument('--report-interval', type=float, default=5.0, help='Seconds between progress lines')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            return self.list_backfills()
+        if not options['name']:
+            raise CommandError('Give a backfill name, or --list to see them')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if not 0 < options['duty_cycle'] <= 1:
+            raise CommandError('--duty-cycle must be in (0, 1]')
+        try:
+            get_backfill(options['name'])
+        except LookupError as e:
+            raise CommandError(str(e))
+
+        # Finish the current chunk, then stop: the checkpoint is always consistent
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+        progress = run_backfill(
+            options['name'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            duty_cycle=options['duty_cycle'],
+            max_active_queries=options['max_active_queries'],
+            lock_timeout=options['lock_timeout'],
+            restart=options['restart'],
+            stop=stop,
+            report=self.report,
+            report_interval=options['report_interval'],
+        )
+        if progress.done:
+            self.stdout.write(f"{options['name']} is complete")
+        else:
+            self.stdout.write(f"{options['name']} stopped at pk {progress.checkpoint.last_pk}; run again to resume")
+
+    def report(self, progress):
+        checkpoint = progress.checkpoint
+        eta = progress.eta
+        self.stdout.write(
+            f"{checkpoint.name}: pk {checkpoint.last_pk}/{checkpoint.end_pk} ({progress.percent:.1f}%), "
+            f"{checkpoint.rows_processed} rows processed, {checkpoint.rows_changed} changed, "
+            f"{progress.rows_per_second:.0f} rows/s, "
+            f"ETA {timedelta(seconds=round(eta)) if eta is not None else 'unknown'}"
+        )
+
+    def list_backfills(self):
+        checkpoints = {checkpoint.name: checkpoint for checkpoint in BackfillCheckpoint.objects.all()}
+        for name, job in registered_backfills().items():
+            checkpoint = checkpoints.get(name)
+            state = str(checkpoint) if checkpoint else 'not started'
+            self.stdout.write(f"{name}: {job.description} [{state}]")
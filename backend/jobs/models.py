@@ -0,0 +1,69 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+
+    # Retry bookkeeping
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    # Set while a worker holds the job; a stale lock means the worker died
+    locked_at = models.DateTimeField(blank=True, null=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            # Only live jobs are indexed, so the index stays small as DONE rows pile up
+            models.Index(fields=['run_at'], condition=Q(status='QUEUED'), name='jobs_job_queued_idx'),
+            models.Index(fields=['locked_at'], condition=Q(status='RUNNING'), name='jobs_job_running_idx'),
+        ]
+
+    @property
+    def is_last_attempt(self):
+        return self.attempts >= self.max_attempts
+
+    def __str__(self):
+        return f"{self.task} #{self.id} ({self.get_status_display()})"
+
+
+class BackfillCheckpoint(models.Model):
+    """Progress of a registered backfill (see jobs.backfill), committed with each chunk."""
+    STATUS_CHOICES = [
+        ('RUNNING', 'Running'),
+        ('STOPPED', 'Stopped'),
+        ('DONE', 'Done'),
+    ]
+
+    name = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RUNNING')
+
+    # Rows with pk <= last_pk are done; end_pk is the highest pk when the backfill started
+    last_pk = models.BigIntegerField(default=0)
+    end_pk = models.BigIntegerField(default=0)
+    rows_processed = models.BigIntegerField(default=0)
+    rows_changed = models.BigIntegerField(default=0)
+
+    started_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()}, pk {self.last_pk}/{self.end_pk})"
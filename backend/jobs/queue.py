@@ -0,0 +1,125 @@
+"""
+PostgreSQL-backed job queue.
+
+Jobs are rows in the jobs_job table. Workers claim them with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers can poll the
+same table without blocking each other, and a job enqueued inside a
+database transaction only becomes visible once that transaction commits.
+"""
+
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+class RetryJob(Exception):
+    """Raised by a handler to have the job retried later (counts as a failed attempt)."""
+
+
+def task(name):
+    """
+    Registers a handler for jobs named `name`. The handler receives the
+    claimed Job instance; returning normally marks it DONE, raising
+    schedules a retry until max_attempts is reached.
+    """
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def enqueue(task_name, payload=None, run_at=None, max_attempts=None):
+    if task_name not in _handlers:
+        raise LookupError(f"No handler registered for task {task_name}")
+    return Job.objects.create(
+        task=task_name,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim_job(worker_id):
+    """
+    Locks the next runnable job for `worker_id` and marks it RUNNING.
+    Jobs left RUNNING past JOB_LOCK_TIMEOUT (their worker died) are
+    picked up again. Returns None when nothing is runnable.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+
+    with db_transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status='QUEUED', run_at__lte=now) |
+                Q(status='RUNNING', locked_at__lt=stale_before)
+            )
+            .order_by('run_at')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = 'RUNNING'
+        job.locked_at = now
+        job.locked_by = worker_id
+        job.attempts += 1
+        job.save(update_fields=['status', 'locked_at', 'locked_by', 'attempts', 'updated_at'])
+    return job
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, capped at JOB_RETRY_MAX_DELAY seconds."""
+    delay = min(settings.JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_DELAY)
+    return delay * random.uniform(1.0, 1.1)
+
+
+def run_job(job):
+    """
+    Runs a claimed job and records the outcome, unless the lock was taken
+    over meanwhile (the job ran past JOB_LOCK_TIMEOUT and another worker
+    reclaimed it): the new owner's state is then left alone.
+    """
+    owner = job.locked_by
+    handler = _handlers.get(job.task)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for task {job.task}")
+        handler(job)
+    except Exception as e:
+        job.last_error = f"{type(e).__name__}: {e}"
+        if job.is_last_attempt:
+            job.status = 'FAILED'
+            logger.error("Job %s (%s) failed permanently after %s attempts: %s", job.id, job.task, job.attempts, e)
+        else:
+            job.status = 'QUEUED'
+            job.run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+            logger.warning("Job %s (%s) attempt %s failed, retrying: %s", job.id, job.task, job.attempts, e)
+    else:
+        job.status = 'DONE'
+
+    job.locked_at = None
+    job.locked_by = ''
+    updated = Job.objects.filter(pk=job.pk, status='RUNNING', locked_by=owner).update(
+        status=job.status,
+        run_at=job.run_at,
+        last_error=job.last_error,
+        locked_at=None,
+        locked_by='',
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        logger.warning("Job %s (%s) was reclaimed by another worker; discarding this run's outcome", job.id, job.task)
+    return job
@@ -0,0 +1,153 @@
+import threading
+from datetime import timedelta
+
+from django.db import connection, transaction as db_transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .backfill import backfill, run_backfill
+from .models import BackfillCheckpoint, Job
+from .queue import RetryJob, claim_job, enqueue, run_job, task
+
+calls = []
+
+
+@task('jobs.tests.record')
+def record(job):
+    calls.append(job.payload)
+
+
+backfilled = []
+stop_backfill = threading.Event()
+
+
+@backfill('jobs.tests.collect', Job)
+def collect(jobs):
+    pks = list(jobs.values_list('pk', flat=True))
+    backfilled.extend(pks)
+    if len(backfilled) >= 4:
+        stop_backfill.set()  # interrupt the run after this chunk
+    return len(pks)
+
+
+@task('jobs.tests.fail')
+def fail(job):
+    raise RetryJob('gateway unavailable')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_requires_a_registered_handler(self):
+        with self.assertRaises(LookupError):
+            enqueue('jobs.tests.missing')
+
+    def test_claims_due_jobs_in_run_at_order(self):
+        later = enqueue('jobs.tests.record', {'n': 2}, run_at=timezone.now() - timedelta(seconds=1))
+        first = enqueue('jobs.tests.record', {'n': 1}, run_at=timezone.now() - timedelta(seconds=5))
+        enqueue('jobs.tests.record', {'n': 3}, run_at=timezone.now() + timedelta(hours=1))
+
+        claimed = [claim_job('w1'), claim_job('w1'), claim_job('w1')]
+        self.assertEqual([job.pk if job else None for job in claimed], [first.pk, later.pk, None])
+        self.assertEqual(claimed[0].status, 'RUNNING')
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(claimed[0].locked_by, 'w1')
+
+    def test_successful_job_is_done(self):
+        enqueue('jobs.tests.record', {'n': 1})
+        job = run_job(claim_job('w1'))
+        self.assertEqual(job.status, 'DONE')
+        self.assertEqual(calls, [{'n': 1}])
+
+    @override_settings(JOB_RETRY_BASE_DELAY=5, JOB_RETRY_MAX_DELAY=600)
+    def test_failed_job_is_retried_with_backoff_until_max_attempts(self):
+        enqueue('jobs.tests.fail', max_attempts=2)
+
+        before = timezone.now()
+        job = run_job(claim_job('w1'))
+        self.assertEqual(job.status, 'QUEUED')
+        self.assertIn('gateway unavailable', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + timedelta(seconds=5))
+        self.assertEqual(job.locked_by, '')
+        self.assertIsNone(claim_job('w1'))  # not due yet
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        job = run_job(claim_job('w1'))
+        self.assertEqual(job.status, 'FAILED')
+        self.assertEqual(job.attempts, 2)
+
+    @override_settings(JOB_LOCK_TIMEOUT=300)
+    def test_stale_running_job_is_reclaimed(self):
+        enqueue('jobs.tests.record')
+        job = claim_job('dead-worker')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=301))
+
+        reclaimed = claim_job('w2')
+        self.assertEqual(reclaimed.pk, job.pk)
+        self.assertEqual(reclaimed.attempts, 2)
+        self.assertEqual(reclaimed.locked_by, 'w2')
+
+    @override_settings(JOB_LOCK_TIMEOUT=300)
+    def test_worker_that_lost_its_lock_does_not_overwrite_the_new_owner(self):
+        enqueue('jobs.tests.record')
+        slow = claim_job('slow-worker')
+        Job.objects.filter(pk=slow.pk).update(locked_at=timezone.now() - timedelta(seconds=301))
+        claim_job('w2')
+
+        run_job(slow)
+        job = Job.objects.get(pk=slow.pk)
+        self.assertEqual((job.status, job.locked_by), ('RUNNING', 'w2'))
+
+
+class SkipLockedClaimTests(TransactionTestCase):
+    def test_locked_job_is_skipped_not_waited_for(self):
+        first = enqueue('jobs.tests.record', run_at=timezone.now() - timedelta(seconds=5))
+        second = enqueue('jobs.tests.record')
+        claimed = []
+
+        def other_worker():
+            try:
+                claimed.append(claim_job('w2'))
+            finally:
+                connection.close()
+
+        with db_transaction.atomic():
+            # Another worker is in the middle of claiming the first job
+            list(Job.objects.select_for_update().filter(pk=first.pk))
+            thread = threading.Thread(target=other_worker)
+            thread.start()
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive(), 'claim_job blocked on a locked row')
+
+        self.assertEqual(claimed[0].pk, second.pk)
+
+
+class BackfillTests(TestCase):
+    def setUp(self):
+        backfilled.clear()
+        stop_backfill.clear()
+        self.pks = [enqueue('jobs.tests.record', {'n': n}).pk for n in range(10)]
+
+    def test_interrupted_run_resumes_after_the_last_committed_chunk(self):
+        progress = run_backfill('jobs.tests.collect', batch_size=2, stop=stop_backfill)
+        self.assertEqual(backfilled, self.pks[:4])
+        self.assertEqual(progress.checkpoint.status, 'STOPPED')
+        self.assertEqual(progress.checkpoint.last_pk, self.pks[3])
+
+        stop_backfill.clear()
+        backfilled.clear()
+        later = enqueue('jobs.tests.record', {'n': 10}).pk
+        progress = run_backfill('jobs.tests.collect', batch_size=4, stop=threading.Event())
+        # Resumed where it stopped, and stopped at the end recorded when it first started
+        self.assertEqual(backfilled, self.pks[4:])
+        self.assertNotIn(later, backfilled)
+        checkpoint = BackfillCheckpoint.objects.get(name='jobs.tests.collect')
+        self.assertEqual((checkpoint.status, checkpoint.rows_processed), ('DONE', 10))
+        self.assertEqual(progress.percent, 100.0)
+
+    def test_restart_starts_over(self):
+        run_backfill('jobs.tests.collect', batch_size=5, stop=threading.Event())
+        backfilled.clear()
+        run_backfill('jobs.tests.collect', batch_size=5, restart=True, stop=threading.Event())
+        self.assertEqual(backfilled, self.pks)
@@ -1,9 +1,204 @@
-from django.contrib import admin
-from .models import Transaction
+import json
+from django.conf import settings
+from django import forms
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from .models import Customer, Transaction
+from .utils import normalize_customer_identifier
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses PostgreSQL planner statistics instead of an exact COUNT(*) once
+    a result set is estimated to be larger than
+    ADMIN_ESTIMATED_COUNT_THRESHOLD rows. Smaller results are still
+    counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+
+        estimate = self.estimate_count(queryset, connection)
+        if estimate is None or estimate < settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+    def estimate_count(self, queryset, connection):
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                # Unfiltered changelist: table statistics from the last ANALYZE
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+                return row[0] if row and row[0] >= 0 else None
+
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+
+class InitiatorFilter(admin.SimpleListFilter):
+    """
+    Username box with suggestions from the admin autocomplete endpoint,
+    so the sidebar never has to load every user.
+    """
+    title = 'initiated by'
+    parameter_name = 'initiated_by__username'
+    template = 'admin/transactions/initiator_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(initiated_by__username=self.value())
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            'value': self.value() or '',
+            'parameter_name': self.parameter_name,
+            'clear_query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'hidden_params': [
+                (name, value) for name, value in changelist.params.items()
+                if name != self.parameter_name
+            ],
+        }
+
+
+class TransactionAdminForm(forms.ModelForm):
+    """
+    Carries the version the form was rendered with, so a save is refused
+    if the transaction changed while the admin had it open.
+    """
+    loaded_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    class Meta:
+        model = Transaction
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['loaded_version'].initial = self.instance.version
+
+    def clean(self):
+        cleaned_data = super().clean()
+        loaded_version = cleaned_data.get('loaded_version')
+        if self.instance.pk and loaded_version is not None and loaded_version != self.instance.version:
+            raise forms.ValidationError(
+                'This transaction was changed by someone else (e.g. a payment callback) since you opened it. '
+                'Reload the page to see the current values.'
+            )
+        return cleaned_data
+
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['id', 'initiated_by', 'amount', 'payment_method', 'status', 'created_at']
-    list_filter = ['payment_method', 'status', 'created_at', 'initiated_by']
-    search_fields = ['initiated_by__username', 'initiated_by__first_name', 'mpesa_checkout_request_id', 'paystack_reference']
-    readonly_fields = ['created_at', 'updated_at']
\ No newline at end of file
+    list_filter = ['payment_method', 'status', 'created_at', InitiatorFilter]
+    list_select_related = ['initiated_by']
+    search_fields = ['=mpesa_checkout_request_id', '=mpesa_receipt_number', '=paystack_reference', '=customer_identifier']
+    search_help_text = 'Exact checkout request ID, M-Pesa receipt, Paystack reference, phone number, email or transaction ID'
+    autocomplete_fields = ['initiated_by']
+    readonly_fields = ['created_at', 'updated_at', 'version', 'customer', 'daraja_account']
+    form = TransactionAdminForm
+
+    # Large-table settings: estimated counts, no second unfiltered COUNT(*), no facet counts
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Exact matches only, so each term is answered from the reference
+        and customer_key indexes instead of icontains scans across joins.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+
+        lookup = (
+            Q(mpesa_checkout_request_id=term) |
+            Q(paystack_reference=term) |
+            Q(mpesa_receipt_number=term.upper()) |
+            Q(customer_key=normalize_customer_identifier(term))
+        )
+        if term.isdigit():
+            lookup |= Q(pk=int(term))
+        return queryset.filter(lookup), False
+
+    def save_model(self, request, obj, form, change):
+        """
+        Edits only write the fields that changed, and a status change goes
+        through the same compare-and-set transition as the webhooks, checked
+        against the version the form was rendered with, so an admin save
+        cannot overwrite a status set in the meantime.
+        """
+        if not change:
+            return super().save_model(request, obj, form, change)
+
+        changed = [name for name in form.changed_data if name != 'status']
+        if changed:
+            obj.save(update_fields=changed + ['updated_at'])
+
+        if 'status' in form.changed_data:
+            new_status = obj.status
+            obj.status = form.initial['status']
+            # Compare against the version the admin saw, not the one re-read on POST
+            loaded_version = form.cleaned_data.get('loaded_version')
+            if loaded_version is not None:
+                obj.version = loaded_version
+            if not obj.transition_to(new_status):
+                request._transaction_save_refused = True
+                obj.refresh_from_db(fields=['status', 'version'])
+                messages.error(
+                    request,
+                    f"Status was not changed: {obj.get_status_display()} cannot move to "
+                    f"{dict(Transaction.STATUS_CHOICES)[new_status]} (or the transaction changed meanwhile)."
+                )
+
+
+    def message_user(self, request, message, level=messages.INFO, *args, **kwargs):
+        # No "changed successfully" after a refused status change
+        if level == messages.SUCCESS and getattr(request, '_transaction_save_refused', False):
+            return
+        super().message_user(request, message, level, *args, **kwargs)
+
+
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ['key', 'kind', 'payment_count', 'total_paid', 'last_payment_at']
+    list_filter = ['kind']
+    search_fields = ['=key']
+    search_help_text = 'Exact phone number or email'
+    readonly_fields = [
+        'key', 'kind', 'transaction_count', 'payment_count', 'total_paid',
+        'first_seen_at', 'last_payment_at', 'created_at', 'updated_at',
+    ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(key=normalize_customer_identifier(term)), False
+
+    def has_add_permission(self, request):
+        return False
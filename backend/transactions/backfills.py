@@ -0,0 +1,57 @@
+from jobs.backfill import backfill
+from .models import Customer, Transaction
+from .utils import callback_metadata_value, normalize_customer_identifier
+
+
+@backfill('transactions.customer_key', Transaction)
+def customer_key(transactions):
+    """
+    Recomputes customer_key from customer_identifier (legacy rows, rows
+    written by bulk_create or raw SQL, or after the normalization rules
+    change) and links each changed or unlinked row to its customer. The
+    customer aggregates (counts, total paid, first seen, last payment) move
+    with one grouped statement per chunk; updated_at is left alone, so the
+    change feed and snapshots do not see the rows as changed.
+    """
+    stale = [
+        pk for pk, identifier, key, customer_id in
+        transactions.values_list('pk', 'customer_identifier', 'customer_key', 'customer_id')
+        if normalize_customer_identifier(identifier) != key or (key and customer_id is None)
+    ]
+    if not stale:
+        return 0
+
+    changed = []
+    # Locked so a completion cannot be counted against the old customer meanwhile
+    rows = Transaction.objects.filter(pk__in=stale).select_for_update().only('pk', 'customer_identifier', 'customer_key', 'customer_id')
+    for transaction in rows.order_by('pk'):
+        key = normalize_customer_identifier(transaction.customer_identifier)
+        if key == transaction.customer_key and (not key or transaction.customer_id is not None):
+            continue
+        transaction.customer_key = key
+        changed.append(transaction)
+    Transaction.objects.bulk_update(changed, ['customer_key'])
+    Customer.objects.relink([transaction.pk for transaction in changed])
+    return len(changed)
+
+
+@backfill('transactions.mpesa_receipt_number', Transaction)
+def mpesa_receipt_number(transactions):
+    """
+    Copies the M-Pesa receipt number from stored STK callbacks (response_data)
+    into mpesa_receipt_number, for statement reconciliation. Neither the
+    change feed nor the snapshots carry the receipt number, so updated_at
+    is left alone.
+    """
+    changed = []
+    rows = transactions.filter(
+        payment_method='STK_PUSH', status='COMPLETED', mpesa_receipt_number__isnull=True
+    ).only('pk', 'response_data')
+    for transaction in rows:
+        stk_callback = ((transaction.response_data or {}).get('Body') or {}).get('stkCallback') or {}
+        receipt_number = callback_metadata_value(stk_callback, 'MpesaReceiptNumber')
+        if receipt_number:
+            transaction.mpesa_receipt_number = str(receipt_number)
+            changed.append(transaction)
+    Transaction.objects.bulk_update(changed, ['mpesa_receipt_number'])
+    return len(changed)
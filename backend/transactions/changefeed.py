@@ -0,0 +1,125 @@
+"""
+Change feed over transactions for downstream sync.
+
+Changes are read in (updated_at, id) order from the index, deletions in
+(deleted_at, id) order from the tombstone table, and merged into one page.
+The cursor is an opaque token holding the position in both streams.
+Changes newer than CHANGE_FEED_LAG_SECONDS are held back so that rows
+still being committed (with an earlier updated_at) cannot be skipped.
+Every status transition bumps updated_at, so it always shows up here.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import DeletedTransaction, Transaction
+
+CHANGE_COLUMNS = (
+    'id', 'status', 'version', 'amount', 'payment_method', 'initiated_by_id', 'customer_identifier',
+    'mpesa_checkout_request_id', 'paystack_reference', 'created_at', 'updated_at',
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(position):
+    payload = json.dumps({
+        stream: [timestamp.isoformat(), pk] if timestamp else None
+        for stream, (timestamp, pk) in position.items()
+    }, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns {'t': (updated_at, id), 'd': (deleted_at, id)}; (None, 0) means from the start."""
+    position = {'t': (None, 0), 'd': (None, 0)}
+    if not cursor:
+        return position
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        for stream in position:
+            if payload.get(stream):
+                timestamp, pk = payload[stream]
+                position[stream] = (datetime.fromisoformat(timestamp), int(pk))
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise InvalidCursor('Invalid cursor')
+    return position
+
+
+def after_position(queryset, column, position):
+    timestamp, pk = position
+    if timestamp is None:
+        return queryset
+    return queryset.extra(where=[f'({column}, id) > (%s, %s)'], params=[timestamp, pk])
+
+
+def fetch_changes(user, cursor, limit):
+    """
+    Returns (changes, next cursor, has_more) for at most `limit` changes
+    after `cursor`, restricted to the user's own transactions unless they
+    are a superuser.
+    """
+    position = decode_cursor(cursor)
+    horizon = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_LAG_SECONDS)
+
+    transactions = Transaction.objects.filter(updated_at__lt=horizon)
+    deletions = DeletedTransaction.objects.filter(deleted_at__lt=horizon)
+    if not user.is_superuser:
+        transactions = transactions.filter(initiated_by=user)
+        deletions = deletions.filter(initiated_by_id=user.pk)
+
+    updated = list(
+        after_position(transactions, 'updated_at', position['t'])
+        .order_by('updated_at', 'id')
+        .values_list(*CHANGE_COLUMNS)[:limit + 1]
+    )
+    deleted = list(
+        after_position(deletions, 'deleted_at', position['d'])
+        .order_by('deleted_at', 'id')
+        .values_list('id', 'transaction_id', 'deleted_at')[:limit + 1]
+    )
+
+    # Merge both streams in time order and keep the first `limit`
+    merged = sorted(
+        [(row[10], 't', row) for row in updated] + [(row[2], 'd', row) for row in deleted],
+        key=lambda item: (item[0], item[1], item[2][0]),
+    )
+    page, has_more = merged[:limit], len(merged) > limit
+
+    changes = []
+    for timestamp, stream, row in page:
+        if stream == 't':
+            (
+                pk, status, version, amount, method, initiated_by_id, customer_identifier,
+                checkout_request_id, paystack_reference, created_at, updated_at,
+            ) = row
+            changes.append({
+                'type': 'upsert',
+                'id': pk,
+                'status': status,
+                'version': version,
+                'amount': str(amount),
+                'payment_method': method,
+                'initiated_by_id': initiated_by_id,
+                'customer_identifier': customer_identifier,
+                'mpesa_checkout_request_id': checkout_request_id,
+                'paystack_reference': paystack_reference,
+                'created_at': created_at.isoformat(),
+                'updated_at': updated_at.isoformat(),
+            })
+            position['t'] = (updated_at, pk)
+        else:
+            tombstone_pk, transaction_id, deleted_at = row
+            changes.append({
+                'type': 'delete',
+                'id': transaction_id,
+                'deleted_at': deleted_at.isoformat(),
+            })
+            position['d'] = (deleted_at, tombstone_pk)
+
+    return changes, encode_cursor(position), has_more
@@ -0,0 +1,144 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Transaction
+from .utils import customer_identifier_prefix
+
+# Free-text terms shorter than this only match references exactly
+# (trigram indexes cannot help below three characters).
+MIN_PARTIAL_SEARCH_LENGTH = 3
+
+
+def _parse_choices(value, choices, name):
+    valid = dict(choices)
+    selected = [v.strip().upper() for v in value.split(',') if v.strip()]
+    invalid = [v for v in selected if v not in valid]
+    if invalid:
+        raise ValueError(f"Invalid {name}: {', '.join(invalid)}. Choose from {', '.join(valid)}")
+    return selected
+
+
+def parse_datetime_param(value, name, end=False):
+    """
+    Accepts an ISO 8601 date or datetime. A bare date used as an upper
+    bound includes the whole day.
+    """
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid {name}. Use ISO 8601 (e.g., 2026-02-01)")
+
+    if 'T' not in value and ' ' not in value.strip():
+        parsed = datetime.combine(parsed.date(), time.min)
+        if end:
+            parsed += timedelta(days=1)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_amount(value, name):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"Invalid {name}")
+
+
+def filter_transactions(queryset, params):
+    """
+    Applies search query parameters to a Transaction queryset.
+    Every filter maps onto an indexed column so lookups stay cheap on
+    large tables. Raises ValueError with a user-facing message.
+
+    Supported parameters:
+        status, method     comma-separated codes (e.g. COMPLETED,FAILED)
+        initiator          user id or username
+        start, end         ISO 8601 date/datetime bounds on created_at
+        min_amount, max_amount
+        customer           phone number or email (prefix match on the normalized form)
+        customer_id        Customer id (all payments from one customer)
+        q                  checkout request id, Paystack reference or customer identifier
+    """
+    status_param = params.get('status')
+    if status_param:
+        queryset = queryset.filter(
+            status__in=_parse_choices(status_param, Transaction.STATUS_CHOICES, 'status')
+        )
+
+    method_param = params.get('method')
+    if method_param:
+        queryset = queryset.filter(
+            payment_method__in=_parse_choices(method_param, Transaction.PAYMENT_METHOD_CHOICES, 'method')
+        )
+
+    initiator = params.get('initiator', '').strip()
+    if initiator:
+        if initiator.isdigit():
+            queryset = queryset.filter(initiated_by_id=int(initiator))
+        else:
+            queryset = queryset.filter(initiated_by__username=initiator)
+
+    start = params.get('start')
+    end = params.get('end')
+    start_at = parse_datetime_param(start, 'start') if start else None
+    end_at = parse_datetime_param(end, 'end', end=True) if end else None
+    if start_at and end_at and start_at >= end_at:
+        raise ValueError('Start date must be before end date')
+    if start_at:
+        queryset = queryset.filter(created_at__gte=start_at)
+    if end_at:
+        queryset = queryset.filter(created_at__lt=end_at)
+
+    min_amount = params.get('min_amount')
+    if min_amount:
+        queryset = queryset.filter(amount__gte=_parse_amount(min_amount, 'min_amount'))
+    max_amount = params.get('max_amount')
+    if max_amount:
+        queryset = queryset.filter(amount__lte=_parse_amount(max_amount, 'max_amount'))
+
+    customer = params.get('customer', '').strip()
+    if customer:
+        queryset = queryset.filter(customer_key__startswith=customer_identifier_prefix(customer))
+
+    customer_id = params.get('customer_id', '').strip()
+    if customer_id:
+        if not customer_id.isdigit():
+            raise ValueError('Invalid customer_id')
+        queryset = queryset.filter(customer_id=int(customer_id))
+
+    term = params.get('q', '').strip()
+    if term:
+        if len(term) >= MIN_PARTIAL_SEARCH_LENGTH:
+            queryset = queryset.filter(
+                Q(mpesa_checkout_request_id__icontains=term) |
+                Q(paystack_reference__icontains=term) |
+                Q(customer_identifier__icontains=term)
+            )
+        else:
+            queryset = queryset.filter(
+                Q(mpesa_checkout_request_id=term) | Q(paystack_reference=term)
+            )
+
+    return queryset
+
+
+def paginate(queryset, params, max_limit=500):
+    """
+    Optional limit/offset slicing. Without `limit` the full queryset is returned.
+    """
+    limit = params.get('limit')
+    offset = params.get('offset', '0')
+    if not limit:
+        return queryset
+    try:
+        limit = int(limit)
+        offset = int(offset)
+    except ValueError:
+        raise ValueError('limit and offset must be integers')
+    if limit <= 0 or offset < 0:
+        raise ValueError('limit must be positive and offset non-negative')
+    limit = min(limit, max_limit)
+    return queryset[offset:offset + limit]
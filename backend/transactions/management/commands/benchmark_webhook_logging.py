@@ -0,0 +1,139 @@
+import logging
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.logs import QueuedStreamHandler, StructuredFormatter, log_event
+
+FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+
+def daraja_payload():
+    return {
+        'Body': {
+            'stkCallback': {
+                'MerchantRequestID': '29115-34620561-1',
+                'CheckoutRequestID': 'ws_CO_191220191020363925',
+                'ResultCode': 0,
+                'ResultDesc': 'The service request is processed successfully.',
+                'CallbackMetadata': {
+                    'Item': [
+                        {'Name': 'Amount', 'Value': 1500.00},
+                        {'Name': 'MpesaReceiptNumber', 'Value': 'NLJ7RT61SV'},
+                        {'Name': 'TransactionDate', 'Value': 20191219102115},
+                        {'Name': 'PhoneNumber', 'Value': 254708374149},
+                    ]
+                },
+            }
+        }
+    }
+
+
+def paystack_event():
+    return {
+        'event': 'charge.success',
+        'data': {
+            'id': 302961,
+            'domain': 'live',
+            'status': 'success',
+            'reference': 'DEW-3f9a1c2b7d',
+            'amount': 150000,
+            'gateway_response': 'Approved',
+            'channel': 'card',
+            'currency': 'KES',
+            'metadata': {'transaction_id': 4821, 'custom_fields': [{'note': 'x' * 200}] * 10},
+            'log': {'history': [{'type': 'action', 'message': 'Attempted to pay', 'time': i} for i in range(50)]},
+            'customer': {'email': 'customer@example.com', 'customer_code': 'CUS_xnxdt6s1zg1f4nx'},
+            'authorization': {'authorization_code': 'AUTH_8dfhjjdt', 'card_type': 'visa', 'last4': '4081'},
+        },
+    }
+
+
+class SlowStream:
+    """Discards output but blocks on each write, like a busy pipe or log collector."""
+
+    def __init__(self, stream, latency):
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class Command(BaseCommand):
+    help = 'Measures the request-thread cost of webhook logging: f-strings + sync handler vs log_event + queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5000)
+        parser.add_argument(
+            '--write-latency', type=float, default=100,
+            help='Microseconds each write blocks in the second round (0 skips it)'
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        with open(os.devnull, 'w') as devnull:
+            self.stdout.write('Output to /dev/null:')
+            self.run_round(devnull, iterations)
+            if options['write_latency']:
+                self.stdout.write(f"Output blocking {options['write_latency']:g}us per write:")
+                self.run_round(SlowStream(devnull, options['write_latency'] / 1e6), iterations)
+
+    def run_round(self, stream, iterations):
+        sync_handler = logging.StreamHandler(stream)
+        sync_handler.setFormatter(logging.Formatter(FORMAT))
+        # Large enough that no record is dropped during a run
+        queued_handler = QueuedStreamHandler(stream, maxsize=iterations * 3)
+        queued_handler.setFormatter(StructuredFormatter(FORMAT))
+
+        before = self.make_logger('benchmark.webhook.before', sync_handler)
+        after = self.make_logger('benchmark.webhook.after', queued_handler)
+
+        try:
+            for level in (logging.WARNING, logging.INFO, logging.DEBUG):
+                before.setLevel(level)
+                after.setLevel(level)
+                for name, payload in (('daraja', daraja_payload()), ('paystack', paystack_event())):
+                    old = self.measure(self.log_before, before, payload, iterations)
+                    queued_handler.queue.join()
+                    new = self.measure(self.log_after, after, payload, iterations)
+                    queued_handler.queue.join()  # let the listener catch up between runs
+                    self.stdout.write(
+                        f"  {name:>8} level={logging.getLevelName(level):<7} "
+                        f"before={old:8.2f}us  after={new:8.2f}us  per webhook"
+                    )
+        finally:
+            queued_handler.stop()
+
+    def make_logger(self, name, handler):
+        logger = logging.getLogger(name)
+        logger.handlers = [handler]
+        logger.propagate = False
+        return logger
+
+    def measure(self, log, logger, payload, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            log(logger, payload)
+        return (time.perf_counter() - started) / iterations * 1e6
+
+    def log_before(self, logger, payload):
+        # What the webhooks used to do
+        logger.info("Received webhook")
+        logger.debug(f"Webhook payload: {payload}")
+        reference = 'ws_CO_191220191020363925'
+        logger.info(f"Webhook processed: {reference} -> COMPLETED (Code: 0)")
+
+    def log_after(self, logger, payload):
+        log_event(logger, logging.INFO, 'webhook.received', size=2048)
+        log_event(logger, logging.DEBUG, 'webhook.payload', payload=payload)
+        log_event(
+            logger, logging.INFO, 'webhook.processed',
+            reference='ws_CO_191220191020363925', status='COMPLETED', result_code=0,
+        )
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.snapshots import export_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Writes changed transactions to month-partitioned Parquet files for analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=settings.ANALYTICS_SNAPSHOT_DIR,
+            help='Snapshot directory (default: ANALYTICS_SNAPSHOT_DIR)'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Ignore the watermark and rebuild every month'
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise CommandError('export_snapshot requires pyarrow (pip install pyarrow)')
+
+        started = time.monotonic()
+        exported, removed, months, watermark = export_snapshot(
+            options['output'], full=options['full'], batch_size=options['batch_size']
+        )
+        elapsed = time.monotonic() - started
+
+        if not exported and not removed:
+            self.stdout.write('No changes since the last snapshot')
+            return
+        position = watermark['t']
+        self.stdout.write(
+            f"Exported {exported} rows and removed {removed} deleted rows in {len(months)} month(s) "
+            f"({', '.join(months)}) in {elapsed:.1f}s"
+            + (f"; watermark {position[0].isoformat()} #{position[1]}" if position else '')
+        )
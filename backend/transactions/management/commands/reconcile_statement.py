@@ -0,0 +1,63 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.reconciliation import (
+    DEFAULT_CHUNK_SIZE,
+    PROVIDERS,
+    ReconciliationReport,
+    reconcile_statement,
+)
+
+
+class Command(BaseCommand):
+    help = 'Reconciles an M-Pesa or Paystack settlement statement (CSV) against transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('statement', help='Path to the statement CSV')
+        parser.add_argument('--provider', required=True, choices=sorted(PROVIDERS))
+        parser.add_argument(
+            '--apply', action='store_true',
+            help='Correct status mismatches (amounts must agree) instead of only reporting them'
+        )
+        parser.add_argument('--start', help='Start of the orphan window (ISO date); defaults to the first matched row')
+        parser.add_argument('--end', help='End of the orphan window (ISO date); defaults to the last matched row')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--details', help='Write every discrepancy to this CSV file')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options['statement'], newline='', encoding='utf-8-sig') as statement:
+                report = reconcile_statement(
+                    statement,
+                    options['provider'],
+                    apply=options['apply'],
+                    start=options['start'],
+                    end=options['end'],
+                    chunk_size=options['chunk_size'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+
+        for outcome in ReconciliationReport.OUTCOMES:
+            self.stdout.write(f"{outcome:>16}: {report.counts[outcome]}")
+        if options['apply']:
+            self.stdout.write(f"{'corrected':>16}: {report.corrected}")
+        rate = report.lines / elapsed * 60 if elapsed else 0
+        self.stdout.write(f"Reconciled {report.lines} lines in {elapsed:.1f}s ({rate:,.0f} lines/min)")
+
+        if options['details']:
+            self.write_details(options['details'], report.details)
+            self.stdout.write(f"Wrote {len(report.details)} discrepancies to {options['details']}")
+
+    def write_details(self, path, details):
+        columns = []
+        for detail in details:
+            columns.extend(key for key in detail if key not in columns)
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(details)
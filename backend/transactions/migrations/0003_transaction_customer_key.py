@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-19 02:49
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0002_transaction_response_data'),
+    ]
+
+    # Schema only: existing rows are filled in afterwards, in small throttled
+    # chunks, by `python manage.py backfill transactions.customer_key`
+    # (a full-table update here would hold its row locks until the end).
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='transaction',
+            name='customer_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+    ]
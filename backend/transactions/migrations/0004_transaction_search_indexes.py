@@ -0,0 +1,50 @@
+# Generated by Django 5.2.10 on 2026-10-19 02:49
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so payments keep flowing on large tables
+    atomic = False
+
+    dependencies = [
+        ('transactions', '0003_transaction_customer_key'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['status', '-created_at'], name='transaction_status_4b1739_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['amount'], name='transaction_amount_7195ec_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['mpesa_checkout_request_id'], name='transaction_mpesa_c_ceeaa5_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['paystack_reference'], name='transaction_paystac_4f5d66_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['customer_key'], name='transaction_customer_key_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('mpesa_checkout_request_id'), name='gin_trgm_ops'), name='transaction_mpesa_ref_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('paystack_reference'), name='gin_trgm_ops'), name='transaction_paystack_ref_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('customer_identifier'), name='gin_trgm_ops'), name='transaction_customer_trgm'),
+        ),
+    ]
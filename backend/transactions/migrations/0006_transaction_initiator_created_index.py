@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-19 03:04
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('transactions', '0005_transaction_status_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['initiated_by', '-created_at'], name='transaction_initiat_d55cee_idx'),
+        ),
+    ]
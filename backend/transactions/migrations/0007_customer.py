@@ -0,0 +1,43 @@
+# Generated by Django 5.2.10 on 2026-10-19 03:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Schema only: customers are created and linked, with their lifetime
+    # aggregates, by `manage.py backfill transactions.customer_key`
+
+    dependencies = [
+        ('transactions', '0006_transaction_initiator_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('kind', models.CharField(choices=[('PHONE', 'Phone'), ('EMAIL', 'Email')], max_length=10)),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('first_seen_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_payment_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-total_paid'],
+                'indexes': [models.Index(fields=['-total_paid'], name='customer_total_paid_idx'), models.Index(fields=['-last_payment_at'], name='customer_last_payment_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='customer',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='transactions.customer'),
+        ),
+    ]
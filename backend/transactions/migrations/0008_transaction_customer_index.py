@@ -0,0 +1,19 @@
+# Generated by Django 5.2.10 on 2026-10-19 03:06
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('transactions', '0007_customer'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['customer', '-created_at'], name='transaction_custome_8b8f5a_idx'),
+        ),
+    ]
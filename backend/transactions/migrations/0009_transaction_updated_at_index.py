@@ -0,0 +1,19 @@
+# Generated by Django 5.2.10 on 2026-10-19 03:08
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('transactions', '0008_transaction_customer_index'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['updated_at', 'id'], name='transaction_updated_f4b4af_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.10 on 2026-10-19 03:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0009_transaction_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_id', models.BigIntegerField()),
+                ('initiated_by_id', models.IntegerField(null=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at', 'id'], name='transaction_deleted_feb933_idx')],
+            },
+        ),
+    ]
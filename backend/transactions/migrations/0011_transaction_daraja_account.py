@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0010_deletedtransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='daraja_account',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.10 on 2026-10-19 03:29
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('transactions', '0011_transaction_daraja_account'),
+    ]
+
+    # Existing receipts are copied from response_data afterwards by
+    # `python manage.py backfill transactions.mpesa_receipt_number`.
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='mpesa_receipt_number',
+            field=models.CharField(blank=True, max_length=30, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['mpesa_receipt_number'], name='transaction_mpesa_r_aace8a_idx'),
+        ),
+    ]
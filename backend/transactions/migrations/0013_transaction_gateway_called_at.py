@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0012_transaction_mpesa_receipt_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='gateway_called_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
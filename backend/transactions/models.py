@@ -1,6 +1,249 @@
-from django.db import models
+from django.db import connection, connections, models, transaction as db_transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.sql import UpdateQuery
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.utils import timezone
+from .utils import normalize_customer_identifier
+
+class CustomerManager(models.Manager):
+    def record_transaction(self, key):
+        """
+        Creates the customer for `key` or counts one more transaction
+        against it, in a single upsert. Returns the customer id.
+        """
+        now = timezone.now()
+        kind = Customer.EMAIL if '@' in key else Customer.PHONE
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Customer._meta.db_table}
+                    (key, kind, transaction_count, payment_count, total_paid, first_seen_at, created_at, updated_at)
+                VALUES (%s, %s, 1, 0, 0, %s, %s, %s)
+                ON CONFLICT (key) DO UPDATE
+                    SET transaction_count = {Customer._meta.db_table}.transaction_count + 1,
+                        updated_at = EXCLUDED.updated_at
+                RETURNING id
+                """,
+                [key, kind, now, now, now]
+            )
+            return cursor.fetchone()[0]
+
+    def record_payments(self, payments, paid_at, using='default'):
+        """
+        Adds completed payments to the lifetime aggregates in one UPDATE.
+        `payments` maps customer id -> (amount, count).
+        """
+        if not payments:
+            return
+        values = ', '.join(['(%s, %s::numeric, %s)'] * len(payments))
+        # In id order, so concurrent completions lock customers in the same order
+        params = [value for pk, (amount, count) in sorted(payments.items()) for value in (pk, amount, count)]
+        table = Customer._meta.db_table
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table} AS c
+                SET total_paid = c.total_paid + v.amount,
+                    payment_count = c.payment_count + v.count,
+                    last_payment_at = GREATEST(c.last_payment_at, %s),
+                    updated_at = %s
+                FROM (VALUES {values}) AS v (id, amount, count)
+                WHERE c.id = v.id
+                """,
+                [paid_at, paid_at, *params]
+            )
+
+    def relink(self, transaction_ids, using='default'):
+        """
+        Moves the given transactions from the customer they are linked to
+        (if any) to the customer of their current customer_key, creating it
+        if needed. Aggregates move with one grouped statement per side, and
+        new customers get first_seen_at and last_payment_at from the
+        transactions' own timestamps. Run it in the transaction that locked
+        and re-keyed the rows.
+        """
+        if not transaction_ids:
+            return
+        customers = Customer._meta.db_table
+        transactions = Transaction._meta.db_table
+        ids = list(transaction_ids)
+        now = timezone.now()
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {customers} AS c
+                SET transaction_count = c.transaction_count - v.transactions,
+                    payment_count = c.payment_count - v.payments,
+                    total_paid = c.total_paid - v.paid,
+                    updated_at = %s
+                FROM (
+                    SELECT customer_id,
+                           COUNT(*) AS transactions,
+                           COUNT(*) FILTER (WHERE status = 'COMPLETED') AS payments,
+                           COALESCE(SUM(amount) FILTER (WHERE status = 'COMPLETED'), 0) AS paid
+                    FROM {transactions}
+                    WHERE id = ANY(%s) AND customer_id IS NOT NULL
+                    GROUP BY customer_id
+                ) AS v
+                WHERE c.id = v.customer_id
+                """,
+                [now, ids]
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {customers} AS c
+                    (key, kind, transaction_count, payment_count, total_paid,
+                     first_seen_at, last_payment_at, created_at, updated_at)
+                SELECT customer_key,
+                       CASE WHEN customer_key LIKE '%%@%%' THEN 'EMAIL' ELSE 'PHONE' END,
+                       COUNT(*),
+                       COUNT(*) FILTER (WHERE status = 'COMPLETED'),
+                       COALESCE(SUM(amount) FILTER (WHERE status = 'COMPLETED'), 0),
+                       MIN(created_at),
+                       MAX(updated_at) FILTER (WHERE status = 'COMPLETED'),
+                       %s, %s
+                FROM {transactions}
+                WHERE id = ANY(%s) AND customer_key <> ''
+                GROUP BY customer_key
+                ON CONFLICT (key) DO UPDATE
+                    SET transaction_count = c.transaction_count + EXCLUDED.transaction_count,
+                        payment_count = c.payment_count + EXCLUDED.payment_count,
+                        total_paid = c.total_paid + EXCLUDED.total_paid,
+                        first_seen_at = LEAST(c.first_seen_at, EXCLUDED.first_seen_at),
+                        last_payment_at = GREATEST(c.last_payment_at, EXCLUDED.last_payment_at),
+                        updated_at = EXCLUDED.updated_at
+                """,
+                [now, now, ids]
+            )
+            cursor.execute(
+                f"""
+                UPDATE {transactions} AS t
+                SET customer_id = c.id
+                FROM {customers} AS c
+                WHERE t.id = ANY(%s) AND c.key = t.customer_key
+                """,
+                [ids]
+            )
+            cursor.execute(
+                f"UPDATE {transactions} SET customer_id = NULL WHERE id = ANY(%s) AND customer_key = ''",
+                [ids]
+            )
+
+    def adjust(self, customer_id, transactions=0, payments=0, paid=0, paid_at=None):
+        """
+        Adds to (negative values take back from) one customer's aggregates,
+        when a transaction is re-linked, re-priced or deleted.
+        """
+        changes = {
+            'transaction_count': F('transaction_count') + transactions,
+            'payment_count': F('payment_count') + payments,
+            'total_paid': F('total_paid') + paid,
+            'updated_at': timezone.now(),
+        }
+        if paid_at:
+            changes['last_payment_at'] = Greatest(F('last_payment_at'), paid_at)
+        self.filter(pk=customer_id).update(**changes)
+
+
+class Customer(models.Model):
+    """
+    One payer, keyed by the normalized phone (254XXXXXXXXX) or lower-cased
+    email. Lifetime aggregates are maintained as transactions are created,
+    completed, edited (customer_identifier/amount) and deleted, so lookups
+    and rankings never scan transactions. Bulk queryset updates of those
+    fields bypass this and need `manage.py backfill` to re-link.
+    """
+    PHONE = 'PHONE'
+    EMAIL = 'EMAIL'
+    KIND_CHOICES = [
+        (PHONE, 'Phone'),
+        (EMAIL, 'Email'),
+    ]
+
+    key = models.CharField(max_length=50, unique=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+
+    # Lifetime aggregates
+    transaction_count = models.IntegerField(default=0)   # every attempt
+    payment_count = models.IntegerField(default=0)       # completed only
+    total_paid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    first_seen_at = models.DateTimeField(default=timezone.now)
+    last_payment_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CustomerManager()
+
+    class Meta:
+        ordering = ['-total_paid']
+        indexes = [
+            # Top-customer reports
+            models.Index(fields=['-total_paid'], name='customer_total_paid_idx'),
+            models.Index(fields=['-last_payment_at'], name='customer_last_payment_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.payment_count} payments, {self.total_paid})"
+
+
+class TransactionQuerySet(models.QuerySet):
+    def transition(self, new_status, **changes):
+        """
+        Compare-and-set status change in a single UPDATE: only rows whose
+        current status may move to `new_status` are touched, so illegal
+        transitions are rejected by the WHERE clause rather than an extra
+        read. Returns the number of rows changed.
+
+        Completions also update the customer aggregates: the UPDATE returns
+        the rows it changed, and exactly those are counted, in the same
+        short database transaction.
+        """
+        candidates = self.filter(status__in=Transaction.sources_for(new_status))
+        now = timezone.now()
+        if new_status != 'COMPLETED':
+            return candidates.update(
+                status=new_status,
+                version=F('version') + 1,
+                updated_at=now,
+                **changes
+            )
+
+        # A write even when called from a GET: resolve the alias through
+        # db_for_write so it never lands on a read replica
+        candidates._for_write = True
+        using = candidates.db
+        with db_transaction.atomic(using=using):
+            rows = candidates._update_returning(
+                {'status': new_status, 'version': F('version') + 1, 'updated_at': now, **changes},
+                returning=['id', 'customer_id', 'amount'],
+            )
+            payments = {}
+            for _, customer_id, amount in rows:
+                if customer_id is not None:
+                    total, count = payments.get(customer_id, (0, 0))
+                    payments[customer_id] = (total + amount, count + 1)
+            Customer.objects.record_payments(payments, now, using=using)
+        return len(rows)
+
+    def _update_returning(self, values, returning):
+        """update(**values) that returns the `returning` columns of the rows it changed."""
+        self._for_write = True
+        query = self.query.chain(UpdateQuery)
+        query.add_update_values(values)
+        compiler = query.get_compiler(self.db)
+        compiler.pre_sql_setup()
+        statement, params = compiler.as_sql()
+        if not statement:
+            return []
+        quote = connections[self.db].ops.quote_name
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(f"{statement} RETURNING {', '.join(quote(column) for column in returning)}", params)
+            return cursor.fetchall()
+
 
 class Transaction(models.Model):
     PAYMENT_METHOD_CHOICES = [
@@ -13,8 +256,24 @@ class Transaction(models.Model):
         ('PROCESSING', 'Processing'),
         ('COMPLETED', 'Completed'),
         ('FAILED', 'Failed'),
+        ('CANCELLED', 'Cancelled'),
+        ('TIMEOUT', 'Timeout'),
     ]
 
+    # Allowed status changes. COMPLETED is final; a late success may still
+    # settle a payment that was recorded as failed, cancelled or timed out.
+    STATUS_TRANSITIONS = {
+        'PENDING': {'PROCESSING', 'COMPLETED', 'FAILED', 'CANCELLED', 'TIMEOUT'},
+        'PROCESSING': {'COMPLETED', 'FAILED', 'CANCELLED', 'TIMEOUT'},
+        'FAILED': {'COMPLETED'},
+        'CANCELLED': {'COMPLETED'},
+        'TIMEOUT': {'COMPLETED'},
+        'COMPLETED': set(),
+    }
+
+    # Payments still waiting for the customer or the gateway
+    OPEN_STATUSES = ('PENDING', 'PROCESSING')
+
     # Who initiated this transaction
     initiated_by = models.ForeignKey(
         User,
@@ -26,10 +285,18 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    # Bumped on every status transition (optimistic concurrency)
+    version = models.IntegerField(default=0, editable=False)
 
     # External reference IDs (from MPesa or Paystack)
     mpesa_checkout_request_id = models.CharField(max_length=100, blank=True, null=True)  # For STK Push
+    mpesa_receipt_number = models.CharField(max_length=30, blank=True, null=True)       # Set by the STK callback on success
     paystack_reference = models.CharField(max_length=100, blank=True, null=True)         # For Paystack
+    # Daraja credential set the STK Push was sent with (status queries must use the same one)
+    daraja_account = models.CharField(max_length=50, blank=True, default='')
+    # Set (and committed) just before the gateway is called, so a retried job
+    # can tell that an earlier attempt may already have reached it
+    gateway_called_at = models.DateTimeField(blank=True, null=True, editable=False)
 
     response_data = models.JSONField(default=dict, blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
@@ -37,18 +304,143 @@ class Transaction(models.Model):
 
     # Optional: phone number or email used in payment
     customer_identifier = models.CharField(max_length=50, blank=True, help_text="Phone (for MPesa) or Email (for Paystack)")
+    # Normalized form of customer_identifier used for indexed lookups (254XXXXXXXXX or lower-cased email)
+    customer_key = models.CharField(max_length=50, blank=True, default='', editable=False)
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=False,  # covered by the (customer, -created_at) index
+        related_name='transactions'
+    )
 
     # Timestamps
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TransactionQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['initiated_by', 'status']),
+            models.Index(fields=['initiated_by', '-created_at']),
+            models.Index(fields=['customer', '-created_at']),
+            # Incremental sync/export walks (updated_at, id) from a watermark
+            models.Index(fields=['updated_at', 'id']),
             models.Index(fields=['payment_method', 'status']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['status', '-created_at']),
+            models.Index(fields=['amount']),
+            # Exact reference lookups (webhooks, verification, search)
+            models.Index(fields=['mpesa_checkout_request_id']),
+            models.Index(fields=['mpesa_receipt_number']),  # M-Pesa statements are keyed on the receipt
+            models.Index(fields=['paystack_reference']),
+            # Equality and prefix (LIKE 'x%') matches on the normalized identifier
+            models.Index(fields=['customer_key'], opclasses=['varchar_pattern_ops'], name='transaction_customer_key_idx'),
+            # Partial (icontains) matches for free-text search
+            GinIndex(OpClass(Upper('mpesa_checkout_request_id'), name='gin_trgm_ops'), name='transaction_mpesa_ref_trgm'),
+            GinIndex(OpClass(Upper('paystack_reference'), name='gin_trgm_ops'), name='transaction_paystack_ref_trgm'),
+            GinIndex(OpClass(Upper('customer_identifier'), name='gin_trgm_ops'), name='transaction_customer_trgm'),
+        ]
+
+    # Edits of these fields move the transaction between customer aggregates
+    CUSTOMER_AGGREGATE_FIELDS = {'customer_identifier', 'amount'}
+
+    def save(self, *args, **kwargs):
+        self.customer_key = normalize_customer_identifier(self.customer_identifier)
+        update_fields = kwargs.get('update_fields')
+        using = kwargs.get('using') or 'default'
+        if update_fields is not None and 'customer_identifier' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'customer_key', 'customer'}
+        if self._state.adding and self.customer_id is None and self.customer_key:
+            with db_transaction.atomic(using=using):
+                self.customer_id = Customer.objects.record_transaction(self.customer_key)
+                super().save(*args, **kwargs)
+        elif not self._state.adding and (update_fields is None or self.CUSTOMER_AGGREGATE_FIELDS & set(update_fields)):
+            with db_transaction.atomic(using=using):
+                self._move_customer_aggregates(using)
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+
+    def _move_customer_aggregates(self, using):
+        """
+        Takes this transaction out of the aggregates of the customer it is
+        stored against and adds it to those of its (possibly new) customer,
+        if customer_identifier or amount is being changed. The row is
+        locked so a completion cannot slip in between.
+        """
+        stored = (
+            Transaction.objects.using(using).select_for_update()
+            .filter(pk=self.pk).values_list('customer_id', 'customer_key', 'amount', 'status', 'updated_at').first()
+        )
+        if stored is None:
+            return
+        customer_id, customer_key, amount, status, updated_at = stored
+        completed = status == 'COMPLETED'
+        if customer_key == self.customer_key:
+            if completed and customer_id is not None and amount != self.amount:
+                Customer.objects.adjust(customer_id, paid=self.amount - amount)
+            return
+
+        if customer_id is not None:
+            Customer.objects.adjust(
+                customer_id, transactions=-1, payments=-int(completed), paid=-amount if completed else 0
+            )
+        self.customer_id = Customer.objects.record_transaction(self.customer_key) if self.customer_key else None
+        if completed and self.customer_id is not None:
+            Customer.objects.adjust(self.customer_id, payments=1, paid=self.amount, paid_at=updated_at)
+
+    @classmethod
+    def sources_for(cls, new_status):
+        """Statuses that are allowed to move to `new_status`."""
+        return [source for source, targets in cls.STATUS_TRANSITIONS.items() if new_status in targets]
+
+    @property
+    def is_final(self):
+        """True once no further status change is allowed."""
+        return not self.STATUS_TRANSITIONS.get(self.status)
+
+    def transition_to(self, new_status, **changes):
+        """
+        Moves this transaction to `new_status` if the row is still at the
+        version that was loaded and the transition is allowed. Never takes
+        a row lock. Returns True on success; on False the instance is left
+        as it was (refresh it to see the winning write).
+        """
+        if new_status not in self.STATUS_TRANSITIONS.get(self.status, ()):
+            return False
+
+        updated = Transaction.objects.filter(pk=self.pk, version=self.version).transition(new_status, **changes)
+        if not updated:
+            return False
+
+        self.status = new_status
+        self.version += 1
+        for field, value in changes.items():
+            setattr(self, field, value)
+        return True
+
+    def __str__(self):
+        return f"{self.get_payment_method_display()} - {self.amount} ({self.get_status_display()}) by {self.initiated_by.first_name or self.initiated_by.username}"
+
+
+class DeletedTransaction(models.Model):
+    """
+    Tombstone left behind when a transaction is deleted, so the change
+    feed can report deletions. Written by a post_delete signal.
+    """
+    transaction_id = models.BigIntegerField()
+    initiated_by_id = models.IntegerField(null=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id']),
         ]
 
     def __str__(self):
-        return f"{self.get_payment_method_display()} - {self.amount} ({self.get_status_display()}) by {self.initiated_by.first_name or self.initiated_by.username}"
\ No newline at end of file
+        return f"Transaction {self.transaction_id} deleted at {self.deleted_at}"
@@ -0,0 +1,127 @@
+"""
+Gateway calls for a newly created Transaction, shared by the inline
+request path and the background job, and Paystack verification.
+"""
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.coalesce import coalesce
+from .models import Transaction
+from .utils import (
+    send_stk_push,
+    initialize_paystack_transaction,
+    normalize_phone_number,
+    verify_paystack_transaction
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Paystack charge status -> our status; anything else (ongoing, pending,
+# abandoned...) may still settle and leaves the row as it is
+PAYSTACK_OUTCOMES = {
+    'success': 'COMPLETED',
+    'failed': 'FAILED',
+    'reversed': 'FAILED',
+}
+
+
+class GatewayUnavailable(Exception):
+    """The gateway gave no response (network error, timeout), so the call can be retried."""
+
+
+def start_gateway_payment(transaction, retry_on_unavailable=False):
+    """
+    Calls the payment gateway for a PENDING transaction and records the
+    outcome on the row. Returns the gateway result dict.
+
+    With retry_on_unavailable, a call the gateway marked `retryable` (it
+    certainly never reached the gateway: connection refused, quota
+    exceeded) raises GatewayUnavailable instead of marking the transaction
+    FAILED. Anything else, such as a read timeout, may already have
+    reached the gateway and is not retried.
+
+    The call is first claimed by setting gateway_called_at on the row, so
+    it is made at most once per transaction (see check_in_flight_payment).
+    """
+    now = timezone.now()
+    claimed = Transaction.objects.filter(
+        pk=transaction.pk, status='PENDING', gateway_called_at__isnull=True
+    ).update(gateway_called_at=now, updated_at=now)
+    if not claimed:
+        return {'success': False, 'error': 'The gateway was already called for this transaction'}
+    transaction.gateway_called_at = now
+
+    if transaction.payment_method == 'STK_PUSH':
+        phone = normalize_phone_number(transaction.customer_identifier)
+        result = send_stk_push(phone, float(transaction.amount), transaction.id)
+    else:
+        result = initialize_paystack_transaction(
+            email=transaction.customer_identifier.strip(),
+            amount=transaction.amount,
+            reference=transaction.paystack_reference
+        )
+
+    if not result.get('success') and retry_on_unavailable and result.get('retryable'):
+        # Never reached the gateway: a retry may call it again
+        Transaction.objects.filter(pk=transaction.pk).update(gateway_called_at=None)
+        transaction.gateway_called_at = None
+        raise GatewayUnavailable(result.get('error'))
+
+    if result.get('success'):
+        transaction.response_data = result
+        if transaction.payment_method == 'STK_PUSH':
+            transaction.mpesa_checkout_request_id = result.get('CheckoutRequestID')
+            transaction.daraja_account = result.get('account', '')
+        transaction.save(update_fields=['mpesa_checkout_request_id', 'daraja_account', 'response_data', 'updated_at'])
+    else:
+        transaction.transition_to('FAILED', response_data=result, daraja_account=result.get('account', ''))
+    return result
+
+
+def check_in_flight_payment(transaction):
+    """
+    Settles a PENDING transaction whose gateway call was started by a worker
+    that died before recording the response, without calling the gateway
+    again (an STK push would prompt the customer twice). Paystack is asked
+    by reference; an STK push cannot be queried without the
+    CheckoutRequestID it returned, so it is left for the callback and the
+    statement reconciliation. Returns the Paystack verify result, if any.
+    """
+    if transaction.payment_method != 'PAYSTACK':
+        logger.warning(
+            "Transaction %s: STK push may have been sent by an interrupted attempt; not resending",
+            transaction.id
+        )
+        return None
+
+    result = verify_paystack_reference(transaction.paystack_reference)
+    if not result.get('success'):
+        if 'status_code' not in result:
+            raise GatewayUnavailable(result.get('error'))
+        logger.warning(
+            "Transaction %s: Paystack has no verifiable charge after an interrupted attempt (%s)",
+            transaction.id, result.get('error')
+        )
+        return result
+
+    new_status = PAYSTACK_OUTCOMES.get(result['data'].get('data', {}).get('status'))
+    if new_status:
+        transaction.transition_to(new_status, response_data=result['data'])
+    return result
+
+
+def verify_paystack_reference(reference):
+    """
+    verify_paystack_transaction() with concurrent calls for the same
+    reference coalesced into one request, and successful answers cached
+    for PAYSTACK_VERIFY_CACHE_SECONDS so polling loops reuse them.
+    """
+    return coalesce(
+        f'paystack-verify:{reference}',
+        lambda: verify_paystack_transaction(reference),
+        result_ttl=settings.PAYSTACK_VERIFY_CACHE_SECONDS,
+        cacheable=lambda result: result.get('success'),
+    )
@@ -0,0 +1,252 @@
+"""
+Settlement statement reconciliation.
+
+A statement (CSV export from M-Pesa or Paystack) is read as a stream and
+matched against Transaction rows a chunk at a time: the references of each
+chunk are loaded with one indexed query into a dict and joined in memory,
+so the database sees one query per chunk rather than one per line.
+"""
+import csv
+from decimal import Decimal, InvalidOperation
+
+from .filters import parse_datetime_param
+from .models import Transaction
+
+# provider -> (payment_method, reference field). M-Pesa statements list
+# the receipt number (e.g. NLJ7RT61SV), which the STK callback records; a
+# payment whose callback never arrived has none and is reported as missing.
+PROVIDERS = {
+    'mpesa': ('STK_PUSH', 'mpesa_receipt_number'),
+    'paystack': ('PAYSTACK', 'paystack_reference'),
+}
+
+# Accepted header names (compared lower-cased, with spaces and dashes as underscores)
+REFERENCE_COLUMNS = (
+    'reference', 'receipt_no', 'receipt_number', 'mpesa_receipt_number', 'mpesareceiptnumber',
+    'transaction_reference', 'ref',
+)
+AMOUNT_COLUMNS = ('amount', 'paid_in', 'amount_paid')
+STATUS_COLUMNS = ('status', 'transaction_status', 'result')
+
+SUCCESS_STATUSES = {'success', 'successful', 'completed', 'paid', 'settled'}
+FAILURE_STATUSES = {'failed', 'failure', 'reversed', 'abandoned', 'cancelled', 'declined'}
+
+# Our statuses that agree with a statement line saying the payment failed
+UNPAID_STATUSES = ('FAILED', 'CANCELLED', 'TIMEOUT')
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class StatementError(ValueError):
+    pass
+
+
+class ReconciliationReport:
+    """
+    Counts per outcome plus the discrepant rows. `detail_limit` caps how many
+    discrepancies are kept (None keeps all); counts are always complete.
+    """
+    OUTCOMES = (
+        'matched', 'missing', 'amount_mismatch', 'status_mismatch', 'unknown_status', 'duplicate', 'invalid', 'orphan',
+    )
+
+    def __init__(self, detail_limit=None):
+        self.detail_limit = detail_limit
+        self.counts = dict.fromkeys(self.OUTCOMES, 0)
+        self.details = []
+        self.lines = 0
+        self.corrected = 0
+        self.window = None
+
+    def add(self, outcome, **detail):
+        self.counts[outcome] += 1
+        if outcome != 'matched' and (self.detail_limit is None or len(self.details) < self.detail_limit):
+            self.details.append({'outcome': outcome, **detail})
+
+    def as_dict(self):
+        return {
+            'lines': self.lines,
+            'counts': self.counts,
+            'corrected': self.corrected,
+            'orphan_window': self.window and [bound.isoformat() for bound in self.window],
+            'details': self.details,
+            'details_truncated': self.detail_limit is not None and len(self.details) < sum(
+                count for outcome, count in self.counts.items() if outcome != 'matched'
+            ),
+        }
+
+
+def _normalize_header(name):
+    return name.strip().lower().replace(' ', '_').replace('-', '_').replace('.', '')
+
+
+def _find_column(header, candidates, required=True):
+    for candidate in candidates:
+        if candidate in header:
+            return header.index(candidate)
+    if required:
+        raise StatementError(f"Statement has no {candidates[0]} column (accepted: {', '.join(candidates)})")
+    return None
+
+
+def _parse_amount(value):
+    return Decimal(value.replace(',', '').strip())
+
+
+def _statement_status(value):
+    """Our status for a statement status, or None if it is not one we know."""
+    value = value.strip().lower()
+    if value in SUCCESS_STATUSES:
+        return 'COMPLETED'
+    if value in FAILURE_STATUSES:
+        return 'FAILED'
+    return None
+
+
+def _statuses_agree(statement_status, db_status):
+    if statement_status == 'FAILED':
+        return db_status in UNPAID_STATUSES
+    return statement_status == db_status
+
+
+def reconcile_statement(lines, provider, apply=False, start=None, end=None,
+                        chunk_size=DEFAULT_CHUNK_SIZE, detail_limit=None):
+    """
+    Reconciles a CSV statement (any iterable of text lines) for `provider`.
+
+    Each statement line is classified as matched, missing (no transaction
+    with that reference), amount_mismatch, status_mismatch (the statement
+    and the transaction disagree on whether it was paid, including a
+    payment we hold as COMPLETED that the statement failed or reversed),
+    unknown_status (a statement status we do not recognise, such as
+    pending), duplicate or invalid. Completed transactions inside the orphan window that never
+    appeared in the statement are reported as orphans; the window is
+    `start`/`end` (ISO dates) or, by default, the span of the matched rows.
+
+    Lines without a status column count as settled. With `apply`, status
+    mismatches on transactions still PENDING or PROCESSING whose amount
+    agrees are corrected in one UPDATE per chunk through the normal
+    transition rules; the others are only reported, for manual review.
+    """
+    if provider not in PROVIDERS:
+        raise StatementError(f"Unknown provider: {provider}. Choose from {', '.join(PROVIDERS)}")
+    payment_method, reference_field = PROVIDERS[provider]
+    start_at = parse_datetime_param(start, 'start') if start else None
+    end_at = parse_datetime_param(end, 'end', end=True) if end else None
+
+    reader = csv.reader(lines)
+    try:
+        header = [_normalize_header(name) for name in next(reader)]
+    except StopIteration:
+        raise StatementError('Statement is empty')
+    reference_index = _find_column(header, REFERENCE_COLUMNS)
+    amount_index = _find_column(header, AMOUNT_COLUMNS)
+    status_index = _find_column(header, STATUS_COLUMNS, required=False)
+
+    report = ReconciliationReport(detail_limit)
+    queryset = Transaction.objects.filter(payment_method=payment_method)
+    seen = set()
+    first_matched = last_matched = None
+
+    chunk = []
+    for line_number, row in enumerate(reader, start=2):
+        report.lines += 1
+        chunk.append((line_number, row))
+        if len(chunk) >= chunk_size:
+            first_matched, last_matched = _reconcile_chunk(
+                chunk, queryset, reference_field, reference_index, amount_index, status_index,
+                seen, report, apply, first_matched, last_matched,
+            )
+            chunk = []
+    if chunk:
+        first_matched, last_matched = _reconcile_chunk(
+            chunk, queryset, reference_field, reference_index, amount_index, status_index,
+            seen, report, apply, first_matched, last_matched,
+        )
+
+    window_start = start_at or first_matched
+    window_end = end_at or last_matched
+    if window_start and window_end:
+        report.window = (window_start, window_end)
+        orphans = (
+            queryset
+            .filter(status='COMPLETED', created_at__gte=window_start, created_at__lte=window_end)
+            .values_list('id', reference_field, 'amount', 'created_at')
+            .iterator(chunk_size=chunk_size)
+        )
+        for pk, reference, amount, created_at in orphans:
+            if reference not in seen:
+                report.add(
+                    'orphan', transaction_id=pk, reference=reference,
+                    amount=str(amount), created_at=created_at.isoformat(),
+                )
+
+    return report
+
+
+def _reconcile_chunk(chunk, queryset, reference_field, reference_index, amount_index, status_index,
+                     seen, report, apply, first_matched, last_matched):
+    parsed = []
+    for line_number, row in chunk:
+        try:
+            reference = row[reference_index].strip()
+            amount = _parse_amount(row[amount_index])
+            statement_status = _statement_status(row[status_index]) if status_index is not None else 'COMPLETED'
+        except (IndexError, InvalidOperation):
+            report.add('invalid', line=line_number)
+            continue
+        if not reference:
+            report.add('invalid', line=line_number)
+            continue
+        if reference in seen:
+            report.add('duplicate', line=line_number, reference=reference)
+            continue
+        seen.add(reference)
+        if statement_status is None:
+            # e.g. 'pending' or a typo: neither a match nor a mismatch we can judge
+            report.add('unknown_status', line=line_number, reference=reference, statement_status=row[status_index].strip())
+            continue
+        parsed.append((line_number, reference, amount, statement_status))
+
+    # Hash join: one indexed query for the whole chunk
+    found = {
+        row[0]: row[1:]
+        for row in queryset
+        .filter(**{f'{reference_field}__in': [reference for _, reference, _, _ in parsed]})
+        .values_list(reference_field, 'id', 'amount', 'status', 'created_at')
+    }
+
+    corrections = {'COMPLETED': [], 'FAILED': []}
+    for line_number, reference, amount, statement_status in parsed:
+        match = found.get(reference)
+        if match is None:
+            report.add('missing', line=line_number, reference=reference, statement_amount=str(amount))
+            continue
+
+        pk, db_amount, db_status, created_at = match
+        if first_matched is None or created_at < first_matched:
+            first_matched = created_at
+        if last_matched is None or created_at > last_matched:
+            last_matched = created_at
+
+        if amount != db_amount:
+            report.add(
+                'amount_mismatch', line=line_number, reference=reference, transaction_id=pk,
+                statement_amount=str(amount), amount=str(db_amount),
+            )
+        elif not _statuses_agree(statement_status, db_status):
+            report.add(
+                'status_mismatch', line=line_number, reference=reference, transaction_id=pk,
+                statement_status=statement_status, status=db_status,
+            )
+            if db_status in Transaction.OPEN_STATUSES:
+                corrections[statement_status].append(pk)
+        else:
+            report.add('matched')
+
+    if apply:
+        for new_status, ids in corrections.items():
+            if ids:
+                report.corrected += Transaction.objects.filter(id__in=ids).transition(new_status)
+
+    return first_matched, last_matched
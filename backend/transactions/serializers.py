@@ -0,0 +1,120 @@
+"""
+Fast row serializers for the transaction endpoints.
+
+Rows are fetched as plain tuples with values_list() instead of model
+instances, and choice labels come from precomputed dicts rather than
+get_FOO_display(). The dicts produced here are identical to the ones the
+views used to build from model instances.
+"""
+from .models import Transaction
+
+PAYMENT_METHOD_LABELS = dict(Transaction.PAYMENT_METHOD_CHOICES)
+STATUS_LABELS = dict(Transaction.STATUS_CHOICES)
+
+LIST_COLUMNS = (
+    'id', 'amount', 'payment_method', 'status',
+    'initiated_by__first_name', 'initiated_by__username',
+    'created_at', 'customer_identifier',
+    'mpesa_checkout_request_id', 'paystack_reference',
+)
+
+DETAIL_COLUMNS = (
+    'id', 'amount', 'payment_method', 'status',
+    'initiated_by_id', 'initiated_by__first_name', 'initiated_by__username',
+    'created_at', 'updated_at', 'customer_identifier',
+    'mpesa_checkout_request_id', 'paystack_reference', 'response_data',
+)
+
+
+def serialize_transaction_list(queryset):
+    """List rows with display labels for payment method and status."""
+    method_labels = PAYMENT_METHOD_LABELS
+    status_labels = STATUS_LABELS
+    return [
+        {
+            'id': pk,
+            'amount': str(amount),
+            'payment_method': method_labels.get(method, method),
+            'status': status_labels.get(status, status),
+            'initiated_by': first_name or username,
+            'created_at': created_at.isoformat(),
+            'customer_identifier': customer_identifier,
+            'mpesa_checkout_request_id': checkout_request_id,
+            'paystack_reference': paystack_reference,
+        }
+        for (
+            pk, amount, method, status, first_name, username, created_at,
+            customer_identifier, checkout_request_id, paystack_reference,
+        ) in queryset.values_list(*LIST_COLUMNS)
+    ]
+
+
+def fetch_transaction_detail(queryset, pk):
+    """
+    Returns (initiated_by_id, data) for the transaction `pk` with raw
+    status/method codes, or None if it does not exist.
+    """
+    row = queryset.filter(pk=pk).values_list(*DETAIL_COLUMNS).first()
+    if row is None:
+        return None
+
+    (
+        pk, amount, method, status, initiated_by_id, first_name, username,
+        created_at, updated_at, customer_identifier, checkout_request_id,
+        paystack_reference, response_data,
+    ) = row
+    return initiated_by_id, {
+        'id': pk,
+        'amount': str(amount),
+        'payment_method': method,
+        'status': status,
+        'initiated_by': first_name or username,
+        'created_at': created_at.isoformat(),
+        'updated_at': updated_at.isoformat(),
+        'customer_identifier': customer_identifier,
+        'mpesa_checkout_request_id': checkout_request_id,
+        'paystack_reference': paystack_reference,
+        'response_data': response_data,
+    }
+
+
+STATUS_COLUMNS = ('id', 'status', 'version', 'created_at', 'updated_at')
+
+
+def serialize_transaction_statuses(queryset):
+    """Minimal rows for status polling, with raw status codes like the detail view."""
+    return [
+        {
+            'id': pk,
+            'status': status,
+            'version': version,
+            'created_at': created_at.isoformat(),
+            'updated_at': updated_at.isoformat(),
+        }
+        for pk, status, version, created_at, updated_at in queryset.values_list(*STATUS_COLUMNS)
+    ]
+
+
+CUSTOMER_COLUMNS = (
+    'id', 'key', 'kind', 'transaction_count', 'payment_count',
+    'total_paid', 'first_seen_at', 'last_payment_at',
+)
+
+
+def serialize_customers(queryset):
+    return [
+        {
+            'id': pk,
+            'key': key,
+            'kind': kind,
+            'transaction_count': transaction_count,
+            'payment_count': payment_count,
+            'total_paid': str(total_paid),
+            'first_seen_at': first_seen_at.isoformat(),
+            'last_payment_at': last_payment_at.isoformat() if last_payment_at else None,
+        }
+        for (
+            pk, key, kind, transaction_count, payment_count,
+            total_paid, first_seen_at, last_payment_at,
+        ) in queryset.values_list(*CUSTOMER_COLUMNS)
+    ]
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Customer, DeletedTransaction, Transaction
+
+
+@receiver(post_delete, sender=Transaction)
+def record_deleted_transaction(sender, instance, **kwargs):
+    DeletedTransaction.objects.create(
+        transaction_id=instance.pk,
+        initiated_by_id=instance.initiated_by_id,
+    )
+
+
+@receiver(post_delete, sender=Transaction)
+def forget_deleted_transaction(sender, instance, **kwargs):
+    """Takes a deleted transaction back out of its customer's aggregates."""
+    if instance.customer_id is None:
+        return
+    completed = instance.status == 'COMPLETED'
+    Customer.objects.adjust(
+        instance.customer_id,
+        transactions=-1,
+        payments=-int(completed),
+        paid=-instance.amount if completed else 0,
+    )
@@ -0,0 +1,217 @@
+"""
+Columnar (Parquet) snapshots of transactions for analytics.
+
+Layout under the snapshot directory:
+
+    transactions/month=YYYY-MM/data.parquet    one file per created_at month
+    _watermark.json                             (updated_at, id) of the last exported row and
+                                                (deleted_at, id) of the last applied tombstone
+
+Each run exports rows changed since the watermark, in (updated_at, id)
+order from the index, into part files, then rewrites the touched months
+with one row per transaction (the latest version). Deletions are read from
+the DeletedTransaction tombstones (the same ones the change feed uses) and
+the deleted ids are dropped from every month that holds them. Rows updated
+or deleted within the last SNAPSHOT_LAG seconds are left for the next run
+so that transactions still being committed are not skipped. response_data
+is not exported.
+
+Requires pyarrow.
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from django.utils import timezone
+
+from .models import DeletedTransaction, Transaction
+
+SNAPSHOT_LAG = timedelta(seconds=60)
+
+COLUMNS = (
+    'id', 'initiated_by_id', 'customer_id', 'customer_key', 'amount', 'payment_method', 'status',
+    'version', 'mpesa_checkout_request_id', 'paystack_reference', 'created_at', 'updated_at',
+)
+
+
+def _schema(pa):
+    timestamp = pa.timestamp('us', tz='UTC')
+    return pa.schema([
+        ('id', pa.int64()),
+        ('initiated_by_id', pa.int64()),
+        ('customer_id', pa.int64()),
+        ('customer_key', pa.string()),
+        ('amount', pa.decimal128(12, 2)),
+        ('payment_method', pa.string()),
+        ('status', pa.string()),
+        ('version', pa.int32()),
+        ('mpesa_checkout_request_id', pa.string()),
+        ('paystack_reference', pa.string()),
+        ('created_at', timestamp),
+        ('updated_at', timestamp),
+    ])
+
+
+def read_watermark(directory):
+    """Returns {'t': (updated_at, id), 'd': (deleted_at, id)}; None means from the start."""
+    watermark = {'t': None, 'd': None}
+    try:
+        with open(os.path.join(directory, '_watermark.json')) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return watermark
+    watermark['t'] = datetime.fromisoformat(data['updated_at']), data['id']
+    if data.get('deleted_at'):
+        watermark['d'] = datetime.fromisoformat(data['deleted_at']), data['deleted_id']
+    return watermark
+
+
+def write_watermark(directory, watermark):
+    path = os.path.join(directory, '_watermark.json')
+    data = {}
+    if watermark['t']:
+        data.update(updated_at=watermark['t'][0].isoformat(), id=watermark['t'][1])
+    if watermark['d']:
+        data.update(deleted_at=watermark['d'][0].isoformat(), deleted_id=watermark['d'][1])
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def export_snapshot(directory, full=False, batch_size=10000):
+    """
+    Exports changed transactions to `directory` (`full` rebuilds it from
+    scratch) and removes deleted ones. Returns (rows exported, rows
+    removed, months rewritten, watermark).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _schema(pa)
+    table_dir = os.path.join(directory, 'transactions')
+    if full and os.path.isdir(table_dir):
+        shutil.rmtree(table_dir)
+    os.makedirs(table_dir, exist_ok=True)
+
+    watermark = {'t': None, 'd': None} if full else read_watermark(directory)
+    position = watermark['t']
+    cutoff = timezone.now() - SNAPSHOT_LAG
+    run_id = uuid4().hex[:12]
+    writers = {}
+    exported = 0
+
+    try:
+        while True:
+            queryset = Transaction.objects.filter(updated_at__lt=cutoff)
+            if position:
+                queryset = queryset.extra(where=['(updated_at, id) > (%s, %s)'], params=list(position))
+            rows = list(queryset.order_by('updated_at', 'id').values_list(*COLUMNS)[:batch_size])
+            if not rows:
+                break
+
+            by_month = {}
+            for row in rows:
+                by_month.setdefault(row[10].strftime('%Y-%m'), []).append(row)
+            for month, month_rows in by_month.items():
+                writer = writers.get(month)
+                if writer is None:
+                    month_dir = os.path.join(table_dir, f'month={month}')
+                    os.makedirs(month_dir, exist_ok=True)
+                    writer = pq.ParquetWriter(os.path.join(month_dir, f'part-{run_id}.parquet'), schema)
+                    writers[month] = writer
+                columns = list(zip(*month_rows))
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema,
+                ))
+
+            exported += len(rows)
+            last = rows[-1]
+            position = (last[11], last[0])
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    deleted_ids, deleted_position = _tombstones_since(watermark['d'], cutoff, batch_size)
+    months = set(writers)
+    if deleted_ids and not full:
+        months |= _months_holding(pq, table_dir, deleted_ids)
+
+    removed = 0
+    for month in sorted(months):
+        removed += _compact_month(pa, pq, os.path.join(table_dir, f'month={month}'), schema, deleted_ids)
+
+    new_watermark = {'t': position, 'd': deleted_position}
+    if new_watermark != watermark:
+        write_watermark(directory, new_watermark)
+    return exported, removed, sorted(months), new_watermark
+
+
+def _tombstones_since(position, cutoff, batch_size):
+    """Ids deleted after `position` (and before `cutoff`), and the new position."""
+    queryset = DeletedTransaction.objects.filter(deleted_at__lt=cutoff)
+    if position:
+        queryset = queryset.extra(where=['(deleted_at, id) > (%s, %s)'], params=list(position))
+    deleted_ids = set()
+    for pk, transaction_id, deleted_at in (
+        queryset.order_by('deleted_at', 'id').values_list('id', 'transaction_id', 'deleted_at').iterator(chunk_size=batch_size)
+    ):
+        deleted_ids.add(transaction_id)
+        position = (deleted_at, pk)
+    return deleted_ids, position
+
+
+def _months_holding(pq, table_dir, ids):
+    """Months whose data file contains any of `ids` (reads only the id column)."""
+    months = set()
+    for name in os.listdir(table_dir):
+        path = os.path.join(table_dir, name, 'data.parquet')
+        if name.startswith('month=') and os.path.exists(path):
+            month_ids = pq.read_table(path, columns=['id']).column('id').to_pylist()
+            if not ids.isdisjoint(month_ids):
+                months.add(name[len('month='):])
+    return months
+
+
+def _compact_month(pa, pq, month_dir, schema, deleted_ids=()):
+    """
+    Rewrites a month as a single data.parquet holding the latest version
+    of each transaction, sorted by id, without `deleted_ids`, and removes
+    the part files (or the whole month once it is empty). Returns the
+    number of rows removed as deleted.
+    """
+    import pyarrow.compute as pc
+
+    files = sorted(name for name in os.listdir(month_dir) if name.endswith('.parquet'))
+    table = pa.concat_tables(pq.read_table(os.path.join(month_dir, name), schema=schema) for name in files)
+    table = table.take(pc.sort_indices(table, sort_keys=[
+        ('id', 'ascending'), ('updated_at', 'descending'), ('version', 'descending'),
+    ]))
+
+    ids = table.column('id').combine_chunks()
+    if len(ids) > 1:
+        first = pa.concat_arrays([
+            pa.array([True]),
+            pc.not_equal(ids.slice(1), ids.slice(0, len(ids) - 1)),
+        ])
+        table = table.filter(first)
+
+    removed = 0
+    if deleted_ids:
+        keep = pc.invert(pc.is_in(table.column('id'), value_set=pa.array(sorted(deleted_ids), type=pa.int64())))
+        kept = table.filter(keep)
+        removed = table.num_rows - kept.num_rows
+        table = kept
+    if not table.num_rows:
+        shutil.rmtree(month_dir)
+        return removed
+
+    path = os.path.join(month_dir, 'data.parquet')
+    pq.write_table(table, f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
+    for name in files:
+        if name != 'data.parquet':
+            os.remove(os.path.join(month_dir, name))
+    return removed
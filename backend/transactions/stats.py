@@ -0,0 +1,105 @@
+"""
+Dashboard data shared by the stats/list endpoints and the bootstrap endpoint.
+
+Each part can be cached on its own (per user, or shared by all superusers)
+for a short time, so a dashboard reload does not recompute everything.
+Caching is off by default, and never used for a client whose reads are
+pinned to the primary after a write, so a payment shows up at once.
+"""
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.db_router import reads_pinned
+from .models import Transaction
+from .serializers import serialize_transaction_list
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATS_DAYS = 30
+
+
+def _scope(user):
+    return 'all' if user.is_superuser else f'user-{user.pk}'
+
+
+def _scoped_queryset(user):
+    if user.is_superuser:
+        return Transaction.objects.all()
+    return Transaction.objects.filter(initiated_by=user)
+
+
+def _cached(key, timeout, compute):
+    if timeout <= 0 or reads_pinned():
+        return compute()
+    try:
+        value = cache.get(key)
+    except Exception as e:
+        logger.warning("Cache unavailable for %s: %s", key, e)
+        return compute()
+    if value is None:
+        value = compute()
+        try:
+            cache.set(key, value, timeout=timeout)
+        except Exception as e:
+            logger.warning("Cache unavailable for %s: %s", key, e)
+    return value
+
+
+def default_stats_period():
+    end_date = timezone.now().date()
+    return end_date - timedelta(days=DEFAULT_STATS_DAYS - 1), end_date
+
+
+def dashboard_stats(user, start_date, end_date):
+    """Total collected and a daily trend of completed payments between two dates (inclusive)."""
+    def compute():
+        queryset = _scoped_queryset(user).filter(
+            status='COMPLETED',
+            created_at__date__range=[start_date, end_date]
+        )
+
+        total = queryset.aggregate(total=Sum('amount'))['total'] or 0
+
+        daily_data = (
+            queryset
+            .extra(select={'date': "DATE(created_at)"})
+            .values('date')
+            .annotate(amount=Sum('amount'))
+            .order_by('date')
+        )
+
+        date_cursor = start_date
+        trend = OrderedDict()
+        while date_cursor <= end_date:
+            trend[date_cursor.isoformat()] = "0.00"
+            date_cursor += timedelta(days=1)
+
+        for entry in daily_data:
+            date_key = entry['date'].isoformat()
+            if date_key in trend:
+                trend[date_key] = str(entry['amount'])
+
+        return {
+            'total_collected': str(total),
+            'period_start': start_date.isoformat(),
+            'period_end': end_date.isoformat(),
+            'trend': list(trend.items())
+        }
+
+    key = f'dashboard:stats:{_scope(user)}:{start_date.isoformat()}:{end_date.isoformat()}'
+    return _cached(key, settings.DASHBOARD_STATS_CACHE_SECONDS, compute)
+
+
+def recent_transactions(user, limit):
+    """First page of the transaction list (newest first)."""
+    def compute():
+        return serialize_transaction_list(_scoped_queryset(user).order_by('-created_at')[:limit])
+
+    key = f'dashboard:recent:{_scope(user)}:{limit}'
+    return _cached(key, settings.RECENT_TRANSACTIONS_CACHE_SECONDS, compute)
@@ -0,0 +1,29 @@
+from jobs.queue import task
+from .models import Transaction
+from .payments import check_in_flight_payment, start_gateway_payment
+
+
+@task('transactions.initiate_payment')
+def initiate_payment(job):
+    """
+    Background half of InitiatePaymentView: calls the gateway for a
+    committed PENDING transaction. Gateway outages are retried with
+    backoff; the last attempt marks the transaction FAILED. If an earlier
+    attempt started the call and never recorded the response (its worker
+    died and the job was reclaimed), the outcome is looked up instead of
+    calling the gateway again.
+    """
+    try:
+        transaction = Transaction.objects.get(pk=job.payload['transaction_id'])
+    except Transaction.DoesNotExist:
+        return
+
+    if transaction.status != 'PENDING' or transaction.response_data:
+        # Already handled by an earlier attempt
+        return
+
+    if transaction.gateway_called_at:
+        check_in_flight_payment(transaction)
+        return
+
+    start_gateway_payment(transaction, retry_on_unavailable=not job.is_last_attempt)
@@ -1,3 +1,949 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from core.db_router import end_request, start_request
+from jobs.backfill import run_backfill
+
+from .admin import EstimatedCountPaginator
+from .filters import filter_transactions
+from .models import Customer, Transaction
+from .payments import GatewayUnavailable, start_gateway_payment
+from .reconciliation import reconcile_statement
+from .snapshots import export_snapshot, read_watermark
+from .tasks import initiate_payment
+from .throttling import payment_customer_limiter, payment_initiator_limiter
+from .utils import (
+    DARAJA_ACCOUNT_LIST, DarajaAccount, DarajaUnavailable, get_daraja_account, initialize_paystack_transaction,
+    send_stk_push,
+)
+from .views import TransactionStatusView
+
+
+class GatewayRetryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+
+    def make_transaction(self):
+        return Transaction.objects.create(
+            initiated_by=self.user, amount=Decimal('100'), payment_method='STK_PUSH',
+            customer_identifier='0712345678',
+        )
+
+    def test_retryable_failure_raises_gateway_unavailable(self):
+        transaction = self.make_transaction()
+        result = {'success': False, 'error': 'Daraja rate limit exceeded', 'retryable': True}
+        with mock.patch('transactions.payments.send_stk_push', return_value=result):
+            with self.assertRaises(GatewayUnavailable):
+                start_gateway_payment(transaction, retry_on_unavailable=True)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'PENDING')
+
+    def test_failure_that_may_have_reached_the_gateway_is_not_retried(self):
+        # e.g. a read timeout: the customer may already have been prompted
+        transaction = self.make_transaction()
+        result = {'success': False, 'error': 'Read timed out.', 'retryable': False}
+        with mock.patch('transactions.payments.send_stk_push', return_value=result):
+            start_gateway_payment(transaction, retry_on_unavailable=True)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'FAILED')
+
+    def test_retryable_failure_fails_on_the_last_attempt(self):
+        transaction = self.make_transaction()
+        result = {'success': False, 'error': 'Daraja rate limit exceeded', 'retryable': True}
+        with mock.patch('transactions.payments.send_stk_push', return_value=result):
+            start_gateway_payment(transaction, retry_on_unavailable=False)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'FAILED')
+
+    def test_retryable_failure_releases_the_in_flight_marker(self):
+        transaction = self.make_transaction()
+        result = {'success': False, 'error': 'Daraja rate limit exceeded', 'retryable': True}
+        with mock.patch('transactions.payments.send_stk_push', return_value=result):
+            with self.assertRaises(GatewayUnavailable):
+                start_gateway_payment(transaction, retry_on_unavailable=True)
+        transaction.refresh_from_db()
+        self.assertIsNone(transaction.gateway_called_at)
+
+    def test_gateway_is_called_at_most_once(self):
+        transaction = self.make_transaction()
+        result = {'success': False, 'error': 'Read timed out.', 'retryable': False}
+        with mock.patch('transactions.payments.send_stk_push', return_value=result) as send:
+            start_gateway_payment(transaction)
+            start_gateway_payment(Transaction.objects.get(pk=transaction.pk))
+        send.assert_called_once()
+
+    def test_reclaimed_job_does_not_resend_an_stk_push(self):
+        # The worker died after claiming the call, before recording the response
+        transaction = self.make_transaction()
+        Transaction.objects.filter(pk=transaction.pk).update(gateway_called_at=timezone.now())
+        job = SimpleNamespace(payload={'transaction_id': transaction.pk}, is_last_attempt=False)
+        with mock.patch('transactions.payments.send_stk_push') as send:
+            initiate_payment(job)
+        send.assert_not_called()
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'PENDING')
+
+    def test_reclaimed_paystack_job_settles_from_verify(self):
+        transaction = Transaction.objects.create(
+            initiated_by=self.user, amount=Decimal('100'), payment_method='PAYSTACK',
+            customer_identifier='a@example.com', paystack_reference='ref-9', gateway_called_at=timezone.now(),
+        )
+        job = SimpleNamespace(payload={'transaction_id': transaction.pk}, is_last_attempt=False)
+        verified = {'success': True, 'data': {'data': {'status': 'success'}}}
+        with mock.patch('transactions.payments.initialize_paystack_transaction') as initialize, \
+                mock.patch('transactions.payments.verify_paystack_transaction', return_value=verified):
+            initiate_payment(job)
+        initialize.assert_not_called()
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'COMPLETED')
+
+    def test_success_records_the_checkout_request(self):
+        transaction = self.make_transaction()
+        result = {'success': True, 'CheckoutRequestID': 'ws_CO_1', 'account': 'default'}
+        with mock.patch('transactions.payments.send_stk_push', return_value=result):
+            start_gateway_payment(transaction, retry_on_unavailable=True)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.mpesa_checkout_request_id, 'ws_CO_1')
+        self.assertEqual(transaction.status, 'PENDING')
+
+
+class RetryableMarkerTests(TestCase):
+    def initialize(self, error):
+        with mock.patch('transactions.utils.requests.post', side_effect=error):
+            return initialize_paystack_transaction('a@example.com', Decimal('10'), 'ref-1')
+
+    def test_connection_refused_is_retryable(self):
+        error = requests.exceptions.ConnectionError(
+            MaxRetryError(None, '/', reason=NewConnectionError(None, 'Connection refused'))
+        )
+        self.assertTrue(self.initialize(error)['retryable'])
+
+    def test_read_timeout_and_dropped_connection_are_not(self):
+        self.assertFalse(self.initialize(requests.exceptions.ReadTimeout())['retryable'])
+        dropped = requests.exceptions.ConnectionError(ProtocolError('Connection aborted.'))
+        self.assertFalse(self.initialize(dropped)['retryable'])
+
+    def send_stk_push(self, error):
+        with mock.patch('transactions.utils._send_stk_push', side_effect=error):
+            return send_stk_push('0712345678', Decimal('10'), 1)
+
+    def test_stk_push_unavailable_on_every_account_is_retryable(self):
+        self.assertTrue(self.send_stk_push(DarajaUnavailable('no token'))['retryable'])
+
+    def test_stk_push_that_may_have_reached_safaricom_is_not(self):
+        self.assertFalse(self.send_stk_push(requests.exceptions.ReadTimeout())['retryable'])
+
+
+class DarajaAccountConfigTests(TestCase):
+    def test_empty_name_is_the_first_account(self):
+        self.assertIs(get_daraja_account(''), DARAJA_ACCOUNT_LIST[0])
+        self.assertIs(get_daraja_account(None), DARAJA_ACCOUNT_LIST[0])
+
+    def test_unknown_name_raises(self):
+        with self.assertRaises(LookupError):
+            get_daraja_account('retired')
+
+    def test_invalid_weight_is_a_configuration_error(self):
+        for weight in ('heavy', '-1', 'nan'):
+            with mock.patch.dict(os.environ, {'DARAJA_SPARE_WEIGHT': weight}):
+                with self.assertRaisesMessage(ImproperlyConfigured, 'DARAJA_SPARE_WEIGHT'):
+                    DarajaAccount.from_config('spare')
+        with mock.patch.dict(os.environ, {'DARAJA_SPARE_WEIGHT': '0.5'}):
+            self.assertEqual(DarajaAccount.from_config('spare').weight, 0.5)
+
+
+class TransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+
+    def make_transaction(self, status='PENDING'):
+        return Transaction.objects.create(
+            initiated_by=self.user, amount=Decimal('100'), payment_method='STK_PUSH',
+            customer_identifier='0712345678', status=status,
+        )
+
+    def test_allowed_transitions_follow_the_table(self):
+        for source, targets in Transaction.STATUS_TRANSITIONS.items():
+            for target, _ in Transaction.STATUS_CHOICES:
+                transaction = self.make_transaction(status=source)
+                moved = Transaction.objects.filter(pk=transaction.pk).transition(target)
+                self.assertEqual(moved, int(target in targets), f'{source} -> {target}')
+
+    def test_completed_is_final(self):
+        transaction = self.make_transaction(status='COMPLETED')
+        self.assertTrue(transaction.is_final)
+        self.assertFalse(transaction.transition_to('FAILED'))
+
+    def test_transition_bumps_version_and_updated_at(self):
+        transaction = self.make_transaction()
+        updated_at = transaction.updated_at
+        self.assertTrue(transaction.transition_to('PROCESSING'))
+        transaction.refresh_from_db()
+        self.assertEqual((transaction.status, transaction.version), ('PROCESSING', 1))
+        self.assertGreater(transaction.updated_at, updated_at)
+
+    def test_stale_instance_loses_compare_and_set(self):
+        transaction = self.make_transaction()
+        stale = Transaction.objects.get(pk=transaction.pk)
+        # A callback settles the payment first
+        Transaction.objects.filter(pk=transaction.pk).transition('CANCELLED')
+
+        self.assertFalse(stale.transition_to('TIMEOUT'))
+        self.assertEqual(stale.status, 'PENDING')  # left as loaded
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'CANCELLED')
+
+    def test_duplicate_callback_changes_nothing(self):
+        transaction = self.make_transaction()
+        queryset = Transaction.objects.filter(pk=transaction.pk)
+        self.assertEqual(queryset.transition('COMPLETED'), 1)
+        self.assertEqual(queryset.transition('COMPLETED'), 0)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.version, 1)
+
+
+class CustomerAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+
+    def make_transaction(self, amount='100', customer_identifier='0712345678'):
+        return Transaction.objects.create(
+            initiated_by=self.user, amount=Decimal(amount), payment_method='STK_PUSH',
+            customer_identifier=customer_identifier,
+        )
+
+    def aggregates(self, key):
+        customer = Customer.objects.get(key=key)
+        return customer.transaction_count, customer.payment_count, customer.total_paid
+
+    def test_completion_is_counted_once_with_its_changes(self):
+        first, second = self.make_transaction('100'), self.make_transaction('50')
+        queryset = Transaction.objects.filter(pk__in=[first.pk, second.pk])
+        self.assertEqual(queryset.transition('COMPLETED', mpesa_receipt_number='RCPT1'), 2)
+        self.assertEqual(queryset.transition('COMPLETED'), 0)
+
+        self.assertEqual(self.aggregates('254712345678'), (2, 2, Decimal('150')))
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.version, first.mpesa_receipt_number), ('COMPLETED', 1, 'RCPT1'))
+        self.assertIsNotNone(Customer.objects.get(key='254712345678').last_payment_at)
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_completion_in_a_replica_routed_request_writes_to_the_primary(self):
+        # e.g. the Paystack verify view, a GET that completes payments
+        transaction = self.make_transaction()
+        tokens = start_request(use_replica=True)
+        try:
+            with mock.patch.object(Customer.objects, 'record_payments') as record_payments:
+                self.assertTrue(transaction.transition_to('COMPLETED'))
+        finally:
+            end_request(tokens)
+        self.assertEqual(record_payments.call_args.kwargs['using'], 'default')
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'COMPLETED')
+
+    def test_changing_the_customer_moves_the_payment(self):
+        transaction = self.make_transaction()
+        transaction.transition_to('COMPLETED')
+
+        transaction.customer_identifier = '0722000000'
+        transaction.save(update_fields=['customer_identifier', 'updated_at'])
+
+        self.assertEqual(self.aggregates('254712345678'), (0, 0, Decimal('0')))
+        self.assertEqual(self.aggregates('254722000000'), (1, 1, Decimal('100')))
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.customer.key, '254722000000')
+
+    def test_changing_the_amount_of_a_completed_payment(self):
+        transaction = self.make_transaction()
+        transaction.transition_to('COMPLETED')
+        transaction.amount = Decimal('80')
+        transaction.save(update_fields=['amount', 'updated_at'])
+        self.assertEqual(self.aggregates('254712345678'), (1, 1, Decimal('80')))
+
+        pending = self.make_transaction()
+        pending.amount = Decimal('10')
+        pending.save()
+        self.assertEqual(self.aggregates('254712345678'), (2, 1, Decimal('80')))
+
+    def test_deleting_takes_the_transaction_back(self):
+        completed, pending = self.make_transaction('100'), self.make_transaction('40')
+        completed.transition_to('COMPLETED')
+        completed.delete()
+        self.assertEqual(self.aggregates('254712345678'), (1, 0, Decimal('0')))
+        pending.delete()
+        self.assertEqual(self.aggregates('254712345678'), (0, 0, Decimal('0')))
+
+
+class CustomerKeyBackfillTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+
+    def test_relinks_rows_and_moves_their_counts(self):
+        moved = Transaction.objects.create(
+            initiated_by=self.user, amount=Decimal('100'), payment_method='STK_PUSH',
+            customer_identifier='0712345678',
+        )
+        moved.transition_to('COMPLETED')
+        # Raw writes skip save(): a changed identifier and a row with no customer at all
+        Transaction.objects.filter(pk=moved.pk).update(customer_identifier='0722000000')
+        Transaction.objects.bulk_create([Transaction(
+            initiated_by=self.user, amount=Decimal('30'), payment_method='STK_PUSH',
+            customer_identifier='0712345678', customer_key='254712345678',
+        )])
+
+        progress = run_backfill('transactions.customer_key', batch_size=1, stop=threading.Event())
+        self.assertEqual(progress.checkpoint.rows_changed, 2)
+
+        old, new = Customer.objects.get(key='254712345678'), Customer.objects.get(key='254722000000')
+        self.assertEqual((old.transaction_count, old.payment_count, old.total_paid), (1, 0, Decimal('0')))
+        self.assertEqual((new.transaction_count, new.payment_count, new.total_paid), (1, 1, Decimal('100')))
+        self.assertEqual(Transaction.objects.filter(customer=old).count(), 1)
+        moved.refresh_from_db()
+        self.assertEqual((moved.customer_key, moved.customer_id), ('254722000000', new.pk))
+
+        # Nothing left to do on a second pass
+        progress = run_backfill('transactions.customer_key', batch_size=1, restart=True, stop=threading.Event())
+        self.assertEqual(progress.checkpoint.rows_changed, 0)
+
+
+    def test_legacy_rows_get_customers_from_their_own_history(self):
+        # Rows from before customer_key existed: no key, no customer
+        created = timezone.now() - timedelta(days=30)
+        Transaction.objects.bulk_create([
+            Transaction(
+                initiated_by=self.user, amount=Decimal(amount), payment_method='STK_PUSH',
+                customer_identifier=identifier, status=status,
+            )
+            for amount, identifier, status in [
+                ('100', '0712345678', 'COMPLETED'), ('40', '+254712345678', 'FAILED'), ('60', '0712345678', 'COMPLETED'),
+            ]
+        ])
+        rows = list(Transaction.objects.order_by('pk'))
+        for offset, transaction in enumerate(rows):
+            Transaction.objects.filter(pk=transaction.pk).update(
+                created_at=created + timedelta(days=offset), updated_at=created + timedelta(days=offset, hours=1),
+            )
+        before = dict(Transaction.objects.values_list('pk', 'updated_at'))
+
+        run_backfill('transactions.customer_key', batch_size=2, stop=threading.Event())
+
+        customer = Customer.objects.get(key='254712345678')
+        self.assertEqual((customer.transaction_count, customer.payment_count, customer.total_paid), (3, 2, Decimal('160')))
+        self.assertEqual(customer.first_seen_at, created)
+        self.assertEqual(customer.last_payment_at, created + timedelta(days=2, hours=1))
+        self.assertEqual(Transaction.objects.filter(customer=customer).count(), 3)
+        # Not reported as changed to the change feed or snapshots
+        self.assertEqual(dict(Transaction.objects.values_list('pk', 'updated_at')), before)
+
+
+class ReceiptNumberBackfillTests(TestCase):
+    def test_copies_receipts_from_callbacks_without_touching_updated_at(self):
+        user = User.objects.create_user('alice')
+        callback = {'Body': {'stkCallback': {'ResultCode': 0, 'CallbackMetadata': {'Item': [
+            {'Name': 'Amount', 'Value': 100}, {'Name': 'MpesaReceiptNumber', 'Value': 'NLJ7RT61SV'},
+        ]}}}}
+        Transaction.objects.bulk_create([
+            Transaction(
+                initiated_by=user, amount=Decimal('100'), payment_method='STK_PUSH',
+                customer_identifier='0712345678', status='COMPLETED', response_data=response_data,
+            )
+            for response_data in (callback, {})
+        ])
+        before = dict(Transaction.objects.values_list('pk', 'updated_at'))
+
+        progress = run_backfill('transactions.mpesa_receipt_number', batch_size=10, stop=threading.Event())
+
+        self.assertEqual(progress.checkpoint.rows_changed, 1)
+        self.assertEqual(
+            sorted(Transaction.objects.values_list('mpesa_receipt_number', flat=True), key=str), ['NLJ7RT61SV', None],
+        )
+        self.assertEqual(dict(Transaction.objects.values_list('pk', 'updated_at')), before)
+
+
+class TransactionFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        rows = [
+            # initiator, amount, method, status, identifier, checkout id, reference, created
+            (cls.alice, '100', 'STK_PUSH', 'COMPLETED', '0712345678', 'ws_CO_0001', None, datetime(2026, 3, 1, 9)),
+            (cls.alice, '250', 'PAYSTACK', 'FAILED', 'Jane@Example.com', None, 'PSK_ref_abc', datetime(2026, 3, 2, 23)),
+            (cls.bob, '40', 'STK_PUSH', 'PENDING', '+254722000000', 'ws_CO_0002', None, datetime(2026, 3, 3, 12)),
+        ]
+        cls.pks = []
+        for initiator, amount, method, status, identifier, checkout_id, reference, created in rows:
+            transaction = Transaction.objects.create(
+                initiated_by=initiator, amount=Decimal(amount), payment_method=method, status=status,
+                customer_identifier=identifier, mpesa_checkout_request_id=checkout_id, paystack_reference=reference,
+            )
+            Transaction.objects.filter(pk=transaction.pk).update(created_at=timezone.make_aware(created))
+            cls.pks.append(transaction.pk)
+
+    def filtered(self, **params):
+        return list(filter_transactions(Transaction.objects.order_by('pk'), params).values_list('pk', flat=True))
+
+    def test_status_and_method_accept_comma_separated_codes(self):
+        first, second, third = self.pks
+        self.assertEqual(self.filtered(status='completed, pending'), [first, third])
+        self.assertEqual(self.filtered(method='PAYSTACK'), [second])
+        with self.assertRaisesMessage(ValueError, 'Invalid status: PAID'):
+            self.filtered(status='PAID')
+
+    def test_initiator_by_id_or_username(self):
+        self.assertEqual(self.filtered(initiator=str(self.bob.pk)), [self.pks[2]])
+        self.assertEqual(self.filtered(initiator='alice'), self.pks[:2])
+
+    def test_a_bare_end_date_includes_the_whole_day(self):
+        self.assertEqual(self.filtered(start='2026-03-02', end='2026-03-02'), [self.pks[1]])
+        self.assertEqual(self.filtered(start='2026-03-02T12:00:00'), self.pks[1:])
+        with self.assertRaisesMessage(ValueError, 'Start date must be before end date'):
+            self.filtered(start='2026-03-03', end='2026-03-01')
+        with self.assertRaises(ValueError):
+            self.filtered(start='March')
+
+    def test_amount_bounds(self):
+        self.assertEqual(self.filtered(min_amount='50', max_amount='250'), self.pks[:2])
+        with self.assertRaisesMessage(ValueError, 'Invalid min_amount'):
+            self.filtered(min_amount='ten')
+
+    def test_customer_matches_a_prefix_of_the_normalized_key(self):
+        self.assertEqual(self.filtered(customer='0712'), [self.pks[0]])
+        self.assertEqual(self.filtered(customer='+2547'), [self.pks[0], self.pks[2]])
+        self.assertEqual(self.filtered(customer='JANE@'), [self.pks[1]])
+        customer = Customer.objects.get(key='254722000000')
+        self.assertEqual(self.filtered(customer_id=str(customer.pk)), [self.pks[2]])
+
+    def test_short_search_terms_only_match_references_exactly(self):
+        self.assertEqual(self.filtered(q='ref_abc'), [self.pks[1]])
+        self.assertEqual(self.filtered(q='ws_CO'), [self.pks[0], self.pks[2]])
+        self.assertEqual(self.filtered(q='722000'), [self.pks[2]])
+        self.assertEqual(self.filtered(q='ws'), [])
+
+    def test_list_view_applies_filters_to_the_callers_transactions(self):
+        self.client.force_login(self.alice)
+        response = self.client.get('/api/transactions/', {'method': 'STK_PUSH,PAYSTACK', 'limit': 1, 'offset': 1})
+        self.assertEqual([row['id'] for row in response.json()], [self.pks[0]])
+        response = self.client.get('/api/transactions/', {'status': 'PAID'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/transactions/', {'limit': 0})
+        self.assertEqual(response.status_code, 400)
+
+
+class TransactionAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.transaction = Transaction.objects.create(
+            initiated_by=self.admin, amount=Decimal('100'), payment_method='STK_PUSH',
+            customer_identifier='0712345678',
+        )
+        self.url = f'/admin/transactions/transaction/{self.transaction.pk}/change/'
+
+    def post(self, status, loaded_version):
+        created_at = timezone.localtime(self.transaction.created_at)
+        return self.client.post(self.url, {
+            'initiated_by': self.admin.pk,
+            'amount': '100.00',
+            'payment_method': 'STK_PUSH',
+            'status': status,
+            'mpesa_checkout_request_id': '',
+            'paystack_reference': '',
+            'response_data': '{}',
+            'customer_identifier': '0712345678',
+            'created_at_0': created_at.strftime('%Y-%m-%d'),
+            'created_at_1': created_at.strftime('%H:%M:%S'),
+            'loaded_version': loaded_version,
+        }, follow=True)
+
+    def messages(self, response):
+        return [(m.level_tag, str(m)) for m in response.context['messages']]
+
+    def test_status_change_uses_compare_and_set(self):
+        response = self.post('FAILED', loaded_version=0)
+        self.transaction.refresh_from_db()
+        self.assertEqual((self.transaction.status, self.transaction.version), ('FAILED', 1))
+        self.assertEqual(self.messages(response)[0][0], 'success')
+
+    def test_save_is_refused_if_the_transaction_changed_after_the_form_was_rendered(self):
+        rendered_version = self.transaction.version
+        Transaction.objects.filter(pk=self.transaction.pk).transition('COMPLETED')
+
+        response = self.post('CANCELLED', loaded_version=rendered_version)
+        self.assertContains(response, 'changed by someone else')
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.status, 'COMPLETED')
+
+    def test_refused_transition_shows_no_success_message(self):
+        Transaction.objects.filter(pk=self.transaction.pk).transition('COMPLETED')
+
+        response = self.post('FAILED', loaded_version=1)
+        levels = [level for level, _ in self.messages(response)]
+        self.assertEqual(levels, ['error'])
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.status, 'COMPLETED')
+
+
+class TransactionChangelistTests(TestCase):
+    url = '/admin/transactions/transaction/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.bob = User.objects.create_user('bob')
+        cls.by_admin, cls.by_bob = [
+            Transaction.objects.create(
+                initiated_by=user, amount=Decimal('100'), payment_method='STK_PUSH',
+                customer_identifier=identifier, mpesa_receipt_number=receipt,
+            )
+            for user, identifier, receipt in [(cls.admin, '0712345678', 'NLJ7RT61SV'), (cls.bob, 'bob@example.com', None)]
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_small_results_are_counted_exactly(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate_count', return_value=10) as estimate_count:
+            self.assertEqual(self.changelist().result_count, 2)
+        estimate_count.assert_called_once()
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_large_results_use_the_planner_estimate(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate_count', return_value=2500000):
+            cl = self.changelist()
+        self.assertEqual(cl.result_count, 2500000)
+        self.assertEqual(len(cl.result_list), 2)
+
+    def test_estimates_come_from_table_statistics_or_the_plan(self):
+        paginator = EstimatedCountPaginator(Transaction.objects.all(), 100)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE transactions_transaction')
+        self.assertEqual(paginator.estimate_count(Transaction.objects.all(), connection), 2)
+        filtered = paginator.estimate_count(Transaction.objects.filter(status='PENDING'), connection)
+        self.assertIsInstance(filtered, int)
+        self.assertGreaterEqual(filtered, 1)
+
+    def test_initiator_filter_matches_the_username(self):
+        cl = self.changelist(initiated_by__username='bob')
+        self.assertEqual(list(cl.result_list), [self.by_bob])
+        response = self.client.get(self.url, {'initiated_by__username': 'bob', 'status__exact': 'PENDING'})
+        self.assertContains(response, 'name="initiated_by__username" value="bob"')
+        self.assertContains(response, 'type="hidden" name="status__exact" value="PENDING"')
+
+    def test_search_matches_references_and_normalized_identifiers_exactly(self):
+        for term, expected in [
+            ('+254 712 345 678', [self.by_admin]),
+            ('nlj7rt61sv', [self.by_admin]),
+            ('BOB@example.com', [self.by_bob]),
+            (str(self.by_bob.pk), [self.by_bob]),
+            ('0712', []),
+        ]:
+            with self.subTest(term=term):
+                self.assertEqual(list(self.changelist(q=term).result_list), expected)
+
+
+class ReconciliationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+
+    def make_transaction(self, receipt, status, amount='100'):
+        return Transaction.objects.create(
+            initiated_by=self.user, amount=Decimal(amount), payment_method='STK_PUSH',
+            customer_identifier='0712345678', status=status, mpesa_receipt_number=receipt,
+        )
+
+    def reconcile(self, rows, apply=False):
+        lines = ['Receipt No.,Paid In,Transaction Status'] + [','.join(row) for row in rows]
+        return reconcile_statement(lines, 'mpesa', apply=apply)
+
+    def test_statement_matches_on_receipt_number(self):
+        self.make_transaction('NLJ7RT61SV', 'COMPLETED')
+        report = self.reconcile([('NLJ7RT61SV', '100.00', 'Completed'), ('QAZ1', '5.00', 'Completed')])
+        self.assertEqual(report.counts['matched'], 1)
+        self.assertEqual(report.counts['missing'], 1)
+
+    def test_reversed_payment_we_hold_as_completed_is_a_mismatch_and_not_corrected(self):
+        transaction = self.make_transaction('NLJ7RT61SV', 'COMPLETED')
+        report = self.reconcile([('NLJ7RT61SV', '100.00', 'Reversed')], apply=True)
+        self.assertEqual(report.counts['status_mismatch'], 1)
+        self.assertEqual(report.corrected, 0)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'COMPLETED')
+
+    def test_settled_payment_we_hold_as_failed_is_reported_only(self):
+        transaction = self.make_transaction('NLJ7RT61SV', 'FAILED')
+        report = self.reconcile([('NLJ7RT61SV', '100.00', 'Completed')], apply=True)
+        self.assertEqual(report.counts['status_mismatch'], 1)
+        self.assertEqual(report.corrected, 0)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'FAILED')
+
+    def test_unknown_statement_status_is_not_counted_as_matched(self):
+        transaction = self.make_transaction('NLJ7RT61SV', 'PENDING')
+        self.make_transaction('NLJ7RT61SW', 'COMPLETED')
+        report = self.reconcile(
+            [('NLJ7RT61SV', '100.00', 'Pending'), ('NLJ7RT61SW', '100.00', 'Compelted')], apply=True
+        )
+        self.assertEqual(report.counts['matched'], 0)
+        self.assertEqual(report.counts['unknown_status'], 2)
+        self.assertEqual(report.counts['orphan'], 0)
+        self.assertEqual(report.details[0]['statement_status'], 'Pending')
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'PENDING')
+
+    def test_open_transactions_are_corrected_with_apply(self):
+        transaction = self.make_transaction('NLJ7RT61SV', 'PROCESSING')
+        report = self.reconcile([('NLJ7RT61SV', '100.00', 'Completed')], apply=True)
+        self.assertEqual(report.corrected, 1)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'COMPLETED')
+
+    def test_failed_line_agrees_with_any_unpaid_status(self):
+        self.make_transaction('NLJ7RT61SV', 'CANCELLED')
+        report = self.reconcile([('NLJ7RT61SV', '100.00', 'Failed')])
+        self.assertEqual(report.counts['matched'], 1)
+
+    def test_daraja_callback_records_the_receipt_number(self):
+        transaction = Transaction.objects.create(
+            initiated_by=self.user, amount=Decimal('100'), payment_method='STK_PUSH',
+            customer_identifier='0712345678', mpesa_checkout_request_id='ws_CO_1',
+        )
+        payload = {'Body': {'stkCallback': {
+            'CheckoutRequestID': 'ws_CO_1', 'ResultCode': 0,
+            'CallbackMetadata': {'Item': [
+                {'Name': 'Amount', 'Value': 100}, {'Name': 'MpesaReceiptNumber', 'Value': 'NLJ7RT61SV'},
+            ]},
+        }}}
+        self.client.post('/api/transactions/webhook/daraja/', payload, content_type='application/json')
+        transaction.refresh_from_db()
+        self.assertEqual((transaction.status, transaction.mpesa_receipt_number), ('COMPLETED', 'NLJ7RT61SV'))
+
+
+@override_settings(PAYMENT_INITIATION_ASYNC=True)
+class PaymentVelocityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+
+    def setUp(self):
+        cache.clear()
+        for limiter in (payment_customer_limiter, payment_initiator_limiter):
+            limiter._entries.clear()
+        self.client.force_login(self.user)
+
+    def initiate(self, customer_identifier='0712345678'):
+        return self.client.post('/api/transactions/initiate/', {
+            'payment_method': 'STK_PUSH', 'amount': '100', 'customer_identifier': customer_identifier,
+        })
+
+    def test_customer_over_the_limit_gets_429_with_retry_after(self):
+        with mock.patch.object(payment_customer_limiter, 'limit', 2):
+            self.assertEqual(self.initiate().status_code, 202)
+            # Same customer, differently written
+            self.assertEqual(self.initiate('+254 712 345 678').status_code, 202)
+            response = self.initiate()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_refused_request_does_not_use_up_the_initiator_limit(self):
+        with mock.patch.object(payment_customer_limiter, 'limit', 1), \
+                mock.patch.object(payment_initiator_limiter, 'limit', 2):
+            self.assertEqual(self.initiate().status_code, 202)
+            self.assertEqual(self.initiate().status_code, 429)
+            self.assertEqual(self.initiate('0722000000').status_code, 202)
+            response = self.initiate('0733000000')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+
+@override_settings(CHANGE_FEED_LAG_SECONDS=0)
+class ChangeFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+        cls.other = User.objects.create_user('bob')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def make_transaction(self, user=None):
+        return Transaction.objects.create(
+            initiated_by=user or self.user, amount=Decimal('100'), payment_method='STK_PUSH',
+            customer_identifier='0712345678',
+        )
+
+    def changes(self, cursor='', limit=100):
+        response = self.client.get('/api/transactions/changes/', {'cursor': cursor, 'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_follow_the_cursor_without_repeats(self):
+        pks = [self.make_transaction().pk for _ in range(5)]
+        first = self.changes(limit=3)
+        self.assertTrue(first['has_more'])
+        second = self.changes(first['cursor'], limit=3)
+        self.assertFalse(second['has_more'])
+        self.assertEqual([c['id'] for c in first['changes'] + second['changes']], pks)
+        self.assertEqual(self.changes(second['cursor'])['changes'], [])
+
+    def test_status_transitions_and_deletions_show_up_after_the_cursor(self):
+        kept, deleted = self.make_transaction(), self.make_transaction()
+        cursor = self.changes()['cursor']
+
+        kept.transition_to('COMPLETED')
+        deleted_pk = deleted.pk
+        deleted.delete()
+        changes = self.changes(cursor)['changes']
+        self.assertEqual(
+            [(c['type'], c['id']) for c in changes],
+            [('upsert', kept.pk), ('delete', deleted_pk)],
+        )
+        self.assertEqual((changes[0]['status'], changes[0]['version']), ('COMPLETED', 1))
+
+    def test_only_own_transactions_unless_superuser(self):
+        own, others = self.make_transaction(), self.make_transaction(user=self.other)
+        others.delete()
+        self.assertEqual([c['id'] for c in self.changes()['changes']], [own.pk])
+
+    @override_settings(CHANGE_FEED_LAG_SECONDS=60)
+    def test_recent_changes_are_held_back(self):
+        self.make_transaction()
+        self.assertEqual(self.changes()['changes'], [])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/transactions/changes/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TransactionStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+        cls.other = User.objects.create_user('bob')
+        cls.start = timezone.now() - timedelta(hours=1)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def make_transaction(self, minutes, user=None, status='PENDING'):
+        transaction = Transaction.objects.create(
+            initiated_by=user or self.user, amount=Decimal('100'), payment_method='STK_PUSH',
+            customer_identifier='0712345678', status=status,
+        )
+        Transaction.objects.filter(pk=transaction.pk).update(created_at=self.start + timedelta(minutes=minutes))
+        return transaction.pk
+
+    def poll(self, **params):
+        response = self.client.get('/api/transactions/status/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ids_are_limited_to_the_callers_transactions(self):
+        own = self.make_transaction(1)
+        others = self.make_transaction(2, user=self.other)
+        data = self.poll(ids=f'{own},{others}')
+        self.assertEqual([row['id'] for row in data['transactions']], [own])
+        self.assertEqual(data['not_found'], [others])
+
+    def test_pending_since_is_limited_to_the_callers_transactions(self):
+        own = self.make_transaction(1)
+        self.make_transaction(2, user=self.other)
+        data = self.poll(pending_since=self.start.isoformat())
+        self.assertEqual([row['id'] for row in data['transactions']], [own])
+
+    def test_pages_move_past_a_payment_that_stays_open(self):
+        stuck = self.make_transaction(0)
+        settled = [self.make_transaction(minute, status='COMPLETED') for minute in range(1, 6)]
+        # Same created_at as the last settled row: the id breaks the tie
+        latest = self.make_transaction(5, status='FAILED')
+        since = self.start.isoformat()
+
+        seen, cursor = [], ''
+        with mock.patch.object(TransactionStatusView, 'MAX_ROWS', 2):
+            while True:
+                data = self.poll(pending_since=since, cursor=cursor)
+                seen += [row['id'] for row in data['transactions']]
+                self.assertEqual(data['next_pending_since'], Transaction.objects.get(pk=stuck).created_at.isoformat())
+                if not data['has_more']:
+                    break
+                cursor = data['cursor']
+        self.assertEqual(seen, [stuck, *settled, latest])
+        self.assertEqual(data['cursor'], '')
+
+    def test_window_moves_to_now_once_everything_has_settled(self):
+        self.make_transaction(1, status='COMPLETED')
+        data = self.poll(pending_since=self.start.isoformat())
+        self.assertIsNone(data['poll_after'])
+        self.assertFalse(data['has_more'])
+        self.assertGreater(data['next_pending_since'], (timezone.now() - timedelta(minutes=1)).isoformat())
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/transactions/status/', {'pending_since': self.start.isoformat(), 'cursor': '!'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SnapshotExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        lag = mock.patch('transactions.snapshots.SNAPSHOT_LAG', timedelta(0))
+        lag.start()
+        self.addCleanup(lag.stop)
+
+    def make_transaction(self, created_at):
+        transaction = Transaction.objects.create(
+            initiated_by=self.user, amount=Decimal('100'), payment_method='STK_PUSH',
+            customer_identifier='0712345678',
+        )
+        Transaction.objects.filter(pk=transaction.pk).update(created_at=timezone.make_aware(created_at))
+        return transaction
+
+    def snapshot(self):
+        """{id: (month, status, version)} from the compacted month files."""
+        import pyarrow.parquet as pq
+
+        table_dir = os.path.join(self.directory, 'transactions')
+        rows = {}
+        for name in sorted(os.listdir(table_dir)):
+            self.assertEqual(os.listdir(os.path.join(table_dir, name)), ['data.parquet'])
+            table = pq.read_table(os.path.join(table_dir, name, 'data.parquet'))
+            for pk, status, version in zip(*(table.column(c).to_pylist() for c in ('id', 'status', 'version'))):
+                self.assertNotIn(pk, rows)
+                rows[pk] = (name[len('month='):], status, version)
+        return rows
+
+    def test_rows_are_partitioned_by_created_month(self):
+        january = [self.make_transaction(datetime(2026, 1, day)).pk for day in (10, 20)]
+        february = self.make_transaction(datetime(2026, 2, 10)).pk
+
+        exported, removed, months, _ = export_snapshot(self.directory, batch_size=2)
+
+        self.assertEqual((exported, removed, months), (3, 0, ['2026-01', '2026-02']))
+        self.assertEqual(self.snapshot(), {
+            january[0]: ('2026-01', 'PENDING', 0),
+            january[1]: ('2026-01', 'PENDING', 0),
+            february: ('2026-02', 'PENDING', 0),
+        })
+
+    def test_incremental_runs_export_only_changes_after_the_watermark(self):
+        changed = self.make_transaction(datetime(2026, 1, 10))
+        other = self.make_transaction(datetime(2026, 2, 10)).pk
+        export_snapshot(self.directory)
+
+        changed.transition_to('COMPLETED')
+        exported, removed, months, watermark = export_snapshot(self.directory)
+
+        self.assertEqual((exported, removed, months), (1, 0, ['2026-01']))
+        self.assertEqual(watermark['t'][1], changed.pk)
+        self.assertEqual(self.snapshot(), {
+            changed.pk: ('2026-01', 'COMPLETED', 1),
+            other: ('2026-02', 'PENDING', 0),
+        })
+        self.assertEqual(export_snapshot(self.directory)[:3], (0, 0, []))
+
+    def test_tombstones_remove_deleted_rows(self):
+        kept = self.make_transaction(datetime(2026, 1, 10)).pk
+        deleted = [self.make_transaction(datetime(2026, month, 20)) for month in (1, 2)]
+        export_snapshot(self.directory)
+
+        for transaction in deleted:
+            transaction.delete()
+        exported, removed, months, _ = export_snapshot(self.directory)
+
+        self.assertEqual((exported, removed, months), (0, 2, ['2026-01', '2026-02']))
+        # February is left empty and removed
+        self.assertEqual(self.snapshot(), {kept: ('2026-01', 'PENDING', 0)})
+
+    def test_rows_still_being_committed_wait_for_the_next_run(self):
+        self.make_transaction(datetime(2026, 1, 10))
+        with mock.patch('transactions.snapshots.SNAPSHOT_LAG', timedelta(seconds=60)):
+            self.assertEqual(export_snapshot(self.directory)[:3], (0, 0, []))
+        self.assertEqual(export_snapshot(self.directory)[0], 1)
+
+    def test_run_after_a_failed_run_keeps_one_row_per_transaction(self):
+        transaction = self.make_transaction(datetime(2026, 1, 10))
+        _, _, _, watermark = export_snapshot(self.directory)
+
+        transaction.transition_to('COMPLETED')
+        # Fails after writing its part file, before compacting or moving the watermark
+        with mock.patch('transactions.snapshots._compact_month', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                export_snapshot(self.directory)
+        self.assertEqual(read_watermark(self.directory), watermark)
+
+        exported, _, months, _ = export_snapshot(self.directory)
+        self.assertEqual((exported, months), (1, ['2026-01']))
+        self.assertEqual(self.snapshot(), {transaction.pk: ('2026-01', 'COMPLETED', 1)})
+
+
+class VerifyPaystackTransactionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.transaction = Transaction.objects.create(
+            initiated_by=self.user, amount=Decimal('100'), payment_method='PAYSTACK',
+            customer_identifier='a@example.com', paystack_reference='ref-1',
+        )
+
+    def verify(self):
+        return self.client.get('/api/transactions/paystack/verify/ref-1/').json()
+
+    def paystack_says(self, charge_status):
+        result = {'success': True, 'data': {'data': {'status': charge_status, 'amount': 10000}}}
+        return mock.patch('transactions.payments.verify_paystack_transaction', return_value=result)
+
+    def test_final_transaction_is_answered_without_calling_paystack(self):
+        with self.paystack_says('success') as verify:
+            self.assertEqual(self.verify()['status'], 'COMPLETED')
+            cache.clear()
+            self.assertEqual(self.verify()['status'], 'COMPLETED')
+        verify.assert_called_once()
+
+    def test_polling_reuses_the_cached_answer(self):
+        with self.paystack_says('ongoing') as verify:
+            for _ in range(3):
+                self.assertEqual(self.verify()['status'], 'PENDING')
+        verify.assert_called_once()
+
+    def test_only_final_outcomes_change_the_row(self):
+        with self.paystack_says('abandoned'):
+            self.verify()
+        self.transaction.refresh_from_db()
+        self.assertEqual((self.transaction.status, self.transaction.version), ('PENDING', 0))
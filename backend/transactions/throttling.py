@@ -0,0 +1,17 @@
+from django.conf import settings
+
+from core.ratelimit import SlidingWindowCounter
+
+# Payment requests targeting one phone number or email (normalized customer key)
+payment_customer_limiter = SlidingWindowCounter(
+    'payment-customer',
+    limit=settings.PAYMENT_VELOCITY_CUSTOMER_LIMIT,
+    window=settings.PAYMENT_VELOCITY_WINDOW,
+)
+
+# Payment requests made by one initiating user
+payment_initiator_limiter = SlidingWindowCounter(
+    'payment-initiator',
+    limit=settings.PAYMENT_VELOCITY_INITIATOR_LIMIT,
+    window=settings.PAYMENT_VELOCITY_WINDOW,
+)
@@ -9,6 +9,12 @@ urlpatterns = [
     # Transaction CRUD
     path('', views.TransactionListView.as_view(), name='transaction-list'),
     path('<int:pk>/', views.TransactionDetailView.as_view(), name='transaction-detail'),
+    path('status/', views.TransactionStatusView.as_view(), name='transaction-status'),
+    path('changes/', views.TransactionChangesView.as_view(), name='transaction-changes'),
+    
+    # Customers (staff)
+    path('customers/', views.TopCustomersView.as_view(), name='top-customers'),
+    path('customers/lookup/', views.CustomerLookupView.as_view(), name='customer-lookup'),
     
     # Payment Initiation
     path('initiate/', views.InitiatePaymentView.as_view(), name='initiate-payment'),
@@ -18,6 +24,9 @@ urlpatterns = [
          views.VerifyPaystackTransactionView.as_view(), 
          name='verify-paystack-transaction'),
     
+    # Settlement statement reconciliation (staff)
+    path('reconcile/', views.ReconcileStatementView.as_view(), name='reconcile-statement'),
+    
     # Webhooks (function-based, no .as_view())
     path('webhook/daraja/', views.daraja_webhook, name='daraja-webhook'),
     path('webhook/paystack/', views.paystack_webhook, name='paystack-webhook'),
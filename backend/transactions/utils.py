@@ -1,19 +1,188 @@
+import logging
+import random
 import requests
 import base64
 import json
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.core.cache import cache
-from decouple import config
+from decouple import config, Csv
 from django.utils import timezone
 from decimal import Decimal, InvalidOperation
+from urllib3.exceptions import NewConnectionError
+from core.ratelimit import RateLimitExceeded, TokenBucket
+
+logger = logging.getLogger(__name__)
 
 # ====== Daraja (M-Pesa) Config ======
+# Several credential sets can share the STK Push traffic: list their names
+# in DARAJA_ACCOUNTS and configure each with DARAJA_<NAME>_CONSUMER_KEY,
+# _CONSUMER_SECRET, _SHORTCODE, _PASSKEY, _TILLNUMBER, _CALLBACK_URL and
+# _WEIGHT. Unset values fall back to the unprefixed DARAJA_* settings,
+# which on their own define a single 'default' account.
 DARAJA_CONSUMER_KEY = config('DARAJA_CONSUMER_KEY', default='').strip()
 DARAJA_CONSUMER_SECRET = config('DARAJA_CONSUMER_SECRET', default='').strip()
 DARAJA_SHORTCODE = config('DARAJA_SHORTCODE', default='').strip()
 DARAJA_PASSKEY = config('DARAJA_PASSKEY', default='').strip()
 DARAJA_CALLBACK_URL = config('DARAJA_CALLBACK_URL', default='https://api.dewlons.com/api/transactions/webhook/daraja/').strip()
 DARAJA_TILLNUMBER = config('DARAJA_TILLNUMBER', default='').strip()
+DARAJA_ACCOUNTS = config('DARAJA_ACCOUNTS', default='', cast=Csv())
+
+DARAJA_ENDPOINT_RATES = {
+    'oauth': settings.DARAJA_OAUTH_RATE,
+    'stkpush': settings.DARAJA_STK_PUSH_RATE,
+    'stkquery': settings.DARAJA_STK_QUERY_RATE,
+    'registerurl': settings.DARAJA_REGISTER_URL_RATE,
+}
+
+
+class DarajaUnavailable(Exception):
+    """The account could not take the request (no token, quota, connection refused); another one may."""
+
+
+class DarajaAccount:
+    """
+    One Daraja app and shortcode. Each account has its own cached OAuth
+    token and its own outbound quota per endpoint (shared by every web
+    node and worker), and is taken out of rotation for
+    DARAJA_ACCOUNT_COOLDOWN seconds after DARAJA_ACCOUNT_FAILURE_THRESHOLD
+    consecutive failures.
+    """
+
+    def __init__(self, name, consumer_key, consumer_secret, shortcode, passkey, tillnumber, callback_url, weight=1):
+        self.name = name
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.shortcode = shortcode
+        self.passkey = passkey
+        self.tillnumber = tillnumber
+        self.callback_url = callback_url
+        self.weight = max(0.0, weight)
+        # The single-account setup keeps its original bucket and token cache names
+        prefix = 'daraja' if name == 'default' else f'daraja-{name}'
+        self.token_cache_key = 'daraja_access_token' if name == 'default' else f'daraja_access_token:{name}'
+        self.buckets = {
+            endpoint: TokenBucket(
+                f'{prefix}-{endpoint}', rate,
+                capacity=settings.DARAJA_RATE_BURST,
+                max_wait=settings.DARAJA_RATE_MAX_WAIT,
+            )
+            for endpoint, rate in DARAJA_ENDPOINT_RATES.items()
+        }
+
+    @classmethod
+    def from_config(cls, name):
+        def setting(field, default):
+            return config(f'DARAJA_{name.upper()}_{field}', default=default).strip()
+
+        try:
+            weight = float(setting('WEIGHT', '1'))
+        except ValueError:
+            weight = None
+        if weight is None or not weight >= 0:  # also rejects nan
+            raise ImproperlyConfigured(f"DARAJA_{name.upper()}_WEIGHT must be a non-negative number")
+
+        return cls(
+            name,
+            consumer_key=setting('CONSUMER_KEY', DARAJA_CONSUMER_KEY),
+            consumer_secret=setting('CONSUMER_SECRET', DARAJA_CONSUMER_SECRET),
+            shortcode=setting('SHORTCODE', DARAJA_SHORTCODE),
+            passkey=setting('PASSKEY', DARAJA_PASSKEY),
+            tillnumber=setting('TILLNUMBER', DARAJA_TILLNUMBER),
+            callback_url=setting('CALLBACK_URL', DARAJA_CALLBACK_URL),
+            weight=weight,
+        )
+
+    def password(self, timestamp):
+        return base64.b64encode(f"{self.shortcode}{self.passkey}{timestamp}".encode()).decode()
+
+    # ---- health ----
+
+    def _health_key(self, kind):
+        return f'daraja:{self.name}:{kind}'
+
+    def is_healthy(self):
+        try:
+            return not cache.get(self._health_key('down'))
+        except Exception as e:
+            logger.warning("Daraja health store unavailable for %s: %s", self.name, e)
+            return True
+
+    def record_success(self):
+        try:
+            cache.delete(self._health_key('failures'))
+        except Exception as e:
+            logger.warning("Daraja health store unavailable for %s: %s", self.name, e)
+
+    def record_failure(self, reason):
+        key = self._health_key('failures')
+        cooldown = settings.DARAJA_ACCOUNT_COOLDOWN
+        try:
+            cache.add(key, 0, timeout=cooldown)
+            failures = cache.incr(key)
+            if failures >= settings.DARAJA_ACCOUNT_FAILURE_THRESHOLD:
+                cache.set(self._health_key('down'), True, timeout=cooldown)
+                logger.warning("Daraja account %s out of rotation for %ss: %s", self.name, cooldown, reason)
+        except Exception as e:
+            logger.warning("Daraja health store unavailable for %s: %s", self.name, e)
+
+    def status(self):
+        return {
+            'shortcode': self.shortcode,
+            'weight': self.weight,
+            'healthy': self.is_healthy(),
+            'stkpush': self.buckets['stkpush'].usage(),
+        }
+
+
+DARAJA_ACCOUNT_LIST = [DarajaAccount.from_config(name) for name in DARAJA_ACCOUNTS] or [
+    DarajaAccount.from_config('default')
+]
+DARAJA_ACCOUNTS_BY_NAME = {account.name: account for account in DARAJA_ACCOUNT_LIST}
+
+
+def get_daraja_account(name=None):
+    """
+    The account called `name` (as recorded on a transaction), or the first
+    configured one when `name` is empty. Raises LookupError for a name that
+    is not configured (any more): its token and shortcode are not ours to
+    guess.
+    """
+    if not name:
+        return DARAJA_ACCOUNT_LIST[0]
+    try:
+        return DARAJA_ACCOUNTS_BY_NAME[name]
+    except KeyError:
+        raise LookupError(f"Daraja account {name!r} is not configured (DARAJA_ACCOUNTS)")
+
+
+def choose_daraja_accounts():
+    """
+    Healthy accounts in the order STK pushes should try them. With
+    DARAJA_BALANCING = 'least_loaded' the account with the shortest STK
+    Push queue comes first; otherwise ('weighted') the first account is
+    drawn at random in proportion to its weight. If every account is out
+    of rotation, all of them are tried.
+    """
+    accounts = [account for account in DARAJA_ACCOUNT_LIST if account.weight > 0] or DARAJA_ACCOUNT_LIST
+    if len(accounts) == 1:
+        return accounts
+    accounts = [account for account in accounts if account.is_healthy()] or accounts
+
+    if settings.DARAJA_BALANCING == 'least_loaded':
+        def load(account):
+            usage = account.buckets['stkpush'].usage()
+            return usage['backlog_seconds'], usage['utilisation'], random.random()
+        return sorted(accounts, key=load)
+
+    remaining = list(accounts)
+    ordered = []
+    while remaining:
+        account = random.choices(remaining, weights=[account.weight or 1 for account in remaining])[0]
+        remaining.remove(account)
+        ordered.append(account)
+    return ordered
+
 
 # ====== Paystack Config ======
 PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY', default='').strip()
@@ -47,25 +216,86 @@ def normalize_phone_number(phone):
     return digits
 
 
-def get_daraja_token():
+def callback_metadata_value(stk_callback, name):
+    """Value of the `name` item in an STK callback's CallbackMetadata, or None."""
+    items = (stk_callback.get('CallbackMetadata') or {}).get('Item') or []
+    for item in items:
+        if isinstance(item, dict) and item.get('Name') == name:
+            return item.get('Value')
+    return None
+
+
+def normalize_customer_identifier(identifier):
+    """
+    Canonical lookup key for a customer identifier.
+    Emails are lower-cased and Kenyan phone numbers become 254XXXXXXXXX;
+    anything else is returned stripped and lower-cased.
+    """
+    value = str(identifier or '').strip()
+    if '@' in value:
+        return value.lower()
+    try:
+        return normalize_phone_number(value)
+    except ValueError:
+        return value.lower()
+
+
+def customer_identifier_prefix(value):
+    """
+    Normalizes a partial phone number or email so it can be matched as a
+    prefix of the normalized key (e.g. 0712 -> 254712, +25471 -> 25471).
+    """
+    value = str(value or '').strip()
+    if '@' in value:
+        return value.lower()
+
+    digits = ''.join(filter(str.isdigit, value))
+    if not digits or any(c not in '0123456789+-() ' for c in value):
+        # Not a phone number (free text, reference etc.)
+        return value.lower()
+    if digits.startswith('0'):
+        return '254' + digits[1:]
+    if digits.startswith(('7', '1')) and len(digits) <= 9:
+        return '254' + digits
+    return digits
+
+
+def never_connected(error):
+    """
+    True if a requests exception happened before the request was sent
+    (connection refused, DNS failure, connect timeout), so retrying it
+    cannot repeat a payment. Read timeouts and dropped connections can
+    follow a request the gateway already received.
     """
-    Get OAuth access token for Daraja API with caching
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def get_daraja_token(account=None):
     """
-    token = cache.get('daraja_access_token')
+    Get OAuth access token for a Daraja account (default: the first) with caching
+    """
+    account = account or get_daraja_account()
+    token = cache.get(account.token_cache_key)
     if token:
         return token
 
     url = 'https://api.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials'.strip()
-    credentials = base64.b64encode(f"{DARAJA_CONSUMER_KEY}:{DARAJA_CONSUMER_SECRET}".encode()).decode()
+    credentials = base64.b64encode(f"{account.consumer_key}:{account.consumer_secret}".encode()).decode()
     headers = {'Authorization': f'Basic {credentials}'}
     
     try:
+        account.buckets['oauth'].acquire()
         response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
         
         token = response.json().get('access_token')
         if token:
-            cache.set('daraja_access_token', token, timeout=3500)
+            cache.set(account.token_cache_key, token, timeout=3500)
             return token
         else:
             raise Exception("No access token in response")
@@ -78,79 +308,130 @@ def get_daraja_token():
 
 def send_stk_push(phone_number, amount, transaction_id):
     """
-    Initiates STK Push via Daraja API.
-    Returns dict with 'success' boolean and optional 'CheckoutRequestID' or 'error'.
+    Initiates STK Push via Daraja API, on the account picked by
+    choose_daraja_accounts(). If an account cannot take the request before
+    it reaches Safaricom, the next one is tried.
+    Returns dict with 'success' boolean, the 'account' used and optional
+    'CheckoutRequestID' or 'error'.
     """
     try:
         phone_number = normalize_phone_number(phone_number)
-        token = get_daraja_token()
-        
-        timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-        password = base64.b64encode(
-            f"{DARAJA_SHORTCODE}{DARAJA_PASSKEY}{timestamp}".encode()
-        ).decode()
-
-        payload = {
-            "BusinessShortCode": DARAJA_SHORTCODE,
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": "CustomerBuyGoodsOnline",
-            "Amount": int(amount),
-            "PartyA": phone_number,
-            "PartyB": DARAJA_TILLNUMBER,
-            "PhoneNumber": phone_number,
-            "CallBackURL": DARAJA_CALLBACK_URL.rstrip('/'),
-            "AccountReference": f"TXN{transaction_id}",
-            "TransactionDesc": "Payment for service"
-        }
-
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
         }
 
-        url = 'https://api.safaricom.co.ke/mpesa/stkpush/v1/processrequest'.strip()
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
-        
-        result = response.json()
-        
-        if response.status_code == 200 and result.get('ResponseCode') == '0':
-            return {
-                'success': True,
-                'CheckoutRequestID': result.get('CheckoutRequestID'),
-                'CustomerMessage': result.get('CustomerMessage', 'Request sent to your phone')
-            }
-        else:
-            error_msg = result.get('errorMessage', result.get('message', 'Unknown error from Daraja'))
+    error = None
+    for account in choose_daraja_accounts():
+        try:
+            result = _send_stk_push(account, phone_number, amount, transaction_id)
+        except DarajaUnavailable as e:
+            account.record_failure(e)
+            error = str(e)
+            continue
+        except Exception as e:
+            # May have reached Safaricom (e.g. a read timeout): retrying on
+            # another account could prompt the customer twice
+            account.record_failure(e)
             return {
                 'success': False,
-                'error': error_msg,
-                'raw_response': result
+                'account': account.name,
+                'error': str(e),
+                'retryable': False
             }
-            
+        result['account'] = account.name
+        return result
+
+    return {
+        'success': False,
+        'error': error,
+        'retryable': True
+    }
+
+
+def _send_stk_push(account, phone_number, amount, transaction_id):
+    try:
+        token = get_daraja_token(account)
     except Exception as e:
+        raise DarajaUnavailable(str(e))
+
+    timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
+
+    payload = {
+        "BusinessShortCode": account.shortcode,
+        "Password": account.password(timestamp),
+        "Timestamp": timestamp,
+        "TransactionType": "CustomerBuyGoodsOnline",
+        "Amount": int(amount),
+        "PartyA": phone_number,
+        "PartyB": account.tillnumber,
+        "PhoneNumber": phone_number,
+        "CallBackURL": account.callback_url.rstrip('/'),
+        "AccountReference": f"TXN{transaction_id}",
+        "TransactionDesc": "Payment for service"
+    }
+
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'Content-Type': 'application/json'
+    }
+
+    url = 'https://api.safaricom.co.ke/mpesa/stkpush/v1/processrequest'.strip()
+    try:
+        account.buckets['stkpush'].acquire()
+        response = requests.post(url, json=payload, headers=headers, timeout=30)
+    except RateLimitExceeded as e:
+        raise DarajaUnavailable(str(e))
+    except requests.exceptions.ConnectionError as e:
+        if not never_connected(e):
+            raise
+        raise DarajaUnavailable(str(e))
+
+    if response.status_code == 401:
+        # Token revoked or expired early: fetch a new one next time
+        cache.delete(account.token_cache_key)
+        raise DarajaUnavailable(f'Daraja rejected the access token for {account.name}')
+    if response.status_code == 429:
+        # Quota exceeded upstream: queued payments are retried
+        raise DarajaUnavailable('Daraja rate limit exceeded')
+
+    result = response.json()
+    if response.status_code >= 500:
+        account.record_failure(f'HTTP {response.status_code}')
+    else:
+        account.record_success()
+    
+    if response.status_code == 200 and result.get('ResponseCode') == '0':
+        return {
+            'success': True,
+            'CheckoutRequestID': result.get('CheckoutRequestID'),
+            'CustomerMessage': result.get('CustomerMessage', 'Request sent to your phone')
+        }
+    else:
+        error_msg = result.get('errorMessage', result.get('message', 'Unknown error from Daraja'))
         return {
             'success': False,
-            'error': str(e)
+            'error': error_msg,
+            'raw_response': result
         }
 
 
-def query_daraja_transaction_status(checkout_request_id):
+def query_daraja_transaction_status(checkout_request_id, account=None):
     """
-    Query the status of an STK Push transaction from Daraja
+    Query the status of an STK Push transaction from Daraja, on the
+    account it was sent from (Transaction.daraja_account)
     Returns dict with transaction status details
     """
     try:
-        token = get_daraja_token()
+        account = get_daraja_account(account)
+        token = get_daraja_token(account)
         
         timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-        password = base64.b64encode(
-            f"{DARAJA_SHORTCODE}{DARAJA_PASSKEY}{timestamp}".encode()
-        ).decode()
 
         payload = {
-            "BusinessShortCode": DARAJA_SHORTCODE,
-            "Password": password,
+            "BusinessShortCode": account.shortcode,
+            "Password": account.password(timestamp),
             "Timestamp": timestamp,
             "CheckoutRequestID": checkout_request_id
         }
@@ -161,6 +442,7 @@ def query_daraja_transaction_status(checkout_request_id):
         }
 
         url = 'https://api.safaricom.co.ke/mpesa/stkpushquery/v1/query'.strip()
+        account.buckets['stkquery'].acquire()
         response = requests.post(url, json=payload, headers=headers, timeout=30)
         
         result = response.json()
@@ -178,18 +460,20 @@ def query_daraja_transaction_status(checkout_request_id):
         }
 
 
-def register_daraja_urls(validation_url, confirmation_url):
+def register_daraja_urls(validation_url, confirmation_url, account=None):
     """
     Register callback URLs with Safaricom for C2B transactions
+    (for one account's shortcode; default: the first account)
     """
     try:
-        token = get_daraja_token()
+        account = get_daraja_account(account)
+        token = get_daraja_token(account)
         
         payload = {
             "ValidationURL": validation_url.rstrip('/'),
             "ConfirmationURL": confirmation_url.rstrip('/'),
             "ResponseType": "Completed",
-            "BusinessShortCode": DARAJA_SHORTCODE
+            "BusinessShortCode": account.shortcode
         }
 
         headers = {
@@ -198,6 +482,7 @@ def register_daraja_urls(validation_url, confirmation_url):
         }
 
         url = 'https://api.safaricom.co.ke/mpesa/c2b/v1/registerurl'.strip()
+        account.buckets['registerurl'].acquire()
         response = requests.post(url, json=payload, headers=headers, timeout=30)
         
         result = response.json()
@@ -250,6 +535,12 @@ def initialize_paystack_transaction(email, amount, reference, metadata=None):
         }
         
         response = requests.post(url, json=data, headers=headers, timeout=30)
+        if response.status_code == 429:
+            return {
+                'success': False,
+                'error': 'Paystack rate limit exceeded',
+                'retryable': True
+            }
         result = response.json()
 
         if response.status_code == 200 and result.get('status'):
@@ -269,7 +560,8 @@ def initialize_paystack_transaction(email, amount, reference, metadata=None):
     except requests.exceptions.RequestException as e:
         return {
             'success': False,
-            'error': f'Network error: {str(e)}'
+            'error': f'Network error: {str(e)}',
+            'retryable': never_connected(e)
         }
     except Exception as e:
         return {
@@ -1,3 +1,4 @@
+import io
 import logging
 import json
 import hmac
@@ -5,29 +6,43 @@ import hashlib
 from decimal import Decimal
 from uuid import uuid4
 from django.conf import settings
+from django.db import transaction as db_transaction
 from django.http import HttpResponse
-from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
-from .models import Transaction
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from .models import Customer, Transaction
+from .changefeed import after_position, decode_cursor, encode_cursor, fetch_changes
+from .filters import filter_transactions, paginate, parse_datetime_param
+from .serializers import (
+    serialize_customers,
+    serialize_transaction_list,
+    serialize_transaction_statuses,
+    fetch_transaction_detail,
+)
+from .payments import PAYSTACK_OUTCOMES, start_gateway_payment, verify_paystack_reference
+from .reconciliation import reconcile_statement
+from .stats import dashboard_stats, default_stats_period
+from .throttling import payment_customer_limiter, payment_initiator_limiter
 from .utils import (
-    send_stk_push,
-    initialize_paystack_transaction,
-    normalize_phone_number,
-    verify_paystack_transaction
+    callback_metadata_value,
+    normalize_customer_identifier,
+    normalize_phone_number
 )
-from django.db.models import Sum
-from datetime import datetime, timedelta
-from collections import OrderedDict
+from core.logs import log_event
+from jobs.queue import enqueue
+from datetime import datetime
+from django.db.models import F
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
 
 class DashboardStatsView(APIView):
     permission_classes = [IsAuthenticated]
+    replica_reads = True
     
     def get(self, request):
         user = request.user
@@ -43,52 +58,14 @@ class DashboardStatsView(APIView):
             except ValueError:
                 return Response({'error': 'Invalid date format. Use ISO 8601 (e.g., 2026-02-01)'}, status=400)
         else:
-            end_date = timezone.now().date()
-            start_date = end_date - timedelta(days=29)
-
-        if user.is_superuser:
-            queryset = Transaction.objects.filter(
-                status='COMPLETED',
-                created_at__date__range=[start_date, end_date]
-            )
-        else:
-            queryset = Transaction.objects.filter(
-                initiated_by=user,
-                status='COMPLETED',
-                created_at__date__range=[start_date, end_date]
-            )
-
-        total = queryset.aggregate(total=Sum('amount'))['total'] or 0
-
-        daily_data = (
-            queryset
-            .extra(select={'date': "DATE(created_at)"})
-            .values('date')
-            .annotate(amount=Sum('amount'))
-            .order_by('date')
-        )
+            start_date, end_date = default_stats_period()
 
-        date_cursor = start_date
-        trend = OrderedDict()
-        while date_cursor <= end_date:
-            trend[date_cursor.isoformat()] = "0.00"
-            date_cursor += timedelta(days=1)
-
-        for entry in daily_data:
-            date_key = entry['date'].isoformat()
-            if date_key in trend:
-                trend[date_key] = str(entry['amount'])
-
-        return Response({
-            'total_collected': str(total),
-            'period_start': start_date.isoformat(),
-            'period_end': end_date.isoformat(),
-            'trend': list(trend.items())
-        })
+        return Response(dashboard_stats(user, start_date, end_date))
 
 
 class TransactionListView(APIView):
     permission_classes = [IsAuthenticated]
+    replica_reads = True
     
     def get(self, request):
         user = request.user
@@ -96,50 +73,198 @@ class TransactionListView(APIView):
             transactions = Transaction.objects.all().order_by('-created_at')
         else:
             transactions = Transaction.objects.filter(initiated_by=user).order_by('-created_at')
-        
-        data = []
-        for t in transactions:
-            data.append({
-                'id': t.id,
-                'amount': str(t.amount),
-                'payment_method': t.get_payment_method_display(),
-                'status': t.get_status_display(),
-                'initiated_by': t.initiated_by.first_name or t.initiated_by.username,
-                'created_at': t.created_at.isoformat(),
-                'customer_identifier': t.customer_identifier,
-                'mpesa_checkout_request_id': t.mpesa_checkout_request_id,
-                'paystack_reference': t.paystack_reference,
-            })
-        return Response(data)
+
+        try:
+            transactions = filter_transactions(transactions, request.query_params)
+            transactions = paginate(transactions, request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(serialize_transaction_list(transactions))
 
 
 class TransactionDetailView(APIView):
     permission_classes = [IsAuthenticated]
+    replica_reads = True
     
     def get(self, request, pk):
-        try:
-            transaction = Transaction.objects.get(pk=pk)
-        except Transaction.DoesNotExist:
+        result = fetch_transaction_detail(Transaction.objects.all(), pk)
+        if result is None:
             return Response({'error': 'Transaction not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        if not request.user.is_superuser and transaction.initiated_by != request.user:
+        initiated_by_id, data = result
+        if not request.user.is_superuser and initiated_by_id != request.user.id:
             return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
 
+        return Response(data)
+
+
+class TransactionStatusView(APIView):
+    """
+    Current statuses for many transactions in one query, for polling.
+
+    Either `ids` (comma-separated, at most MAX_IDS) or `pending_since` (ISO
+    datetime): every transaction created since then, in (created_at, id)
+    order, MAX_ROWS per page; while has_more is true, pass back `cursor` with
+    the same pending_since for the next page. Only the caller's own
+    transactions are returned unless they are a superuser.
+    `next_pending_since` is the oldest payment still open in the whole window
+    (now once everything has settled), and `poll_after` says how many
+    seconds to wait before polling again (null once nothing is open).
+    """
+    permission_classes = [IsAuthenticated]
+    replica_reads = True
+    MAX_IDS = 200
+    MAX_ROWS = 500
+
+    def get(self, request):
+        user = request.user
+        ids_param = request.query_params.get('ids', '').strip()
+        since_param = request.query_params.get('pending_since', '').strip()
+
+        queryset = Transaction.objects.all()
+        if not user.is_superuser:
+            queryset = queryset.filter(initiated_by=user)
+
+        try:
+            if ids_param:
+                try:
+                    ids = {int(pk) for pk in ids_param.split(',') if pk.strip()}
+                except ValueError:
+                    raise ValueError('ids must be comma-separated integers')
+                if len(ids) > self.MAX_IDS:
+                    raise ValueError(f'At most {self.MAX_IDS} ids per request')
+                queryset = queryset.filter(pk__in=ids)
+            elif since_param:
+                queryset = queryset.filter(created_at__gte=parse_datetime_param(since_param, 'pending_since'))
+                position = decode_cursor(request.query_params.get('cursor', ''))['t']
+            else:
+                raise ValueError('ids or pending_since is required')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.now()
+        if ids_param:
+            rows = serialize_transaction_statuses(queryset.order_by('created_at', 'id'))
+        else:
+            page = after_position(queryset, 'created_at', position).order_by('created_at', 'id')
+            rows = serialize_transaction_statuses(page[:self.MAX_ROWS])
+        open_rows = [row for row in rows if row['status'] in Transaction.OPEN_STATUSES]
+
+        response_data = {
+            'transactions': rows,
+            'poll_after': self.poll_after(open_rows, now),
+        }
+        if ids_param:
+            response_data['not_found'] = sorted(ids - {row['id'] for row in rows})
+        else:
+            # The window start follows the oldest open payment, which may be
+            # on an earlier page; paging moves on regardless of it
+            oldest_open = queryset.filter(
+                status__in=Transaction.OPEN_STATUSES
+            ).order_by('created_at').values_list('created_at', flat=True).first()
+            has_more = len(rows) == self.MAX_ROWS
+            if has_more:
+                last = rows[-1]
+                position = (datetime.fromisoformat(last['created_at']), last['id'])
+            response_data.update({
+                'next_pending_since': (oldest_open or now).isoformat(),
+                'cursor': encode_cursor({'t': position}) if has_more else '',
+                'has_more': has_more,
+            })
+        return Response(response_data)
+
+    def poll_after(self, open_rows, now):
+        """
+        Poll often while a payment is young (customers usually answer the
+        STK prompt within seconds) and back off as it ages.
+        """
+        if not open_rows:
+            return None
+        youngest = datetime.fromisoformat(open_rows[-1]['created_at'])
+        age = (now - youngest).total_seconds()
+        return min(settings.STATUS_POLL_MAX_SECONDS, max(settings.STATUS_POLL_MIN_SECONDS, round(age / 10)))
+
+
+class TransactionChangesView(APIView):
+    """
+    Transactions created, updated (including status transitions) or
+    deleted after `cursor`, oldest first, at most `limit` (default 100,
+    max 1000) per page. Start without a cursor for a full initial sync,
+    then pass back the returned cursor; repeat while has_more is true.
+    """
+    permission_classes = [IsAuthenticated]
+    MAX_LIMIT = 1000
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', 100)), self.MAX_LIMIT)
+            if limit <= 0:
+                raise ValueError('limit must be positive')
+            changes, cursor, has_more = fetch_changes(
+                request.user, request.query_params.get('cursor', ''), limit
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         return Response({
-            'id': transaction.id,
-            'amount': str(transaction.amount),
-            'payment_method': transaction.payment_method,
-            'status': transaction.status,
-            'initiated_by': transaction.initiated_by.first_name or transaction.initiated_by.username,
-            'created_at': transaction.created_at.isoformat(),
-            'updated_at': transaction.updated_at.isoformat(),
-            'customer_identifier': transaction.customer_identifier,
-            'mpesa_checkout_request_id': transaction.mpesa_checkout_request_id,
-            'paystack_reference': transaction.paystack_reference,
-            'response_data': transaction.response_data,
+            'changes': changes,
+            'cursor': cursor,
+            'has_more': has_more,
         })
 
 
+class TopCustomersView(APIView):
+    """
+    Customers ranked by lifetime total paid (default) or most recent
+    payment (?order=recent). Reads the maintained aggregates only.
+    """
+    permission_classes = [IsAdminUser]
+    replica_reads = True
+    ORDERINGS = {
+        'total': ('-total_paid', 'id'),
+        'recent': (F('last_payment_at').desc(nulls_last=True), 'id'),
+    }
+
+    def get(self, request):
+        order = request.query_params.get('order', 'total')
+        if order not in self.ORDERINGS:
+            return Response(
+                {'error': f"Invalid order. Choose from {', '.join(self.ORDERINGS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+            if limit <= 0:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'limit must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        customers = Customer.objects.order_by(*self.ORDERINGS[order])[:limit]
+        return Response(serialize_customers(customers))
+
+
+class CustomerLookupView(APIView):
+    """
+    Lifetime aggregates for one customer by phone number or email
+    (?identifier=...), matched on the normalized key.
+    """
+    permission_classes = [IsAdminUser]
+    replica_reads = True
+
+    def get(self, request):
+        identifier = request.query_params.get('identifier', '').strip()
+        if not identifier:
+            return Response({'error': 'identifier is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        customers = serialize_customers(
+            Customer.objects.filter(key=normalize_customer_identifier(identifier))
+        )
+        if not customers:
+            return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(customers[0])
+
+
 class InitiatePaymentView(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -165,13 +290,50 @@ class InitiatePaymentView(APIView):
         if payment_method not in ['STK_PUSH', 'PAYSTACK']:
             return Response({'error': 'Invalid payment_method'}, status=status.HTTP_400_BAD_REQUEST)
 
-        transaction = Transaction.objects.create(
-            initiated_by=user,
-            amount=amount,
-            payment_method=payment_method,
-            status='PENDING',
-            customer_identifier=customer_identifier
-        )
+        # Validate the identifier before any row is written
+        reference = None
+        if payment_method == 'STK_PUSH':
+            try:
+                normalize_phone_number(customer_identifier)
+            except ValueError as ve:
+                return Response(
+                    {'error': 'Validation error', 'details': str(ve)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            if '@' not in customer_identifier.strip():
+                return Response(
+                    {'error': 'Invalid email address for Paystack'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            reference = str(uuid4())
+
+        # Velocity limits, counted before any row is written or gateway called
+        customer_key = normalize_customer_identifier(customer_identifier)
+        retry_after = payment_initiator_limiter.consume(user.pk)
+        if not retry_after:
+            retry_after = payment_customer_limiter.consume(customer_key)
+            if retry_after:
+                payment_initiator_limiter.release(user.pk)
+        if retry_after:
+            return Response(
+                {'error': 'Too many payment requests. Please try again later.'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(retry_after)}
+            )
+
+        with db_transaction.atomic():
+            transaction = Transaction.objects.create(
+                initiated_by=user,
+                amount=amount,
+                payment_method=payment_method,
+                status='PENDING',
+                customer_identifier=customer_identifier,
+                paystack_reference=reference
+            )
+            if settings.PAYMENT_INITIATION_ASYNC:
+                # Committed together with the row, so the job can never point at a missing transaction
+                enqueue('transactions.initiate_payment', {'transaction_id': transaction.id})
 
         response_data = {
             'id': transaction.id,
@@ -180,73 +342,46 @@ class InitiatePaymentView(APIView):
             'message': 'Payment initiated'
         }
 
+        if settings.PAYMENT_INITIATION_ASYNC:
+            response_data['message'] = 'Payment queued'
+            return Response(response_data, status=status.HTTP_202_ACCEPTED)
+
         try:
-            if payment_method == 'STK_PUSH':
-                phone = normalize_phone_number(customer_identifier)
-                result = send_stk_push(phone, float(amount), transaction.id)
-                if result.get('success'):
-                    transaction.mpesa_checkout_request_id = result.get('CheckoutRequestID')
-                    transaction.response_data = result
-                    transaction.save()
-                    response_data['checkout_request_id'] = result.get('CheckoutRequestID')
-                    response_data['customer_message'] = result.get('CustomerMessage')
-                else:
-                    transaction.status = 'FAILED'
-                    transaction.response_data = result
-                    transaction.save()
-                    return Response(
-                        {'error': 'Failed to initiate STK Push', 'details': result.get('error')},
-                        status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                    )
-
-            elif payment_method == 'PAYSTACK':
-                email = customer_identifier.strip()
-                if '@' not in email:
-                    transaction.delete()
-                    return Response(
-                        {'error': 'Invalid email address for Paystack'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                reference = str(uuid4())
-                paystack_result = initialize_paystack_transaction(
-                    email=email,
-                    amount=amount,
-                    reference=reference
-                )
-                if paystack_result.get('success'):
-                    transaction.paystack_reference = reference
-                    transaction.response_data = paystack_result
-                    transaction.save()
-                    response_data['paystack_reference'] = reference
-                    response_data['checkout_url'] = paystack_result['authorization_url']
-                else:
-                    transaction.status = 'FAILED'
-                    transaction.response_data = paystack_result
-                    transaction.save()
-                    return Response(
-                        {'error': 'Failed to initialize Paystack', 'details': paystack_result.get('error')},
-                        status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                    )
-
-            return Response(response_data, status=status.HTTP_201_CREATED)
-
-        except ValueError as ve:
-            transaction.delete()
-            return Response(
-                {'error': 'Validation error', 'details': str(ve)},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            result = start_gateway_payment(transaction)
         except Exception as e:
-            transaction.delete()
-            logger.error(f"Unexpected error during payment initiation: {e}")
+            logger.error("Unexpected error during payment initiation: %s", e)
+            transaction.transition_to('FAILED', response_data={'success': False, 'error': str(e)})
             return Response(
                 {'error': 'Internal server error'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        if payment_method == 'STK_PUSH':
+            if not result.get('success'):
+                return Response(
+                    {'error': 'Failed to initiate STK Push', 'details': result.get('error')},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            response_data['checkout_request_id'] = result.get('CheckoutRequestID')
+            response_data['customer_message'] = result.get('CustomerMessage')
+        else:
+            if not result.get('success'):
+                return Response(
+                    {'error': 'Failed to initialize Paystack', 'details': result.get('error')},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            response_data['paystack_reference'] = reference
+            response_data['checkout_url'] = result['authorization_url']
+
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
 
 class VerifyPaystackTransactionView(APIView):
+    """
+    Final transactions are answered from the database. Otherwise Paystack
+    is asked (coalesced and briefly cached, see verify_paystack_reference)
+    and the row only changes when Paystack reports a final outcome.
+    """
     permission_classes = [IsAuthenticated]
     
     def get(self, request, reference):
@@ -255,51 +390,89 @@ class VerifyPaystackTransactionView(APIView):
         except Transaction.DoesNotExist:
             return Response({'error': 'Transaction not found'}, status=404)
 
-        if not request.user.is_superuser and transaction.initiated_by != request.user:
+        if not request.user.is_superuser and transaction.initiated_by_id != request.user.id:
             return Response({'error': 'Permission denied'}, status=403)
 
-        verification_result = verify_paystack_transaction(reference)
+        if transaction.is_final:
+            # Settled for good: the stored gateway response (verify result or webhook event) answers it
+            return Response(self.verification_response(transaction, (transaction.response_data or {}).get('data') or {}))
+
+        verification_result = verify_paystack_reference(reference)
         
         if verification_result.get('success'):
             paystack_data = verification_result['data'].get('data', {})
-            status_val = paystack_data.get('status')
-            amount_paid = Decimal(paystack_data.get('amount', 0)) / 100
-            
-            transaction.status = 'COMPLETED' if status_val == 'success' else 'FAILED'
-            transaction.response_data = verification_result['data']
-            transaction.save()
+            new_status = PAYSTACK_OUTCOMES.get(paystack_data.get('status'))
+            if new_status and new_status != transaction.status:
+                if not transaction.transition_to(new_status, response_data=verification_result['data']):
+                    # Already settled (or changed by a concurrent webhook): report the stored status
+                    transaction.refresh_from_db(fields=['status', 'version'])
             
-            return Response({
-                'id': transaction.id,
-                'status': transaction.status,
-                'amount': str(transaction.amount),
-                'amount_paid': str(amount_paid),
-                'paystack_status': status_val,
-                'verified': True
-            })
+            return Response(self.verification_response(transaction, paystack_data))
         else:
             return Response({
                 'error': 'Failed to verify with Paystack',
                 'details': verification_result.get('error')
             }, status=400)
 
+    def verification_response(self, transaction, paystack_data):
+        return {
+            'id': transaction.id,
+            'status': transaction.status,
+            'amount': str(transaction.amount),
+            'amount_paid': str(Decimal(paystack_data.get('amount') or 0) / 100),
+            'paystack_status': paystack_data.get('status'),
+            'verified': True
+        }
+
+
+class ReconcileStatementView(APIView):
+    """
+    Upload a settlement statement CSV (multipart field `file`) with
+    `provider` (mpesa or paystack) and optional `apply`, `start`, `end`.
+    The file is streamed; at most 1000 discrepancies are listed.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        apply = str(request.data.get('apply', '')).lower() in ('1', 'true', 'yes')
+        statement = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            report = reconcile_statement(
+                statement,
+                request.data.get('provider', ''),
+                apply=apply,
+                start=request.data.get('start'),
+                end=request.data.get('end'),
+                detail_limit=1000,
+            )
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            statement.detach()
+
+        return Response(report.as_dict())
+
 
 @csrf_exempt
 def daraja_webhook(request):
     if request.method == 'GET':
-        logger.info("Daraja webhook health check (GET)")
+        log_event(logger, logging.INFO, 'daraja_webhook.health_check')
         return HttpResponse("OK", status=200)
     if request.method != 'POST':
-        logger.warning(f"Daraja webhook received {request.method} method")
+        log_event(logger, logging.WARNING, 'daraja_webhook.method_not_allowed', method=request.method)
         return HttpResponse("Method not allowed", status=405)
     
-    logger.info("Received Daraja webhook")
+    log_event(logger, logging.INFO, 'daraja_webhook.received', size=len(request.body))
     
     try:
         payload = json.loads(request.body)
-        logger.debug(f"Daraja webhook payload: {payload}")
+        log_event(logger, logging.DEBUG, 'daraja_webhook.payload', payload=payload)
     except (json.JSONDecodeError, UnicodeDecodeError) as e:
-        logger.warning(f"Invalid JSON in Daraja webhook: {e}")
+        log_event(logger, logging.WARNING, 'daraja_webhook.invalid_json', error=e)
         return HttpResponse("OK", status=200)
 
     body = payload.get('Body', {})
@@ -309,28 +482,38 @@ def daraja_webhook(request):
     result_desc = stk_callback.get('ResultDesc', '')
 
     if not checkout_request_id:
-        logger.warning("Missing CheckoutRequestID in Daraja webhook")
-        return HttpResponse("OK", status=200)
-
-    try:
-        transaction = Transaction.objects.get(mpesa_checkout_request_id=checkout_request_id)
-    except Transaction.DoesNotExist:
-        logger.warning(f"Transaction not found for CheckoutRequestID: {checkout_request_id}")
+        log_event(logger, logging.WARNING, 'daraja_webhook.missing_checkout_request_id')
         return HttpResponse("OK", status=200)
 
     if result_code == 0:
-        transaction.status = 'COMPLETED'
+        new_status = 'COMPLETED'
     elif result_code == 1032:
-        transaction.status = 'CANCELLED'
+        new_status = 'CANCELLED'
     elif result_code == 1037:
-        transaction.status = 'TIMEOUT'
+        new_status = 'TIMEOUT'
     else:
-        transaction.status = 'FAILED'
-
-    transaction.response_data = payload
-    transaction.save()
-    
-    logger.info(f"Daraja webhook processed: {transaction.id} -> {transaction.status} (Code: {result_code})")
+        new_status = 'FAILED'
+
+    changes = {'response_data': payload}
+    receipt_number = callback_metadata_value(stk_callback, 'MpesaReceiptNumber')
+    if receipt_number:
+        changes['mpesa_receipt_number'] = str(receipt_number)
+
+    # Compare-and-set: a late or duplicate callback cannot overwrite a settled status
+    updated = Transaction.objects.filter(
+        mpesa_checkout_request_id=checkout_request_id
+    ).transition(new_status, **changes)
+
+    if updated:
+        log_event(
+            logger, logging.INFO, 'daraja_webhook.processed',
+            checkout_request_id=checkout_request_id, status=new_status, result_code=result_code,
+        )
+    else:
+        log_event(
+            logger, logging.WARNING, 'daraja_webhook.ignored',
+            checkout_request_id=checkout_request_id, status=new_status, result_code=result_code,
+        )
     
     return HttpResponse("OK", status=200)
 
@@ -338,22 +521,22 @@ def daraja_webhook(request):
 @csrf_exempt
 def paystack_webhook(request):
     if request.method == 'GET':
-        logger.info("Paystack webhook health check (GET)")
+        log_event(logger, logging.INFO, 'paystack_webhook.health_check')
         return HttpResponse(status=200)
     if request.method != 'POST':
-        logger.warning(f"Paystack webhook received {request.method} method")
+        log_event(logger, logging.WARNING, 'paystack_webhook.method_not_allowed', method=request.method)
         return HttpResponse(status=405)
     
-    logger.info("Received Paystack webhook")
+    log_event(logger, logging.INFO, 'paystack_webhook.received', size=len(request.body))
     
     secret = getattr(settings, 'PAYSTACK_WEBHOOK_SECRET', None)
     if not secret:
-        logger.error("PAYSTACK_WEBHOOK_SECRET not set in settings")
+        log_event(logger, logging.ERROR, 'paystack_webhook.secret_not_configured')
         return HttpResponse(status=200)
 
     signature = request.headers.get('x-paystack-signature')
     if not signature:
-        logger.warning("Missing Paystack signature")
+        log_event(logger, logging.WARNING, 'paystack_webhook.missing_signature')
         return HttpResponse(status=200)
 
     computed_signature = hmac.new(
@@ -363,20 +546,20 @@ def paystack_webhook(request):
     ).hexdigest()
 
     if not hmac.compare_digest(signature, computed_signature):
-        logger.warning("Invalid Paystack signature - possible tampering")
+        log_event(logger, logging.WARNING, 'paystack_webhook.invalid_signature')
         return HttpResponse(status=200)
 
     try:
         event = json.loads(request.body)
-        logger.debug(f"Paystack webhook event: {event}")
+        log_event(logger, logging.DEBUG, 'paystack_webhook.payload', payload=event)
     except (json.JSONDecodeError, UnicodeDecodeError) as e:
-        logger.warning(f"Invalid JSON in Paystack webhook: {e}")
+        log_event(logger, logging.WARNING, 'paystack_webhook.invalid_json', error=e)
         return HttpResponse(status=200)
 
     event_type = event.get('event')
     
     if event_type not in ['charge.success', 'charge.failed']:
-        logger.info(f"Ignored non-relevant Paystack event: {event_type}")
+        log_event(logger, logging.INFO, 'paystack_webhook.ignored_event', event_type=event_type)
         return HttpResponse(status=200)
 
     data = event.get('data', {})
@@ -385,26 +568,28 @@ def paystack_webhook(request):
     status_val = data.get('status')
 
     if not reference:
-        logger.warning("Missing reference in Paystack webhook")
-        return HttpResponse(status=200)
-
-    try:
-        transaction = Transaction.objects.get(paystack_reference=reference)
-    except Transaction.DoesNotExist:
-        logger.warning(f"Paystack transaction not found: {reference}")
+        log_event(logger, logging.WARNING, 'paystack_webhook.missing_reference')
         return HttpResponse(status=200)
 
     if event_type == 'charge.success' and status_val == 'success':
-        transaction.status = 'COMPLETED'
-        logger.info(f"Paystack payment successful: {transaction.id}")
-            
+        new_status = 'COMPLETED'
     elif event_type == 'charge.failed':
-        transaction.status = 'FAILED'
-        logger.info(f"Paystack payment failed: {transaction.id}")
-    
-    transaction.response_data = event
-    transaction.save()
-    
-    logger.info(f"Paystack webhook processed: {transaction.id} -> {transaction.status}")
+        new_status = 'FAILED'
+    else:
+        log_event(
+            logger, logging.INFO, 'paystack_webhook.ignored_status',
+            event_type=event_type, charge_status=status_val, reference=reference,
+        )
+        return HttpResponse(status=200)
+
+    # Compare-and-set: a late charge.failed cannot overwrite COMPLETED
+    updated = Transaction.objects.filter(
+        paystack_reference=reference
+    ).transition(new_status, response_data=event)
+
+    if updated:
+        log_event(logger, logging.INFO, 'paystack_webhook.processed', reference=reference, status=new_status)
+    else:
+        log_event(logger, logging.WARNING, 'paystack_webhook.ignored', reference=reference, status=new_status)
     
     return HttpResponse(status=200)
\ No newline at end of file